@@ -6,10 +6,15 @@ import os
 
 import uvicorn
 
-from app.main import app
+from app.config import config
 
 
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", "3000"))
-    host = os.getenv("HOST", "0.0.0.0")
-    uvicorn.run("app.main:app", host=host, port=port)
+    if config.BOT_MODE == "polling":
+        from app.polling import main as run_polling
+
+        run_polling()
+    else:
+        port = int(os.getenv("PORT", "3000"))
+        host = os.getenv("HOST", "0.0.0.0")
+        uvicorn.run("app.main:app", host=host, port=port)
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Any
+import os
+import tempfile
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, AsyncIterator, Coroutine
 
-import asyncpg
 import httpx
-from aiogram import Dispatcher, F, Router
-from aiogram.filters import CommandStart
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.enums import ChatAction
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
-from cachetools import TTLCache
 from aiogram.types import (
     CallbackQuery,
+    Document,
+    FSInputFile,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     KeyboardButton,
@@ -19,20 +25,58 @@ from aiogram.types import (
     ReplyKeyboardMarkup,
 )
 
+from app.cache import PartyCache, party_cache
 from app.config import config
-from app.dadata_client import find_by_id_party, find_party_universal, normalize_query_input, validate_inn, validate_ogrn
-from app.db import log_request
+from app.dadata_client import (
+    cached_party,
+    extract_identifiers,
+    find_by_id_party,
+    find_party_universal,
+    lookup_parties,
+    network_calls,
+    normalize_query_input,
+    typo_candidates,
+    validate_inn,
+    validate_ogrn,
+)
+from app.dadata_keys import NoAvailableKeyError, key_pool
+from app.db import (
+    EXPORT_COLUMNS,
+    create_job,
+    fetch_daily_rollups,
+    fetch_job,
+    iter_job_items,
+    iter_requests,
+    log_request,
+)
+from app.egrul import SNAPSHOT_SOURCE, get_snapshot
+from app.export import EXPORT_FORMATS, export_chunks
 from app.formatters import (
+    format_affiliates,
+    format_batch_summary,
     format_card,
     format_contacts,
     format_courts,
+    format_daily_report,
     format_debts,
     format_founders,
+    format_job_status,
     format_penalties,
     format_requisites,
+    format_stats,
     format_turnover,
+    number_label,
 )
+from app.graph import explore_affiliates
+from app.jobs import JOB_RESULT_COLUMNS, flatten_job_item
+from app.loop_monitor import SlowHandlerMiddleware, timed
+from app.metrics import metrics
+from app.name_index import name_index
 from app.rate_limit import check_rate_limit
+from app.send_scheduler import telegram_calls
+
+if TYPE_CHECKING:
+    import asyncpg
 
 logger = logging.getLogger(__name__)
 
@@ -42,18 +86,28 @@ MAIN_KEYBOARD = ReplyKeyboardMarkup(
     resize_keyboard=True,
 )
 
-CACHE_TTL_SEC = 600
-_context_cache: TTLCache = TTLCache(maxsize=1000, ttl=CACHE_TTL_SEC)
+_context_cache: PartyCache = party_cache
+
+# Buttons offered for a mistyped INN/OGRN; known parties come first.
+_MAX_TYPO_BUTTONS = 4
+
+# Sections that need fields an EGRUL snapshot record does not carry.
+_DADATA_ONLY_SECTIONS = {"courts", "turnover", "debts", "penalties", "contacts", "founders", "links"}
 
 router = Router()
+_background_tasks: set[asyncio.Task[None]] = set()
+# Unfinished lookup of each (chat, user); a newer query from the same user cancels it.
+_chat_lookups: dict[tuple[int, int], asyncio.Task[None]] = {}
 
 
-def _cache_set(key: str, value: dict[str, Any]) -> None:
-    _context_cache[key] = value
+def _cache_set(context_key: str, suggestion: dict[str, Any]) -> None:
+    _context_cache.put_context(context_key, suggestion)
 
 
-def _cache_get(key: str) -> dict[str, Any] | None:
-    return _context_cache.get(key)
+def _cache_get(context_key: str) -> dict[str, Any] | None:
+    value = _context_cache.get_context(context_key)
+    metrics.cache_lookup("context", hit=value is not None)
+    return value
 
 
 def _build_context_key(data: dict[str, Any]) -> str:
@@ -75,6 +129,7 @@ def _base_inline(context_key: str) -> InlineKeyboardMarkup:
                 InlineKeyboardButton(text="📄 Реквизиты", callback_data=f"requisites:{context_key}"),
                 InlineKeyboardButton(text="📞 Контакты", callback_data=f"contacts:{context_key}"),
                 InlineKeyboardButton(text="👥 Учредители", callback_data=f"founders:{context_key}"),
+                InlineKeyboardButton(text="🔗 Связи", callback_data=f"links:{context_key}"),
             ],
             [
                 InlineKeyboardButton(text="⬅️ Карточка", callback_data=f"card:{context_key}"),
@@ -98,66 +153,316 @@ def _safe_requisites_code_block(text: str) -> str:
     return text.replace("```", "'''")
 
 
-async def _lookup_and_reply(message: Message, query_text: str) -> None:
+def _track_background(coro: Coroutine[Any, Any, None]) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def drain_background_tasks(timeout: float) -> bool:
+    """Wait for pending request-log writes before the pool closes; False if some were cancelled."""
+    if not _background_tasks:
+        return True
+    _, pending = await asyncio.wait(set(_background_tasks), timeout=timeout)
+    if not pending:
+        return True
+    logger.warning("shutdown: %d request log writes did not finish in time", len(pending))
+    for task in pending:
+        task.cancel()
+    await asyncio.wait(pending)
+    return False
+
+
+async def _log_request_safe(**fields: Any) -> None:
+    if db_pool is None:
+        return
+    try:
+        await log_request(db_pool, **fields)
+    except Exception as exc:
+        logger.warning("failed to log request to postgres: %s", exc)
+
+
+def _is_known_party(key: str) -> bool:
+    """Whether the cache, the name index or the EGRUL snapshot already knows this INN/OGRN."""
+    if key in name_index or _context_cache.get_context(key) is not None:
+        return True
+    snapshot = get_snapshot(config.EGRUL_SNAPSHOT_DIR)
+    return snapshot is not None and snapshot.lookup(key) is not None
+
+
+def _typo_inline(digits: str) -> InlineKeyboardMarkup | None:
+    known: list[str] = []
+    unknown: list[str] = []
+    for candidate in typo_candidates(digits):
+        (known if _is_known_party(candidate) else unknown).append(candidate)
+    options = (known + unknown)[:_MAX_TYPO_BUTTONS]
+    if not options:
+        return None
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=f"{'✅' if option in known else '🔢'} {option}", callback_data=f"check:{option}")]
+            for option in options
+        ]
+    )
+
+
+async def _reply_invalid_number(message: Message, digits: str) -> None:
+    markup = _typo_inline(digits)
+    text = f"{number_label(digits)} {digits} не проходит проверку контрольной суммы — похоже на опечатку."
+    if markup is not None:
+        text += "\nВозможно, вы имели в виду (✅ — уже проверяли):"
+    await message.answer(text, reply_markup=markup)
+
+
+async def _lookup_and_reply(message: Message, query_text: str, user_id: int | None = None) -> None:
     if not config.DADATA_API_KEY:
         await message.answer("Ошибка: DADATA_API_KEY не настроен.")
         return
+    if user_id is None and message.from_user is not None:
+        user_id = message.from_user.id
 
-    query, query_kind = normalize_query_input(query_text)
+    identifiers = extract_identifiers(query_text, limit=config.BATCH_MAX_IDS)
+    if len(identifiers) > 1:
+        await _lookup_many_and_reply(message, identifiers, user_id)
+        return
+    if identifiers:
+        query, query_kind = identifiers[0]
+    else:
+        query, query_kind = normalize_query_input(query_text)
     if not query:
         await message.answer("Пришлите ИНН, ОГРН или название компании.")
         return
+    if query_kind == "invalid":
+        await _reply_invalid_number(message, query)
+        return
+
+    metrics.requests.add()
+    calls_token = network_calls.set(0)
+    telegram_token = telegram_calls.set(0)
+    resolved_inn: str | None = query if query_kind == "inn" else None
+    try:
+        resolved_inn = await _fetch_and_reply(message, query, query_kind, query_text) or resolved_inn
+    finally:
+        cache_hit = network_calls.get() == 0
+        network_calls.reset(calls_token)
+        if telegram_calls.get():
+            metrics.lookup_telegram_calls(telegram_calls.get())
+        telegram_calls.reset(telegram_token)
+        if resolved_inn:
+            metrics.top_inns.add(resolved_inn)
+        if db_pool is not None:
+            _track_background(
+                _log_request_safe(
+                    query=query,
+                    query_kind=query_kind,
+                    inn=resolved_inn,
+                    user_id=user_id,
+                    cache_hit=cache_hit,
+                )
+            )
+
+
+async def _lookup_latest(message: Message, query_text: str, user_id: int | None = None) -> None:
+    """`_lookup_and_reply`, superseding the same user's lookup still running in this chat.
+
+    The superseded lookup is cancelled at its next await; its DaData request keeps going
+    only if another lookup is waiting for the same answer.
+    """
+    if user_id is None and message.from_user is not None:
+        user_id = message.from_user.id
+    key = (message.chat.id, user_id or 0)
+    previous = _chat_lookups.get(key)
+    if previous is not None and not previous.done():
+        previous.cancel()
+        metrics.lookups_superseded += 1
+    # The lookup runs in its own task; `timed` keeps SlowHandlerMiddleware measuring it.
+    task = asyncio.create_task(timed(_lookup_and_reply(message, query_text, user_id)))
+    _chat_lookups[key] = task
+    try:
+        await task
+    except asyncio.CancelledError:
+        current = asyncio.current_task()
+        if current is not None and current.cancelling():
+            raise
+        # Superseded by a newer query: the update itself is handled.
+    finally:
+        if _chat_lookups.get(key) is task:
+            del _chat_lookups[key]
+
+
+async def _reply_or_edit(message: Message, waiting_msg: Message | None, text: str, **kwargs: Any) -> None:
+    if waiting_msg is not None:
+        await waiting_msg.edit_text(text, **kwargs)
+    else:
+        await message.answer(text, **kwargs)
+
+
+async def _show_card(message: Message, suggestion: dict[str, Any], waiting_msg: Message | None = None) -> str | None:
+    """Cache the party, send (or edit the placeholder into) its card and return its INN."""
+    party = suggestion.get("data", {})
+    context_key = _build_context_key(party)
+    if not context_key:
+        await _reply_or_edit(message, waiting_msg, "Не удалось выделить ИНН/ОГРН из ответа DaData.")
+        return None
+
+    _cache_set(context_key, suggestion)
+    await _reply_or_edit(
+        message,
+        waiting_msg,
+        format_card(suggestion),
+        reply_markup=_base_inline(context_key),
+        parse_mode="Markdown",
+    )
+    return (party.get("inn") or "").strip() or None
+
+
+def _cached_suggestion(query: str, query_kind: str) -> dict[str, Any] | None:
+    """The party for this query if it is already in memory (no DaData call needed)."""
+    if query_kind == "name":
+        match = name_index.best_match(query, min_score=config.NAME_INDEX_MIN_SCORE)
+        if match is None:
+            return None
+        query = match.key
+    suggestion = _context_cache.get_context(query) or cached_party(query)
+    metrics.cache_lookup("reply", hit=suggestion is not None)
+    return suggestion
+
+
+def _expect_fast_reply(query_kind: str) -> bool:
+    """Whether DaData usually answers this lookup quickly enough to skip the placeholder."""
+    median = metrics.dadata_latency.quantile(0.5)
+    if median is None:
+        return False
+    calls = 1 if query_kind in {"inn", "ogrn"} else 2  # suggest + findById
+    return median * calls <= config.CHAT_ACTION_MAX_LATENCY
+
+
+async def _send_typing(message: Message) -> None:
+    if message.bot is None:
+        return
+    try:
+        await message.bot.send_chat_action(chat_id=message.chat.id, action=ChatAction.TYPING)
+    except Exception as exc:
+        logger.debug("sendChatAction failed: %s", exc)
+
+
+def _snapshot_suggestion(query: str) -> dict[str, Any] | None:
+    snapshot = get_snapshot(config.EGRUL_SNAPSHOT_DIR)
+    if snapshot is None:
+        return None
+    suggestion = snapshot.suggestion(query)
+    metrics.cache_lookup("egrul", hit=suggestion is not None)
+    return suggestion
 
-    if db_pool is not None:
-        try:
-            await log_request(db_pool, query)
-        except Exception as exc:
-            logger.warning("failed to log request to postgres: %s", exc)
 
-    waiting_msg = await message.answer("🔍 Ищу данные…")
+def _dadata_error_text(exc: Exception) -> str:
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        if code == 401:
+            return "Ошибка доступа к DaData (ключ)."
+        if code == 403:
+            return "Доступ запрещён/лимит тарифа."
+        if code == 429:
+            return "Слишком много запросов, подождите 10 секунд."
+        return "Техническая ошибка, попробуйте позже."
+    if isinstance(exc, httpx.TimeoutException):
+        return "DaData не отвечает, попробуйте позже."
+    if isinstance(exc, NoAvailableKeyError):
+        return "Доступ запрещён/лимит тарифа."
+    logger.error("unexpected dadata error: %s", exc, exc_info=exc)
+    return "Техническая ошибка, попробуйте позже."
+
+
+async def _fetch_and_reply(message: Message, query: str, query_kind: str, query_text: str) -> str | None:
+    """Resolve the party, reply with its card and return the resolved INN.
+
+    A party already in memory is answered with a single sendMessage.
+    """
+    suggestion = _cached_suggestion(query, query_kind)
+    if suggestion is None and query_kind in {"inn", "ogrn"}:
+        suggestion = _snapshot_suggestion(query)
+    if suggestion is not None:
+        return await _show_card(message, suggestion)
+
+    waiting_msg: Message | None = None
+    if _expect_fast_reply(query_kind):
+        await _send_typing(message)
+    else:
+        waiting_msg = await message.answer("🔍 Ищу данные…")
     try:
         if query_kind in {"inn", "ogrn"}:
             data = await find_by_id_party(config.DADATA_API_KEY, query, count=1)
         else:
             data = await find_party_universal(config.DADATA_API_KEY, query_text, count=1)
-    except httpx.HTTPStatusError as exc:
-        code = exc.response.status_code
-        if code == 401:
-            text = "Ошибка доступа к DaData (ключ)."
-        elif code == 403:
-            text = "Доступ запрещён/лимит тарифа."
-        elif code == 429:
-            text = "Слишком много запросов, подождите 10 секунд."
-        else:
-            text = "Техническая ошибка, попробуйте позже."
-        await waiting_msg.edit_text(text)
-        return
-    except httpx.TimeoutException:
-        await waiting_msg.edit_text("DaData не отвечает, попробуйте позже.")
-        return
+    except asyncio.CancelledError:
+        if waiting_msg is not None:
+            with suppress(Exception):
+                await waiting_msg.delete()
+        raise
     except Exception as exc:
-        logger.exception("unexpected dadata error: %s", exc)
-        await waiting_msg.edit_text("Техническая ошибка, попробуйте позже.")
-        return
+        await _reply_or_edit(message, waiting_msg, _dadata_error_text(exc))
+        return None
 
     suggestions: list[dict[str, Any]] = data.get("suggestions", [])
     if not suggestions:
-        await waiting_msg.edit_text("Ничего не нашёл. Проверьте ИНН.")
-        return
+        await _reply_or_edit(message, waiting_msg, "Ничего не нашёл. Проверьте ИНН.")
+        return None
 
-    suggestion = suggestions[0]
-    party = suggestion.get("data", {})
-    context_key = _build_context_key(party)
-    if not context_key:
-        await waiting_msg.edit_text("Не удалось выделить ИНН/ОГРН из ответа DaData.")
-        return
+    return await _show_card(message, suggestions[0], waiting_msg)
+
+
+async def _lookup_many_and_reply(
+    message: Message, identifiers: list[tuple[str, str]], user_id: int | None
+) -> None:
+    """Check several INN/OGRN at once and reply with one summary plus a button per company."""
+    metrics.requests.add(len(identifiers))
+    found: dict[str, dict[str, Any]] = {}
+    errors: dict[str, str] = {}
+    remaining = []
+    for number, _ in identifiers:
+        suggestion = _snapshot_suggestion(number)
+        if suggestion is not None:
+            found[number] = suggestion
+        else:
+            remaining.append(number)
+
+    waiting_msg = await message.answer(f"🔍 Проверяю компаний: {len(identifiers)}…") if remaining else None
+    async for number, outcome in lookup_parties(
+        config.DADATA_API_KEY, remaining, concurrency=config.LOOKUP_CONCURRENCY
+    ):
+        if isinstance(outcome, Exception):
+            errors[number] = _dadata_error_text(outcome)
+        elif outcome.get("suggestions"):
+            found[number] = outcome["suggestions"][0]
+
+    rows: list[tuple[str, dict[str, Any] | None, str | None]] = []
+    buttons: list[list[InlineKeyboardButton]] = []
+    for position, (number, query_kind) in enumerate(identifiers, start=1):
+        suggestion = found.get(number)
+        rows.append((number, suggestion, errors.get(number)))
+        context_key = _build_context_key(suggestion.get("data") or {}) if suggestion else ""
+        resolved_inn = ((suggestion or {}).get("data") or {}).get("inn") or None
+        if context_key:
+            _cache_set(context_key, suggestion)
+            label = (suggestion.get("value") or context_key)[:40]
+            buttons.append([InlineKeyboardButton(text=f"{position}. {label}", callback_data=f"show:{context_key}")])
+        if resolved_inn:
+            metrics.top_inns.add(resolved_inn)
+        if db_pool is not None:
+            _track_background(
+                _log_request_safe(query=number, query_kind=query_kind, inn=resolved_inn, user_id=user_id)
+            )
+
+    text = format_batch_summary(rows)
+    markup = InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None
+    if waiting_msg is not None:
+        await waiting_msg.edit_text(text, reply_markup=markup, parse_mode="Markdown")
+    else:
+        await message.answer(text, reply_markup=markup, parse_mode="Markdown")
 
-    _cache_set(f"party:{context_key}", suggestion)
-    await waiting_msg.edit_text(
-        format_card(suggestion),
-        reply_markup=_base_inline(context_key),
-        parse_mode="Markdown",
-    )
+
+def _is_admin(message: Message) -> bool:
+    return message.from_user is not None and message.from_user.id in config.ADMIN_IDS
 
 
 @router.message(CommandStart())
@@ -166,6 +471,135 @@ async def cmd_start(message: Message, state: FSMContext) -> None:
     await message.answer(WELCOME_TEXT, reply_markup=MAIN_KEYBOARD)
 
 
+@router.message(Command("report"))
+async def cmd_report(message: Message, command: CommandObject) -> None:
+    if not _is_admin(message):
+        await message.answer(WELCOME_TEXT, reply_markup=MAIN_KEYBOARD)
+        return
+    if db_pool is None:
+        await message.answer("PostgreSQL не настроен, отчёт недоступен.")
+        return
+
+    days = int(command.args) if command.args and command.args.strip().isdigit() else 7
+    days = min(max(days, 1), 90)
+    try:
+        rows = await fetch_daily_rollups(db_pool, days)
+    except Exception as exc:
+        logger.warning("failed to fetch daily rollups: %s", exc)
+        await message.answer("Не удалось получить отчёт, попробуйте позже.")
+        return
+    await message.answer(format_daily_report(rows), parse_mode="Markdown")
+
+
+_EXPORT_DAYS = 30
+
+
+def _parse_export_args(args: str | None) -> tuple[str, int, str | None]:
+    """`/export [csv|ndjson] [дней] [ИНН]` in any order."""
+    fmt, days, inn = "csv", _EXPORT_DAYS, None
+    for token in (args or "").split():
+        lowered = token.lower()
+        if lowered in EXPORT_FORMATS:
+            fmt = lowered
+        elif token.isdigit() and len(token) in (10, 12):
+            inn = token
+        elif token.isdigit():
+            days = min(max(int(token), 1), 3650)
+    return fmt, days, inn
+
+
+def _upload_limit() -> int:
+    # Bot API accepts uploads up to 50 MB; a local Bot API server raises that to 2000 MB.
+    return (2000 if config.TG_API_LOCAL else 50) * 1024 * 1024
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject) -> None:
+    if not _is_admin(message):
+        await message.answer(WELCOME_TEXT, reply_markup=MAIN_KEYBOARD)
+        return
+    if db_pool is None:
+        await message.answer("PostgreSQL не настроен, выгрузка недоступна.")
+        return
+
+    fmt, days, inn = _parse_export_args(command.args)
+    rows = iter_requests(db_pool, since=datetime.now(timezone.utc) - timedelta(days=days), inn=inn)
+    filename = f"check_requests_{inn + '_' if inn else ''}{days}d.{fmt}"
+    try:
+        sent = await _send_document(message, export_chunks(rows, EXPORT_COLUMNS, fmt), filename)
+    except Exception as exc:
+        logger.warning("failed to export request history: %s", exc)
+        await message.answer("Не удалось выгрузить историю, попробуйте позже.")
+        return
+    if not sent:
+        await message.answer("Выгрузка больше лимита Telegram — используйте HTTP-выгрузку /admin/export.")
+
+
+async def _send_document(message: Message, chunks: AsyncIterator[str], filename: str) -> bool:
+    """Spool `chunks` to a temporary file and send it; False if it exceeds the upload limit."""
+    path: str | None = None
+    try:
+        # Written chunk by chunk, so memory does not grow with the file size.
+        suffix = os.path.splitext(filename)[1]
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=suffix, delete=False) as fh:
+            path = fh.name
+            async for chunk in chunks:
+                fh.write(chunk)
+        if os.path.getsize(path) > _upload_limit():
+            return False
+        await message.answer_document(FSInputFile(path, filename=filename))
+        return True
+    finally:
+        if path is not None:
+            with suppress(OSError):
+                os.unlink(path)
+
+
+@router.message(Command("job"))
+async def cmd_job(message: Message, command: CommandObject) -> None:
+    args = (command.args or "").strip().lstrip("#")
+    if not args.isdigit():
+        await message.answer("Укажите номер задания: /job 123")
+        return
+    if db_pool is None:
+        await message.answer("PostgreSQL не настроен, задания недоступны.")
+        return
+
+    job_id = int(args)
+    job = await fetch_job(db_pool, job_id)
+    user_id = message.from_user.id if message.from_user else None
+    if job is None or (job["user_id"] != user_id and not _is_admin(message)):
+        await message.answer("Задание не найдено.")
+        return
+    await message.answer(format_job_status(job))
+    if job["status"] != "done":
+        return
+
+    rows = (flatten_job_item(record) async for record in iter_job_items(db_pool, job_id))
+    try:
+        sent = await _send_document(message, export_chunks(rows, JOB_RESULT_COLUMNS, "csv"), f"job_{job_id}.csv")
+    except Exception as exc:
+        logger.warning("failed to send results of job %s: %s", job_id, exc)
+        await message.answer("Не удалось выгрузить результат, попробуйте позже.")
+        return
+    if not sent:
+        await message.answer("Результат больше лимита Telegram — получите его через HTTP API.")
+
+
+async def notify_job_finished(bot: Bot, job: Any) -> None:
+    if job["chat_id"] is not None:
+        await bot.send_message(job["chat_id"], f"{format_job_status(job)}\nРезультат: /job {job['id']}")
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message) -> None:
+    if not _is_admin(message):
+        await message.answer(WELCOME_TEXT, reply_markup=MAIN_KEYBOARD)
+        return
+    snapshot = {**metrics.snapshot(), "dadata_keys": key_pool.as_dict()}
+    await message.answer(format_stats(snapshot), parse_mode="Markdown")
+
+
 @router.message(F.text)
 async def process_query(message: Message, state: FSMContext) -> None:
     await state.clear()
@@ -176,9 +610,94 @@ async def process_query(message: Message, state: FSMContext) -> None:
 
     user_id = message.from_user.id if message.from_user else 0
     if not await check_rate_limit(user_id):
+        metrics.rate_limited.add()
+        await message.answer("Слишком много запросов, подождите немного.")
+        return
+    await _lookup_latest(message, query)
+
+
+def _download_limit() -> int:
+    # Bot API lets bots download files up to 20 MB; a local Bot API server lifts that limit,
+    # and 2000 MB, its upload limit, keeps the same bound on what can reach the bot.
+    return (2000 if config.TG_API_LOCAL else 20) * 1024 * 1024
+
+
+def _is_text_document(document: Document) -> bool:
+    name = (document.file_name or "").lower()
+    return (document.mime_type or "").startswith("text/") or name.endswith((".txt", ".csv"))
+
+
+def _decode_document(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # Excel on Windows saves CSV in cp1251.
+        return raw.decode("cp1251", errors="replace")
+
+
+@router.message(F.document.func(_is_text_document))
+async def process_document(message: Message) -> None:
+    """A .txt/.csv list of INN/OGRN: short lists are checked at once, long ones become a job."""
+    document = message.document
+    limit = _download_limit()
+    if document.file_size and document.file_size > limit:
+        await message.answer(f"Файл слишком большой: бот может скачать не больше {limit // (1024 * 1024)} МБ.")
+        return
+
+    user_id = message.from_user.id if message.from_user else 0
+    if not await check_rate_limit(user_id):
+        metrics.rate_limited.add()
+        await message.answer("Слишком много запросов, подождите немного.")
+        return
+
+    try:
+        buffer = await message.bot.download(document)
+    except Exception as exc:
+        logger.warning("failed to download document %s: %s", document.file_name, exc)
+        await message.answer("Не удалось скачать файл из Telegram, попробуйте отправить его ещё раз.")
+        return
+    identifiers = extract_identifiers(_decode_document(buffer.read()), limit=config.JOB_MAX_IDS)
+    if not identifiers:
+        await message.answer("В файле не найдено ни одного ИНН или ОГРН.")
+        return
+    if len(identifiers) == 1:
+        await _lookup_latest(message, identifiers[0][0], user_id=user_id)
+        return
+    if len(identifiers) <= config.BATCH_MAX_IDS:
+        await _lookup_many_and_reply(message, identifiers, user_id)
+        return
+    if db_pool is None:
+        await message.answer(
+            f"Проверка больше {config.BATCH_MAX_IDS} номеров выполняется заданием, а PostgreSQL не настроен."
+        )
+        return
+
+    job_id = await create_job(
+        db_pool, [number for number, _ in identifiers], user_id=user_id, chat_id=message.chat.id
+    )
+    await message.answer(
+        f"📥 Задание #{job_id} принято: {len(identifiers)} номеров. "
+        f"Пришлю сообщение, когда всё будет проверено; статус — /job {job_id}"
+    )
+
+
+@router.message(F.caption)
+async def process_caption(message: Message) -> None:
+    """Forwarded documents and photos: check the INN/OGRN mentioned in the caption."""
+    identifiers = extract_identifiers(message.caption or "", limit=config.BATCH_MAX_IDS)
+    if not identifiers:
+        await message.answer(WELCOME_TEXT, reply_markup=MAIN_KEYBOARD)
+        return
+
+    user_id = message.from_user.id if message.from_user else 0
+    if not await check_rate_limit(user_id):
+        metrics.rate_limited.add()
         await message.answer("Слишком много запросов, подождите немного.")
         return
-    await _lookup_and_reply(message, query)
+    if len(identifiers) > 1:
+        await _lookup_many_and_reply(message, identifiers, user_id)
+    else:
+        await _lookup_latest(message, identifiers[0][0], user_id=user_id)
 
 
 @router.message()
@@ -186,6 +705,37 @@ async def fallback_handler(message: Message) -> None:
     await message.answer(WELCOME_TEXT, reply_markup=MAIN_KEYBOARD)
 
 
+@router.callback_query(F.data.startswith("check:"))
+async def cb_check_candidate(query: CallbackQuery) -> None:
+    value = _parse_callback_data(query.data, "check")
+    if value is None:
+        await query.answer("Некорректные данные кнопки.", show_alert=True)
+        return
+    if not await check_rate_limit(query.from_user.id):
+        metrics.rate_limited.add()
+        await query.answer("Слишком много запросов, подождите немного.", show_alert=True)
+        return
+    await query.answer()
+    if query.message is not None:
+        await _lookup_latest(query.message, value, user_id=query.from_user.id)
+
+
+@router.callback_query(F.data.startswith("show:"))
+async def cb_show_party(query: CallbackQuery) -> None:
+    context_key = _parse_callback_data(query.data, "show")
+    party = _cache_get(context_key) if context_key else None
+    if party is None:
+        await query.answer("Кэш истёк", show_alert=True)
+        return
+    await query.answer()
+    if query.message is not None:
+        await query.message.answer(
+            format_card(party),
+            reply_markup=_base_inline(context_key),
+            parse_mode="Markdown",
+        )
+
+
 @router.callback_query(F.data.startswith("newsearch:"))
 async def cb_new_search(query: CallbackQuery) -> None:
     await query.answer()
@@ -193,11 +743,27 @@ async def cb_new_search(query: CallbackQuery) -> None:
         await query.message.answer("Ок. Пришлите новый ИНН.")
 
 
-@router.callback_query(F.data.regexp(r"^(card|courts|turnover|debts|penalties|requisites|contacts|founders):"))
+async def _enrich_snapshot_party(context_key: str, party: dict[str, Any]) -> dict[str, Any]:
+    """Replace a snapshot card with the full DaData party when a section needs more fields."""
+    if not config.DADATA_API_KEY:
+        return party
+    try:
+        data = await find_by_id_party(config.DADATA_API_KEY, context_key, count=1)
+    except Exception as exc:
+        logger.warning("failed to enrich snapshot party %s from DaData: %s", context_key, exc)
+        return party
+    suggestions = data.get("suggestions") or []
+    if not suggestions:
+        return party
+    _cache_set(context_key, suggestions[0])
+    return suggestions[0]
+
+
+@router.callback_query(F.data.regexp(r"^(card|courts|turnover|debts|penalties|requisites|contacts|founders|links):"))
 async def cb_sections(query: CallbackQuery) -> None:
     raw = query.data or ""
     action, context_key = raw.split(":", 1)
-    party = _cache_get(f"party:{context_key}")
+    party = _cache_get(context_key)
 
     if party is None:
         await query.answer("Кэш истёк", show_alert=True)
@@ -209,6 +775,9 @@ async def cb_sections(query: CallbackQuery) -> None:
     if query.message is None:
         return
 
+    if party.get("source") == SNAPSHOT_SOURCE and action in _DADATA_ONLY_SECTIONS:
+        party = await _enrich_snapshot_party(context_key, party)
+
     if action == "card":
         text = format_card(party)
     elif action == "courts":
@@ -223,6 +792,10 @@ async def cb_sections(query: CallbackQuery) -> None:
         text = format_contacts(party)
     elif action == "founders":
         text = format_founders(party)
+    elif action == "links":
+        # The walk can take a few seconds; the scheduler merges the two edits if it is quick.
+        await query.message.edit_text("🔗 Собираю связи…", reply_markup=_base_inline(context_key))
+        text = format_affiliates(await explore_affiliates(config.DADATA_API_KEY, party))
     elif action == "requisites":
         requisites = _safe_requisites_code_block(format_requisites(party))
         text = f"```\n{requisites}\n```"
@@ -242,7 +815,7 @@ async def cb_details_legacy(query: CallbackQuery) -> None:
     if inn is None:
         await query.answer("Некорректные данные кнопки.", show_alert=True)
         return
-    party = _cache_get(f"party:{inn}")
+    party = _cache_get(inn)
     await query.answer()
     if query.message is not None and party is not None:
         await query.message.edit_text(
@@ -262,5 +835,9 @@ def set_db_pool(pool: asyncpg.Pool[Any] | None) -> None:
 
 def create_dispatcher() -> Dispatcher:
     dp = Dispatcher(storage=MemoryStorage())
+    if config.SLOW_HANDLER_THRESHOLD > 0:
+        # Inner middlewares of the dispatcher also wrap the handlers of included routers.
+        for observer in (dp.message, dp.callback_query):
+            observer.middleware(SlowHandlerMiddleware(config.SLOW_HANDLER_THRESHOLD))
     dp.include_router(router)
     return dp
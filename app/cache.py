@@ -0,0 +1,230 @@
+"""Single in-process cache for DaData responses and the parties they contain.
+
+Each party suggestion is stored once under its own key; cached responses and the bot's
+callback contexts only keep references (party ids) to it.  The whole cache shares one
+size budget (entry count or approximate bytes), one TTL and one eviction policy.
+"""
+
+from __future__ import annotations
+
+import logging
+import marshal
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from cachetools import Cache, LFUCache, LRUCache
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("lru", "lfu")
+# Expired entries are swept eagerly once per this many writes; reads expire lazily.
+_SWEEP_EVERY = 256
+# Snapshot file header: magic, format version, marshal version (the payload is marshal data).
+_SNAPSHOT_HEADER = b"ATGC\x01" + bytes([marshal.version])
+
+
+def approx_sizeof(value: Any) -> int:
+    """Approximate deep size in bytes of a JSON-like value."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += approx_sizeof(key) + approx_sizeof(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += approx_sizeof(item)
+    return size
+
+
+def _entry_sizeof(entry: tuple[float, Any]) -> int:
+    return approx_sizeof(entry[1])
+
+
+def _party_id(suggestion: dict[str, Any]) -> str | None:
+    data = suggestion.get("data") or {}
+    hid = str(data.get("hid") or "").strip()
+    if hid:
+        return hid
+    parts = [str(data.get(field) or "").strip() for field in ("inn", "kpp", "ogrn")]
+    return "/".join(parts) if any(parts) else None
+
+
+class PartyCache:
+    def __init__(
+        self,
+        *,
+        maxsize: int,
+        ttl: float,
+        policy: str = "lru",
+        max_bytes: int = 0,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"cache policy must be one of {POLICIES}, got {policy!r}")
+        cache_cls = LFUCache if policy == "lfu" else LRUCache
+        if max_bytes > 0:
+            self._data: Cache = cache_cls(maxsize=max_bytes, getsizeof=_entry_sizeof)
+        else:
+            self._data = cache_cls(maxsize=maxsize)
+        self.ttl = ttl
+        self.policy = policy
+        self._timer = timer
+        self._writes = 0
+
+    @classmethod
+    def from_config(cls) -> PartyCache:
+        policy = config.CACHE_POLICY
+        if policy not in POLICIES:
+            logger.warning("unknown CACHE_POLICY %r, falling back to lru", policy)
+            policy = "lru"
+        return cls(
+            maxsize=config.CACHE_MAX_ENTRIES,
+            ttl=config.CACHE_TTL,
+            policy=policy,
+            max_bytes=config.CACHE_MAX_BYTES,
+        )
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def currsize(self) -> int:
+        return self._data.currsize
+
+    @property
+    def maxsize(self) -> int:
+        return self._data.maxsize
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def _get(self, key: tuple[str, str]) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= self._timer():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    def _put(self, key: tuple[str, str], value: Any, expires: float | None = None) -> None:
+        if expires is None:
+            expires = self._timer() + self.ttl
+        try:
+            self._data[key] = (expires, value)
+        except ValueError:
+            # Single value larger than the whole byte budget: do not cache it.
+            return
+        self._writes += 1
+        if self._writes % _SWEEP_EVERY == 0:
+            self.expire()
+
+    def _peek_items(self) -> list[tuple[tuple[str, str], tuple[float, Any]]]:
+        # Cache.__getitem__ bypasses the LRU/LFU bookkeeping of the subclasses.
+        return [(key, Cache.__getitem__(self._data, key)) for key in list(self._data)]
+
+    def expire(self) -> int:
+        now = self._timer()
+        expired = [key for key, (expires, _) in self._peek_items() if expires <= now]
+        for key in expired:
+            self._data.pop(key, None)
+        return len(expired)
+
+    def _put_party(self, suggestion: dict[str, Any]) -> str | None:
+        party_id = _party_id(suggestion)
+        if party_id is not None:
+            self._put(("party", party_id), suggestion)
+        return party_id
+
+    def put_response(self, key: str, data: dict[str, Any]) -> None:
+        refs: list[str | dict[str, Any]] = []
+        for suggestion in data.get("suggestions") or []:
+            party_id = self._put_party(suggestion)
+            refs.append(party_id if party_id is not None else suggestion)
+        extra = {name: value for name, value in data.items() if name != "suggestions"}
+        self._put(("response", key), (tuple(refs), extra))
+
+    def get_response(self, key: str) -> dict[str, Any] | None:
+        entry = self._get(("response", key))
+        if entry is None:
+            return None
+        refs, extra = entry
+        suggestions = []
+        for ref in refs:
+            party = ref if isinstance(ref, dict) else self._get(("party", ref))
+            if party is None:
+                # A referenced party was evicted first; treat the whole response as a miss.
+                self._data.pop(("response", key), None)
+                return None
+            suggestions.append(party)
+        return {**extra, "suggestions": suggestions}
+
+    def put_context(self, context_key: str, suggestion: dict[str, Any]) -> None:
+        party_id = self._put_party(suggestion)
+        self._put(("context", context_key), party_id if party_id is not None else suggestion)
+
+    def get_context(self, context_key: str) -> dict[str, Any] | None:
+        ref = self._get(("context", context_key))
+        if ref is None or isinstance(ref, dict):
+            return ref
+        return self._get(("party", ref))
+
+    def items(self) -> Iterator[tuple[tuple[str, str], float, Any]]:
+        """Yield `(key, expires_at, value)` for live entries (monotonic timer clock)."""
+        now = self._timer()
+        for key, (expires, value) in self._peek_items():
+            if expires > now:
+                yield key, expires, value
+
+    def save_snapshot(self, path: str | Path, *, max_bytes: int = 0, clock: Callable[[], float] = time.time) -> int:
+        """Write live entries with their remaining TTL to `path`; return how many were written.
+
+        With `max_bytes` > 0 the most recently written entries are kept until the payload
+        reaches the cap.  The file is replaced atomically.
+        """
+        now = self._timer()
+        live = sorted(self.items(), key=lambda item: item[1], reverse=True)
+        records = []
+        size = 0
+        for key, expires, value in live:
+            record = (key[0], key[1], expires - now, value)
+            if max_bytes > 0:
+                size += len(marshal.dumps(record))
+                if size > max_bytes:
+                    break
+            records.append(record)
+        # Oldest first, so that loading leaves the freshest entries most recently used.
+        records.reverse()
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(_SNAPSHOT_HEADER + marshal.dumps((clock(), records)))
+        os.replace(tmp, path)
+        return len(records)
+
+    def load_snapshot(self, path: str | Path, *, clock: Callable[[], float] = time.time) -> int:
+        """Restore entries saved by `save_snapshot`, minus the time spent offline; return the count."""
+        payload = Path(path).read_bytes()
+        if not payload.startswith(_SNAPSHOT_HEADER):
+            raise ValueError(f"{path} is not a cache snapshot of this format")
+        saved_at, records = marshal.loads(memoryview(payload)[len(_SNAPSHOT_HEADER) :])
+        now = self._timer()
+        offline = max(clock() - saved_at, 0.0)
+        loaded = 0
+        for kind, key, remaining, value in records:
+            remaining -= offline
+            if remaining <= 0:
+                continue
+            try:
+                self._data[(kind, key)] = (now + remaining, value)
+            except ValueError:
+                continue
+            loaded += 1
+        return loaded
+
+
+party_cache = PartyCache.from_config()
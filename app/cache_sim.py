@@ -0,0 +1,264 @@
+"""Hit ratios of the party cache for other sizes, TTLs and policies, replayed from history.
+
+    python -m app.cache_sim --trace check_requests.ndjson          # file from /admin/export
+    python -m app.cache_sim --days 14 --target 0.8                 # straight from PostgreSQL
+    python -m app.cache_sim --trace t.csv --sizes 256,1024,4096 --ttls 900,3600 --policies lru,ttl
+
+Every request is one access to the company it resolved to (`inn`, or the query text when
+nothing was found).  LRU and TTL-only curves come from a single pass: the reuse distance
+of an access (distinct companies seen since the previous access to the same one) is
+below the cache size exactly when LRU hits (Mattson's stack algorithm).  TTL runs from
+the write, as in `PartyCache`, and is applied as expiry since the last miss in an
+unbounded cache, which slightly underestimates small caches.  LFU has no stack property
+and is replayed once per size.
+
+Sizes are in companies; a looked-up company occupies about `ENTRIES_PER_PARTY` entries of
+`CACHE_MAX_ENTRIES` (the findById response, the party and the card context).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import bisect
+import csv
+import json
+import math
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Mapping, Sequence
+
+from cachetools import LFUCache
+
+ENTRIES_PER_PARTY = 3
+POLICIES = ("lru", "lfu", "ttl")
+
+# (unix time, company key)
+Access = tuple[float, str]
+
+
+@dataclass(frozen=True)
+class SimResult:
+    policy: str
+    ttl: float  # 0: entries never expire
+    size: int  # 0: unbounded (TTL-only)
+    hit_ratio: float
+
+
+def _timestamp(value: Any) -> float:
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _access(row: Mapping[str, Any]) -> Access | None:
+    key = str(row.get("inn") or "").strip() or str(row.get("query") or "").strip()
+    if not key:
+        return None
+    return _timestamp(row["created_at"]), key
+
+
+def read_trace(path: str | Path) -> Iterator[Access]:
+    """Accesses from a CSV or NDJSON file written by `/admin/export` (or `/export` in the bot)."""
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        first = file.readline()
+        file.seek(0)
+        if first.lstrip().startswith("{"):
+            rows: Iterable[Mapping[str, Any]] = (json.loads(line) for line in file if line.strip())
+        else:
+            rows = csv.DictReader(file)
+        for row in rows:
+            access = _access(row)
+            if access is not None:
+                yield access
+
+
+async def read_history(days: int) -> list[Access]:
+    """Accesses of the last `days` days from `check_requests`."""
+    from app.db import create_pool, iter_requests
+
+    pool = await create_pool()
+    try:
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        return [access async for record in iter_requests(pool, since=since) if (access := _access(record))]
+    finally:
+        await pool.close()
+
+
+def reuse_distances(keys: Sequence[str]) -> list[int]:
+    """For every access, the number of distinct keys accessed since the previous access to
+    the same key (-1 for a first access); a Fenwick tree over the latest access positions."""
+    n = len(keys)
+    tree = [0] * (n + 1)
+
+    def update(position: int, delta: int) -> None:
+        position += 1
+        while position <= n:
+            tree[position] += delta
+            position += position & -position
+
+    def prefix(position: int) -> int:
+        """Marked positions in [0, position)."""
+        total = 0
+        while position > 0:
+            total += tree[position]
+            position -= position & -position
+        return total
+
+    last: dict[str, int] = {}
+    distances = []
+    for position, key in enumerate(keys):
+        previous = last.get(key)
+        if previous is None:
+            distances.append(-1)
+        else:
+            distances.append(prefix(position) - prefix(previous + 1))
+            update(previous, -1)
+        update(position, 1)
+        last[key] = position
+    return distances
+
+
+def fresh_accesses(accesses: Sequence[Access], ttl: float) -> list[bool]:
+    """Whether each access would hit an unbounded cache whose entries live `ttl` seconds from the write."""
+    written: dict[str, float] = {}
+    fresh = []
+    for moment, key in accesses:
+        at = written.get(key)
+        hit = at is not None and (ttl <= 0 or moment - at < ttl)
+        if not hit:
+            written[key] = moment
+        fresh.append(hit)
+    return fresh
+
+
+def lru_curve(distances: Sequence[int], fresh: Sequence[bool], sizes: Sequence[int]) -> dict[int, float]:
+    """Hit ratio of an LRU cache of every size in `sizes`."""
+    if not distances:
+        return {size: 0.0 for size in sizes}
+    reusable = sorted(distance for distance, hit in zip(distances, fresh) if hit and distance >= 0)
+    return {size: bisect.bisect_left(reusable, size) / len(distances) for size in sizes}
+
+
+def replay_lfu(accesses: Sequence[Access], size: int, ttl: float) -> float:
+    """Hit ratio of an LFU cache like `PartyCache(policy="lfu")`, replayed access by access."""
+    if not accesses:
+        return 0.0
+    cache: LFUCache = LFUCache(maxsize=size)
+    hits = 0
+    for moment, key in accesses:
+        expires = cache.get(key)
+        if expires is not None and expires > moment:
+            hits += 1
+        else:
+            cache[key] = moment + ttl if ttl > 0 else math.inf
+    return hits / len(accesses)
+
+
+def default_sizes(distinct: int) -> list[int]:
+    sizes = []
+    size = 64
+    while size < distinct:
+        sizes.append(size)
+        size *= 2
+    return sizes + [max(distinct, 1)]
+
+
+def simulate(
+    accesses: Sequence[Access],
+    *,
+    sizes: Sequence[int],
+    ttls: Sequence[float],
+    policies: Sequence[str] = POLICIES,
+) -> list[SimResult]:
+    accesses = sorted(accesses, key=lambda access: access[0])
+    distances = reuse_distances([key for _, key in accesses])
+    results = []
+    for ttl in ttls:
+        fresh = fresh_accesses(accesses, ttl)
+        if "ttl" in policies:
+            ratio = sum(fresh) / len(fresh) if fresh else 0.0
+            results.append(SimResult("ttl", ttl, 0, ratio))
+        if "lru" in policies:
+            for size, ratio in lru_curve(distances, fresh, sizes).items():
+                results.append(SimResult("lru", ttl, size, ratio))
+        if "lfu" in policies:
+            for size in sizes:
+                results.append(SimResult("lfu", ttl, size, replay_lfu(accesses, size, ttl)))
+    return results
+
+
+def cheapest(results: Iterable[SimResult], target: float) -> SimResult | None:
+    """Smallest configuration `PartyCache` supports (bounded, finite TTL) reaching `target`,
+    shorter TTL first on a tie."""
+    reaching = [result for result in results if result.size and result.ttl > 0 and result.hit_ratio >= target]
+    return min(reaching, key=lambda result: (result.size, result.ttl), default=None)
+
+
+def _ttl_label(ttl: float) -> str:
+    return "∞" if ttl <= 0 else f"{ttl:g}s"
+
+
+def format_report(results: Sequence[SimResult], accesses: int, distinct: int, target: float | None) -> str:
+    lines = [f"{accesses} requests, {distinct} distinct companies", ""]
+    lines.append(f"{'policy':<7}{'ttl':>8}{'size':>8}{'≈entries':>10}{'hit':>8}")
+    for result in results:
+        size = str(result.size) if result.size else "∞"
+        entries = str(result.size * ENTRIES_PER_PARTY) if result.size else "—"
+        bar = "█" * round(result.hit_ratio * 40)
+        lines.append(
+            f"{result.policy:<7}{_ttl_label(result.ttl):>8}{size:>8}{entries:>10}{result.hit_ratio:>8.1%}  {bar}"
+        )
+    if target is not None:
+        best = cheapest(results, target)
+        lines.append("")
+        if best is None:
+            lines.append(f"no simulated configuration with a finite TTL reaches {target:.0%}")
+        else:
+            lines.append(
+                f"cheapest for {target:.0%}: CACHE_POLICY={best.policy} "
+                f"CACHE_MAX_ENTRIES={best.size * ENTRIES_PER_PARTY} CACHE_TTL={best.ttl:g} "
+                f"({best.hit_ratio:.1%})"
+            )
+    return "\n".join(lines)
+
+
+def _numbers(text: str) -> list[float]:
+    return [float(part) for part in text.split(",") if part.strip()]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cache_sim", description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="CSV or NDJSON export of check_requests")
+    source.add_argument("--days", type=int, help="read the last N days from PostgreSQL (POSTGRES_* env)")
+    parser.add_argument("--sizes", help="cache sizes in companies, comma-separated (default: powers of two)")
+    parser.add_argument("--ttls", default="300,900,3600", help="TTLs in seconds, 0 = no expiry")
+    parser.add_argument("--policies", default=",".join(POLICIES), help="any of lru,lfu,ttl")
+    parser.add_argument("--target", type=float, help="hit ratio to reach, e.g. 0.8")
+    args = parser.parse_args(argv)
+
+    policies = [policy.strip() for policy in args.policies.split(",") if policy.strip()]
+    unknown = set(policies) - set(POLICIES)
+    if unknown:
+        parser.error(f"unknown policies: {', '.join(sorted(unknown))}")
+
+    accesses = list(read_trace(args.trace)) if args.trace else asyncio.run(read_history(args.days))
+    if not accesses:
+        print("no requests in the trace", file=sys.stderr)
+        return 1
+    distinct = len({key for _, key in accesses})
+    sizes = [int(size) for size in _numbers(args.sizes)] if args.sizes else default_sizes(distinct)
+    results = simulate(accesses, sizes=sizes, ttls=_numbers(args.ttls), policies=policies)
+    print(format_report(results, len(accesses), distinct, args.target))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,10 +3,141 @@ from __future__ import annotations
 import os
 
 
+def _int_env(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    return int(raw) if raw.isdigit() else default
+
+
+def _ids_env(name: str) -> frozenset[int]:
+    raw = os.getenv(name, "")
+    return frozenset(int(part) for part in raw.replace(";", ",").split(",") if part.strip().isdigit())
+
+
+def _list_env(name: str) -> tuple[str, ...]:
+    raw = os.getenv(name, "")
+    return tuple(part.strip() for part in raw.replace(";", ",").split(",") if part.strip())
+
+
+def _float_env(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip())
+    except ValueError:
+        return default
+
+
 class Config:
     TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
-    DADATA_API_KEY: str = os.getenv("DADATA_API_KEY", "")
+    # Several DaData keys (comma-separated) are load-balanced by remaining daily quota;
+    # DADATA_API_KEY alone still works and is the first key of the pool
+    DADATA_API_KEYS: tuple[str, ...] = tuple(
+        dict.fromkeys(_list_env("DADATA_API_KEY") + _list_env("DADATA_API_KEYS"))
+    )
+    DADATA_API_KEY: str = DADATA_API_KEYS[0] if DADATA_API_KEYS else ""
+    # Local per-process cap of requests per key and day; 0: no cap, DaData's 401/403/429 eject keys
+    DADATA_DAILY_QUOTA: int = _int_env("DADATA_DAILY_QUOTA", 0)
+    # Seconds a key sits out after a 429 or a 403 that is not a daily-limit answer
+    DADATA_KEY_COOLDOWN: float = _float_env("DADATA_KEY_COOLDOWN", 60.0)
+    # Upper bound of one DaData call, seconds; an update stops waiting for it when its
+    # UPDATE_DEADLINE runs out.  DADATA_HEDGE=1 sends a duplicate request when the first one is slower
+    # than the observed p95 latency (at least DADATA_HEDGE_MIN_DELAY) and takes the first answer
+    DADATA_TIMEOUT: float = _float_env("DADATA_TIMEOUT", 10.0)
+    DADATA_HEDGE: bool = os.getenv("DADATA_HEDGE", "0").strip() == "1"
+    DADATA_HEDGE_MIN_DELAY: float = _float_env("DADATA_HEDGE_MIN_DELAY", 0.2)
     WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    # Telegram user ids allowed to run admin commands
+    ADMIN_IDS: frozenset[int] = _ids_env("ADMIN_IDS")
+    # Bearer token for admin HTTP endpoints (/admin/export, /admin/profile); empty disables them
+    ADMIN_API_TOKEN: str = os.getenv("ADMIN_API_TOKEN", "").strip()
+    # Bearer tokens (comma-separated) of internal systems allowed to call /api/v1/parties/check,
+    # and how many INN/OGRN one call may contain
+    API_TOKENS: tuple[str, ...] = _list_env("API_TOKENS")
+    API_MAX_IDS: int = _int_env("API_MAX_IDS", 5000)
+    # Longest sampling profile /admin/profile may run, seconds; fraction of webhook updates
+    # run under cProfile at startup (changed at runtime through /admin/profile/updates)
+    PROFILE_MAX_SECONDS: float = _float_env("PROFILE_MAX_SECONDS", 60.0)
+    PROFILE_UPDATE_RATE: float = _float_env("PROFILE_UPDATE_RATE", 0.0)
+
+    # Runtime: "webhook" (FastAPI + uvicorn) or "polling" (long polling, no public URL)
+    BOT_MODE: str = os.getenv("BOT_MODE", "webhook").strip().lower() or "webhook"
+    UPDATE_MAX_TASKS: int = _int_env("UPDATE_MAX_TASKS", 32)
+    # Time budget of one update, from arrival (queueing included) to the last reply; 0 disables
+    UPDATE_DEADLINE: float = _float_env("UPDATE_DEADLINE", 20.0)
+    POLLING_TIMEOUT: int = _int_env("POLLING_TIMEOUT", 30)
+    SHUTDOWN_DRAIN_TIMEOUT: float = _float_env("SHUTDOWN_DRAIN_TIMEOUT", 25.0)
+
+    # Outbound Telegram pacing (messages per second): global, per private chat (with burst)
+    # and per group chat; flood-control answers are retried up to TG_MAX_RETRIES times
+    TG_GLOBAL_RATE: float = _float_env("TG_GLOBAL_RATE", 30.0)
+    TG_CHAT_RATE: float = _float_env("TG_CHAT_RATE", 1.0)
+    TG_CHAT_BURST: float = _float_env("TG_CHAT_BURST", 3.0)
+    TG_GROUP_RATE: float = _float_env("TG_GROUP_RATE", 20 / 60)
+    TG_MAX_RETRIES: int = _int_env("TG_MAX_RETRIES", 3)
+    # Self-hosted telegram-bot-api server (e.g. http://telegram-bot-api:8081); empty means
+    # api.telegram.org. TG_API_LOCAL=1 enables local mode (file paths instead of downloads)
+    TG_API_BASE_URL: str = os.getenv("TG_API_BASE_URL", "").strip()
+    TG_API_LOCAL: bool = os.getenv("TG_API_LOCAL", "0").strip() == "1"
+    # aiohttp connector of the bot session: connection pool size, keep-alive (s), DNS cache (s)
+    TG_CONNECTOR_LIMIT: int = _int_env("TG_CONNECTOR_LIMIT", 100)
+    TG_KEEPALIVE_TIMEOUT: float = _float_env("TG_KEEPALIVE_TIMEOUT", 30.0)
+    TG_DNS_CACHE_TTL: int = _int_env("TG_DNS_CACHE_TTL", 3600)
+    # On a cache miss show "typing…" instead of a placeholder message when DaData's
+    # median latency for the lookup is at most this many seconds
+    CHAT_ACTION_MAX_LATENCY: float = _float_env("CHAT_ACTION_MAX_LATENCY", 1.0)
+
+    # Shared DaData/party cache: size by entries, or by approximate bytes when CACHE_MAX_BYTES > 0
+    CACHE_MAX_ENTRIES: int = _int_env("CACHE_MAX_ENTRIES", 2048)
+    CACHE_MAX_BYTES: int = _int_env("CACHE_MAX_BYTES", 0)
+    CACHE_TTL: float = _float_env("CACHE_TTL", 900.0)
+    CACHE_POLICY: str = os.getenv("CACHE_POLICY", "lru").strip().lower() or "lru"
+    # File the cache is saved to on shutdown and restored from on startup (empty disables it),
+    # capped at CACHE_SNAPSHOT_MAX_BYTES of payload (most recently written entries are kept)
+    CACHE_SNAPSHOT_PATH: str = os.getenv("CACHE_SNAPSHOT_PATH", "").strip()
+    CACHE_SNAPSHOT_MAX_BYTES: int = _int_env("CACHE_SNAPSHOT_MAX_BYTES", 64 * 1024 * 1024)
+
+    # Several INN/OGRN in one message (or caption): at most this many are checked,
+    # with at most LOOKUP_CONCURRENCY DaData calls in flight
+    BATCH_MAX_IDS: int = _int_env("BATCH_MAX_IDS", 20)
+    LOOKUP_CONCURRENCY: int = _int_env("LOOKUP_CONCURRENCY", 5)
+
+    # Durable batch jobs (needs PostgreSQL): lists longer than BATCH_MAX_IDS, up to JOB_MAX_IDS
+    # numbers, are checked in the background by a worker leasing JOB_BATCH_SIZE items at a time
+    # for JOB_LEASE seconds, with JOB_CONCURRENCY DaData calls in flight; JOB_WORKER=0 disables
+    # the worker in this process (jobs are still accepted and picked up by other instances)
+    JOB_WORKER: bool = os.getenv("JOB_WORKER", "1").strip() != "0"
+    JOB_MAX_IDS: int = _int_env("JOB_MAX_IDS", 50000)
+    JOB_BATCH_SIZE: int = _int_env("JOB_BATCH_SIZE", 50)
+    JOB_CONCURRENCY: int = _int_env("JOB_CONCURRENCY", 2)
+    JOB_LEASE: float = _float_env("JOB_LEASE", 300.0)
+    JOB_MAX_ATTEMPTS: int = _int_env("JOB_MAX_ATTEMPTS", 3)
+    JOB_IDLE_DELAY: float = _float_env("JOB_IDLE_DELAY", 5.0)
+    # Backoff before retrying a failed item, seconds; doubles with every attempt (up to an hour)
+    JOB_RETRY_DELAY: float = _float_env("JOB_RETRY_DELAY", 30.0)
+
+    # "🔗 Связи": companies up to GRAPH_MAX_DEPTH hops away through founders and managers,
+    # at most GRAPH_MAX_NODES nodes, GRAPH_CONCURRENCY DaData calls and GRAPH_TIME_BUDGET seconds
+    GRAPH_MAX_DEPTH: int = _int_env("GRAPH_MAX_DEPTH", 2)
+    GRAPH_MAX_NODES: int = _int_env("GRAPH_MAX_NODES", 40)
+    GRAPH_CONCURRENCY: int = _int_env("GRAPH_CONCURRENCY", 4)
+    GRAPH_TIME_BUDGET: float = _float_env("GRAPH_TIME_BUDGET", 8.0)
+
+    # Directory with an offline EGRUL/EGRIP snapshot built by `python -m app.egrul` (optional)
+    EGRUL_SNAPSHOT_DIR: str = os.getenv("EGRUL_SNAPSHOT_DIR", "").strip()
+
+    # Local trigram index over known company names; a match at or above this score
+    # skips DaData suggest and goes straight to findById
+    NAME_INDEX_MIN_SCORE: float = _float_env("NAME_INDEX_MIN_SCORE", 0.75)
+    # Also index every company of the EGRUL snapshot at startup (in a background thread);
+    # off by default: the index takes about 470 MiB per million names
+    NAME_INDEX_FROM_SNAPSHOT: bool = os.getenv("NAME_INDEX_FROM_SNAPSHOT", "0").strip() == "1"
+
+    # Readiness probe
+    HEALTH_REFRESH_INTERVAL: float = _float_env("HEALTH_REFRESH_INTERVAL", 5.0)
+    DADATA_FAILURE_THRESHOLD: int = _int_env("DADATA_FAILURE_THRESHOLD", 5)
+    # Event-loop lag probe period and the lag (s) at which /ready reports the instance unready;
+    # handlers running this long (s) without yielding to the loop are logged (0 disables)
+    LOOP_LAG_INTERVAL: float = _float_env("LOOP_LAG_INTERVAL", 0.5)
+    LOOP_LAG_UNHEALTHY: float = _float_env("LOOP_LAG_UNHEALTHY", 2.0)
+    SLOW_HANDLER_THRESHOLD: float = _float_env("SLOW_HANDLER_THRESHOLD", 0.1)
 
     # PostgreSQL
     POSTGRES_HOST: str | None = os.getenv("POSTGRES_HOST")
@@ -15,6 +146,8 @@ class Config:
     POSTGRES_DB: str | None = os.getenv("POSTGRES_DB")
     POSTGRES_USER: str | None = os.getenv("POSTGRES_USER")
     POSTGRES_PASSWORD: str | None = os.getenv("POSTGRES_PASSWORD")
+    REQUESTS_RETENTION_DAYS: int = _int_env("REQUESTS_RETENTION_DAYS", 180)
+    DB_MAINTENANCE_INTERVAL: float = _float_env("DB_MAINTENANCE_INTERVAL", 3600.0)
 
 
 config = Config()
@@ -1,31 +1,111 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import re
-from typing import Any
+import time
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator
 
 import httpx
-from cachetools import TTLCache
+
+from app.cache import PartyCache, party_cache
+from app.config import config
+from app.dadata_keys import NoAvailableKeyError, key_pool
+from app.deadline import DeadlineExceeded, no_deadline, remaining
+from app.metrics import metrics
+from app.name_index import name_index
 
 logger = logging.getLogger(__name__)
 
 DADATA_FINDBYID_URL = "https://suggestions.dadata.ru/suggestions/api/4_1/rs/findById/party"
 DADATA_SUGGEST_URL = "https://suggestions.dadata.ru/suggestions/api/4_1/rs/suggest/party"
+DADATA_AFFILIATED_URL = "https://suggestions.dadata.ru/suggestions/api/4_1/rs/findAffiliated/party"
 
-_cache: TTLCache = TTLCache(maxsize=512, ttl=900)  # 15 minutes
+_cache: PartyCache = party_cache
+_http_client: httpx.AsyncClient | None = None
+# Number of requests that actually went to DaData (not served from cache) in the current context.
+network_calls: ContextVar[int] = ContextVar("dadata_network_calls", default=0)
 
 _DIGITS_RE = re.compile(r"\D+")
+_DIGIT_RUN_RE = re.compile(r"\d+")
+
+
+class DaDataStats:
+    """Passive outcome counters for real DaData calls (cache hits are not counted)."""
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_status: int | None = None
+        self.last_success_at: float | None = None
+        self.last_failure_at: float | None = None
+
+    def record_success(self) -> None:
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.last_status = 200
+        self.last_success_at = time.time()
+
+    def record_failure(self, status: int | None) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_status = status
+        self.last_failure_at = time.time()
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_status": self.last_status,
+            "last_success_at": self.last_success_at,
+            "last_failure_at": self.last_failure_at,
+        }
+
+
+stats = DaDataStats()
+
+
+_INN10_WEIGHTS = (2, 4, 10, 3, 5, 9, 4, 6, 8)
+_INN12_WEIGHTS_11 = (7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+_INN12_WEIGHTS_12 = (3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+
+
+def _inn_control(digits: str, weights: tuple[int, ...]) -> int:
+    return sum(int(digit) * weight for digit, weight in zip(digits, weights)) % 11 % 10
+
+
+def _inn_checksum_ok(inn: str) -> bool:
+    if len(inn) == 10:
+        return _inn_control(inn, _INN10_WEIGHTS) == int(inn[9])
+    return _inn_control(inn, _INN12_WEIGHTS_11) == int(inn[10]) and _inn_control(
+        inn, _INN12_WEIGHTS_12
+    ) == int(inn[11])
+
+
+def _ogrn_checksum_ok(ogrn: str) -> bool:
+    # OGRN: number without the last digit mod 11; OGRNIP (15 digits): mod 13.
+    modulus = 11 if len(ogrn) == 13 else 13
+    return int(ogrn[:-1]) % modulus % 10 == int(ogrn[-1])
 
 
 def validate_inn(inn: str) -> bool:
-    return bool(re.fullmatch(r"\d{10}|\d{12}", inn))
+    return bool(re.fullmatch(r"\d{10}|\d{12}", inn)) and _inn_checksum_ok(inn)
 
 
 def validate_ogrn(ogrn: str) -> bool:
-    return bool(re.fullmatch(r"\d{13}|\d{15}", ogrn))
+    return bool(re.fullmatch(r"\d{13}|\d{15}", ogrn)) and _ogrn_checksum_ok(ogrn)
 
 
 def normalize_query_input(text: str) -> tuple[str, str]:
+    """Return `(query, kind)`; kind is "inn", "ogrn", "name", or "invalid" for an
+    INN/OGRN-shaped number whose control digits do not match."""
     raw = (text or "").strip()
     if not raw:
         return "", "name"
@@ -35,45 +115,286 @@ def normalize_query_input(text: str) -> tuple[str, str]:
         return digits, "inn"
     if validate_ogrn(digits):
         return digits, "ogrn"
+    if len(digits) in {10, 12, 13, 15}:
+        return digits, "invalid"
 
     return raw, "name"
 
 
+def extract_identifiers(text: str, limit: int | None = None) -> list[tuple[str, str]]:
+    """Find every valid INN/OGRN written as a separate number in free text, in order, without duplicates.
+
+    Returns `(number, kind)` pairs; use `normalize_query_input` for a single number
+    written with separators ("7707-083-893").
+    """
+    found: dict[str, str] = {}
+    for match in _DIGIT_RUN_RE.finditer(text or ""):
+        digits = match.group()
+        if digits in found:
+            continue
+        if validate_inn(digits):
+            found[digits] = "inn"
+        elif validate_ogrn(digits):
+            found[digits] = "ogrn"
+        else:
+            continue
+        if limit is not None and len(found) >= limit:
+            break
+    return list(found.items())
+
+
+def typo_candidates(digits: str) -> Iterator[str]:
+    """Yield valid INN/OGRN numbers one digit substitution or adjacent swap away from `digits`."""
+    validate = validate_inn if len(digits) in {10, 12} else validate_ogrn
+    seen = {digits}
+    for i in range(len(digits) - 1):
+        if digits[i] != digits[i + 1]:
+            swapped = digits[:i] + digits[i + 1] + digits[i] + digits[i + 2 :]
+            if swapped not in seen and validate(swapped):
+                seen.add(swapped)
+                yield swapped
+    for i, current in enumerate(digits):
+        for digit in "0123456789":
+            if digit == current:
+                continue
+            candidate = digits[:i] + digit + digits[i + 1 :]
+            if candidate not in seen and validate(candidate):
+                seen.add(candidate)
+                yield candidate
+
+
+async def open_http_client() -> httpx.AsyncClient:
+    """Create the shared keep-alive client used by all DaData calls."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=config.DADATA_TIMEOUT,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None:
+        await client.aclose()
+
+
 def _cache_key(endpoint: str, **kwargs: Any) -> str:
     params = "&".join(f"{k}={v}" for k, v in sorted(kwargs.items()))
     return f"{endpoint}?{params}"
 
 
+def cached_party(query: str) -> dict[str, Any] | None:
+    """First party of a cached `findById/party` (count=1) answer for `query`; never does I/O."""
+    data = _cache.get_response(_cache_key("findById/party", query=query, count=1))
+    suggestions = (data or {}).get("suggestions") or []
+    return suggestions[0] if suggestions else None
+
+
+def _hedge_delay() -> float | None:
+    """When to fire a duplicate request: the observed p95 latency, if hedging is on and known."""
+    if not config.DADATA_HEDGE:
+        return None
+    p95 = metrics.dadata_latency.quantile(0.95)
+    if p95 is None:
+        return None
+    return max(p95, config.DADATA_HEDGE_MIN_DELAY)
+
+
+def _is_daily_limit(resp: httpx.Response) -> bool:
+    """Whether a 403 says the key ran out of its daily limit rather than anything else."""
+    if resp.status_code != 403:
+        return False
+    try:
+        text = resp.text.lower()
+    except (httpx.ResponseNotRead, UnicodeDecodeError):
+        return False
+    return "limit" in text or "лимит" in text
+
+
+async def _send(
+    url: str,
+    payload: dict[str, Any],
+    api_key: str,
+    pooled: bool,
+    timeout: float,
+    track: bool = True,
+) -> httpx.Response:
+    """POST to DaData; `track=False` keeps the outcome out of `stats` and the key pool."""
+    headers = {
+        "Content-Type": "application/json; charset=utf-8",
+        "Accept": "application/json",
+        "Authorization": f"Token {api_key}",
+    }
+    started = time.monotonic()
+    cancelled = False
+    try:
+        if _http_client is not None:
+            resp = await _http_client.post(url, json=payload, headers=headers, timeout=timeout)
+        else:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                resp = await client.post(url, json=payload, headers=headers)
+        resp.raise_for_status()
+    except asyncio.CancelledError:
+        # A hedged request that lost the race says nothing about DaData's health.
+        cancelled = True
+        raise
+    except httpx.HTTPStatusError as exc:
+        if track:
+            stats.record_failure(exc.response.status_code)
+            if pooled:
+                key_pool.record(api_key, exc.response.status_code, daily_limit=_is_daily_limit(exc.response))
+        raise
+    except httpx.HTTPError:
+        if track:
+            stats.record_failure(None)
+            if pooled:
+                key_pool.record(api_key, None)
+        raise
+    finally:
+        if not cancelled:
+            metrics.dadata_latency.observe(time.monotonic() - started)
+    if track:
+        stats.record_success()
+    return resp
+
+
+async def _hedged_send(
+    url: str,
+    payload: dict[str, Any],
+    api_key: str,
+    pooled: bool,
+    timeout: float,
+    hedge_after: float,
+    track: bool = True,
+) -> httpx.Response:
+    """Send once; if no answer within `hedge_after`, send again and take whichever answers first."""
+    started = time.monotonic()
+    first = asyncio.create_task(_send(url, payload, api_key, pooled, timeout, track))
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedge_after)
+        if done:
+            return first.result()
+
+        hedge_key = api_key
+        if pooled:
+            try:
+                hedge_key = key_pool.acquire()
+            except NoAvailableKeyError:
+                return await first
+        metrics.dadata_hedges += 1
+        hedge = asyncio.create_task(
+            _send(url, payload, hedge_key, pooled, timeout - (time.monotonic() - started), track)
+        )
+        pending.add(hedge)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        metrics.dadata_hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        assert error is not None
+        raise error
+    finally:
+        # Whatever did not answer is abandoned, including on cancellation of the caller.
+        for task in pending:
+            task.cancel()
+
+
+class _Flight:
+    """A DaData request in progress and how many callers are waiting for it."""
+
+    def __init__(self, task: asyncio.Task[dict[str, Any]]) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+# Cache misses being fetched, by cache key: concurrent identical lookups share one request.
+_in_flight: dict[str, _Flight] = {}
+
+
+def _land(key: str, flight: _Flight, task: asyncio.Task[dict[str, Any]]) -> None:
+    if _in_flight.get(key) is flight:
+        del _in_flight[key]
+    if not task.cancelled():
+        task.exception()  # retrieved here in case every waiter was cancelled first
+
+
 async def _post_dadata(
     *,
     api_key: str,
     url: str,
     payload: dict[str, Any],
     cache_endpoint: str,
+    track: bool = True,
 ) -> dict[str, Any]:
     if not api_key.strip():
         raise ValueError("DADATA api_key must not be empty")
 
     key = _cache_key(cache_endpoint, **payload)
-    if key in _cache:
+    cached = _cache.get_response(key)
+    metrics.cache_lookup("dadata", hit=cached is not None)
+    if cached is not None:
         logger.debug("cache hit for %s", key)
-        return _cache[key]
-
-    headers = {
-        "Content-Type": "application/json; charset=utf-8",
-        "Accept": "application/json",
-        "Authorization": f"Token {api_key}",
-    }
-
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
+        return cached
+
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("update deadline passed before the DaData call")
+
+    network_calls.set(network_calls.get() + 1)
+    flight = _in_flight.get(key)
+    if flight is None:
+        # The request may outlive this update: it runs without a deadline, and every
+        # waiter below stops waiting when its own budget runs out.
+        with no_deadline():
+            flight = _Flight(asyncio.create_task(_fetch(api_key, url, payload, key, track)))
+        _in_flight[key] = flight
+        flight.task.add_done_callback(partial(_land, key, flight))
+    else:
+        metrics.dadata_coalesced += 1
+    flight.waiters += 1
+    try:
+        if left is None:
+            return await asyncio.shield(flight.task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.task), left)
+        except asyncio.TimeoutError as exc:
+            raise DeadlineExceeded(f"DaData did not answer within the remaining {left:.2f}s of the update") from exc
+    except (asyncio.CancelledError, DeadlineExceeded):
+        # The request only dies with its last waiter; other callers keep it going.
+        if flight.waiters == 1 and not flight.task.done():
+            flight.task.cancel()
+            metrics.dadata_cancelled += 1
+        raise
+    finally:
+        flight.waiters -= 1
+
+
+async def _fetch(api_key: str, url: str, payload: dict[str, Any], key: str, track: bool = True) -> dict[str, Any]:
+    timeout = config.DADATA_TIMEOUT
+    pooled = api_key in key_pool
+    if pooled:
+        api_key = key_pool.acquire()
+
+    hedge_after = _hedge_delay()
+    if hedge_after is None or hedge_after >= timeout:
+        resp = await _send(url, payload, api_key, pooled, timeout, track)
+    else:
+        resp = await _hedged_send(url, payload, api_key, pooled, timeout, hedge_after, track)
+    data = resp.json()
 
     if not isinstance(data, dict):
         raise ValueError("DaData response must be a JSON object")
 
-    _cache[key] = data
+    _cache.put_response(key, data)
+    name_index.add_suggestions(data.get("suggestions") or [])
     return data
 
 
@@ -121,11 +442,94 @@ async def suggest_party(api_key: str, query: str, count: int = 10) -> dict[str,
     )
 
 
+async def find_affiliated_party(api_key: str, inn: str, count: int = 20) -> dict[str, Any]:
+    """Companies where the person or company `inn` is a founder or a manager.
+
+    DaData serves this endpoint on higher plans only and answers 403 otherwise, so its
+    outcome says nothing about the key or DaData's health and is not recorded.
+    """
+    if not inn.strip():
+        raise ValueError("DaData query must not be empty")
+    if count <= 0:
+        raise ValueError("count must be greater than 0")
+
+    return await _post_dadata(
+        api_key=api_key,
+        url=DADATA_AFFILIATED_URL,
+        payload={"query": inn, "count": count},
+        cache_endpoint="findAffiliated/party",
+        track=False,
+    )
+
+
+async def _as_async_iter(items: Iterable[str] | AsyncIterable[str]) -> AsyncIterator[str]:
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def lookup_parties(
+    api_key: str,
+    queries: Iterable[str] | AsyncIterable[str],
+    *,
+    concurrency: int = 5,
+) -> AsyncIterator[tuple[str, dict[str, Any] | Exception]]:
+    """Run `find_by_id_party` for every query with at most `concurrency` calls in flight.
+
+    Yields `(query, response_or_exception)` as lookups complete, so results arrive out of
+    order; queries are pulled lazily, so an unbounded (async) iterable is fine.
+    """
+    if concurrency <= 0:
+        raise ValueError("concurrency must be greater than 0")
+
+    async def _lookup(query: str) -> tuple[str, dict[str, Any] | Exception]:
+        try:
+            return query, await find_by_id_party(api_key, query, count=1)
+        except Exception as exc:
+            return query, exc
+
+    source = _as_async_iter(queries)
+    pending: set[asyncio.Task[tuple[str, dict[str, Any] | Exception]]] = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    query = await anext(source)
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.create_task(_lookup(query)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
 async def find_party_universal(api_key: str, text: str, count: int = 1) -> dict[str, Any]:
-    """Always resolve party via suggest first, then enrich via findById/party."""
+    """Resolve party via suggest first, then enrich via findById/party.
+
+    A confident match in the local name index skips the suggest call.
+    """
     query, kind = normalize_query_input(text)
     if not query:
         raise ValueError("DaData query must not be empty")
+    if kind == "invalid":
+        raise ValueError(f"{query} is not a valid INN/OGRN (control digit mismatch)")
+
+    if kind == "name":
+        match = name_index.best_match(query, min_score=config.NAME_INDEX_MIN_SCORE)
+        if match is not None:
+            detailed = await find_by_id_party(api_key, query=match.key, count=1)
+            if detailed.get("suggestions"):
+                return detailed
 
     suggested = await suggest_party(api_key, query=query, count=count)
     suggestions: list[dict[str, Any]] = suggested.get("suggestions", [])
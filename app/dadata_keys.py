@@ -0,0 +1,168 @@
+"""Pool of DaData API keys: weighted round-robin by remaining daily quota, with ejection.
+
+Without a local quota (`daily_quota=0`) keys are weighted equally and only DaData's own
+401/403/429 answers take a key out of rotation; the local count is per process, so it is only
+exact for a single replica. The last usable key is never ejected: failing one request is
+better than refusing every later one.
+"""
+
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+from app.config import config
+
+# DaData daily limits reset at midnight Moscow time.
+_MSK = timezone(timedelta(hours=3))
+
+
+class NoAvailableKeyError(RuntimeError):
+    """Every configured DaData key is exhausted or temporarily ejected."""
+
+
+def _mask(key: str) -> str:
+    return f"{key[:4]}…{key[-2:]}" if len(key) > 8 else "…"
+
+
+class _KeyState:
+    def __init__(self, key: str, quota: int) -> None:
+        self.key = key
+        self.quota = quota
+        self.used_today = 0
+        self.day: str | None = None
+        self.requests = 0
+        self.failures = 0
+        self.rejected: dict[int, int] = {}
+        self.ejected_until = 0.0
+        self.current_weight = 0
+
+    @property
+    def remaining(self) -> int | None:
+        """Requests left today under the local quota; None without one."""
+        if not self.quota:
+            return None
+        return max(self.quota - self.used_today, 0)
+
+    def usable(self, now: float) -> bool:
+        return self.ejected_until <= now and self.remaining != 0
+
+
+class KeyPool:
+    def __init__(
+        self,
+        keys: tuple[str, ...] | list[str],
+        *,
+        daily_quota: int,
+        cooldown: float,
+        timer: Callable[[], float] = time.time,
+    ) -> None:
+        self._states = {key: _KeyState(key, daily_quota) for key in dict.fromkeys(keys) if key}
+        self._cooldown = cooldown
+        self._timer = timer
+
+    @classmethod
+    def from_config(cls) -> KeyPool:
+        return cls(
+            config.DADATA_API_KEYS,
+            daily_quota=config.DADATA_DAILY_QUOTA,
+            cooldown=config.DADATA_KEY_COOLDOWN,
+        )
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._states
+
+    def _today(self, now: float) -> str:
+        return datetime.fromtimestamp(now, tz=_MSK).date().isoformat()
+
+    def _next_reset(self, now: float) -> float:
+        moment = datetime.fromtimestamp(now, tz=_MSK)
+        midnight = (moment + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight.timestamp()
+
+    def _roll_day(self, state: _KeyState, today: str) -> None:
+        if state.day != today:
+            state.day = today
+            state.used_today = 0
+
+    def available(self) -> int:
+        now = self._timer()
+        today = self._today(now)
+        count = 0
+        for state in self._states.values():
+            self._roll_day(state, today)
+            count += state.usable(now)
+        return count
+
+    def acquire(self) -> str:
+        """Pick a key by smooth weighted round-robin, weight = remaining daily quota (or 1)."""
+        now = self._timer()
+        today = self._today(now)
+        candidates = []
+        for state in self._states.values():
+            self._roll_day(state, today)
+            if state.usable(now):
+                candidates.append(state)
+        if not candidates:
+            raise NoAvailableKeyError("all DaData API keys are exhausted or ejected")
+
+        total = 0
+        for state in candidates:
+            weight = state.remaining or 1
+            state.current_weight += weight
+            total += weight
+        chosen = max(candidates, key=lambda state: state.current_weight)
+        chosen.current_weight -= total
+        chosen.requests += 1
+        chosen.used_today += 1
+        return chosen.key
+
+    def record(self, key: str, status: int | None, *, daily_limit: bool = False) -> None:
+        """Account the outcome of a request made with `key` (status None: network error).
+
+        `daily_limit` marks a 403 that DaData explained as the key's daily limit.
+        """
+        state = self._states.get(key)
+        if state is None or status == 200:
+            return
+        state.failures += 1
+        if status is None:
+            return
+        state.rejected[status] = state.rejected.get(status, 0) + 1
+        if status not in {401, 403, 429}:
+            return
+        now = self._timer()
+        today = self._today(now)
+        others = [other for other in self._states.values() if other is not state]
+        for other in others:
+            self._roll_day(other, today)
+        if not any(other.usable(now) for other in others):
+            return
+        if status == 401 or (status == 403 and daily_limit):
+            # Unknown key or daily limit reached: nothing to gain until the quota resets.
+            state.ejected_until = self._next_reset(now)
+        else:
+            state.ejected_until = now + self._cooldown
+
+    def as_dict(self) -> dict[str, dict[str, Any]]:
+        now = self._timer()
+        today = self._today(now)
+        result = {}
+        for state in self._states.values():
+            self._roll_day(state, today)
+            result[_mask(state.key)] = {
+                "requests": state.requests,
+                "used_today": state.used_today,
+                "remaining": state.remaining,
+                "failures": state.failures,
+                "rejected": dict(state.rejected),
+                "ejected_for": max(state.ejected_until - now, 0.0),
+            }
+        return result
+
+
+key_pool = KeyPool.from_config()
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
 import logging
-from typing import Any
-
-import asyncpg
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable
 
 from app.config import config
 
+if TYPE_CHECKING:
+    import asyncpg
+
 logger = logging.getLogger(__name__)
 
+# Arbitrary constant used with pg_advisory_xact_lock so that only one instance migrates at a time.
+_MIGRATION_LOCK_ID = 7_700_831
+_PARTITION_RE = re.compile(r"^check_requests_p(\d{4})(\d{2})$")
+# Columns of `check_requests` returned by iter_requests, in export order.
+EXPORT_COLUMNS = ("id", "created_at", "user_id", "query", "query_kind", "inn", "cache_hit")
+
 
 def postgres_enabled() -> bool:
     values = [
@@ -21,6 +30,9 @@ def postgres_enabled() -> bool:
 
 
 async def create_pool() -> asyncpg.Pool[Any]:
+    # Imported here so deployments without Postgres never load the driver.
+    import asyncpg
+
     return await asyncpg.create_pool(
         host=config.POSTGRES_HOST,
         port=config.POSTGRES_PORT,
@@ -32,20 +44,472 @@ async def create_pool() -> asyncpg.Pool[Any]:
     )
 
 
+def _month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def _next_month(value: date) -> date:
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _partition_name(month: date) -> str:
+    return f"check_requests_p{month:%Y%m}"
+
+
+async def _create_month_partition(conn: asyncpg.Connection, month: date) -> None:
+    start = _month_start(month)
+    end = _next_month(start)
+    await conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {_partition_name(start)} PARTITION OF check_requests "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+async def _migration_1_initial(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS check_requests (
+            id SERIAL PRIMARY KEY,
+            query TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+        """
+    )
+
+
+async def _migration_2_partitioned(conn: asyncpg.Connection) -> None:
+    await conn.execute("ALTER TABLE check_requests RENAME TO check_requests_legacy")
+    await conn.execute("ALTER SEQUENCE IF EXISTS check_requests_id_seq RENAME TO check_requests_legacy_id_seq")
+    await conn.execute(
+        """
+        CREATE TABLE check_requests (
+            id BIGSERIAL,
+            query TEXT NOT NULL,
+            query_kind TEXT NOT NULL DEFAULT 'name',
+            inn TEXT,
+            user_id BIGINT,
+            cache_hit BOOLEAN,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    await conn.execute("CREATE TABLE check_requests_default PARTITION OF check_requests DEFAULT")
+    await conn.execute("CREATE INDEX check_requests_inn_created_idx ON check_requests (inn, created_at)")
+    await conn.execute("CREATE INDEX check_requests_created_idx ON check_requests (created_at)")
+    await conn.execute("CREATE INDEX check_requests_user_created_idx ON check_requests (user_id, created_at)")
+
+    # Every month that already holds legacy rows gets its own partition before the copy,
+    # otherwise the rows would land in the default partition.
+    oldest = await conn.fetchval("SELECT MIN(created_at) FROM check_requests_legacy")
+    month = _month_start(oldest.date() if oldest else datetime.now(timezone.utc).date())
+    last = _month_start(datetime.now(timezone.utc).date())
+    while month <= last:
+        await _create_month_partition(conn, month)
+        month = _next_month(month)
+
+    await conn.execute(
+        r"""
+        INSERT INTO check_requests (query, query_kind, inn, created_at)
+        SELECT
+            query,
+            CASE
+                WHEN query ~ '^(\d{10}|\d{12})$' THEN 'inn'
+                WHEN query ~ '^(\d{13}|\d{15})$' THEN 'ogrn'
+                ELSE 'name'
+            END,
+            CASE WHEN query ~ '^(\d{10}|\d{12})$' THEN query END,
+            COALESCE(created_at AT TIME ZONE 'UTC', NOW())
+        FROM check_requests_legacy
+        """
+    )
+    await conn.execute("DROP TABLE check_requests_legacy")
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS check_requests_daily (
+            day DATE PRIMARY KEY,
+            total BIGINT NOT NULL,
+            unique_users BIGINT NOT NULL,
+            cache_hits BIGINT NOT NULL,
+            top_inns JSONB NOT NULL DEFAULT '[]'::jsonb,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+
+
+async def _migration_3_check_jobs(conn: asyncpg.Connection) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE check_jobs (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT,
+            chat_id BIGINT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            total INT NOT NULL,
+            done INT NOT NULL DEFAULT 0,
+            failed INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            finished_at TIMESTAMPTZ
+        )
+        """
+    )
+    await conn.execute(
+        """
+        CREATE TABLE check_job_items (
+            job_id BIGINT NOT NULL REFERENCES check_jobs (id) ON DELETE CASCADE,
+            position INT NOT NULL,
+            query TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            locked_until TIMESTAMPTZ,
+            result JSONB,
+            error TEXT,
+            PRIMARY KEY (job_id, position)
+        )
+        """
+    )
+    # Workers only ever scan unfinished items, so the index shrinks as jobs complete.
+    await conn.execute(
+        "CREATE INDEX check_job_items_open_idx ON check_job_items (job_id, position) "
+        "WHERE status IN ('pending', 'running')"
+    )
+
+
+MIGRATIONS: list[tuple[int, Callable[[asyncpg.Connection], Awaitable[None]]]] = [
+    (1, _migration_1_initial),
+    (2, _migration_2_partitioned),
+    (3, _migration_3_check_jobs),
+]
+
+
+async def migrate(conn: asyncpg.Connection) -> list[int]:
+    """Apply pending schema migrations in order and return the versions applied."""
+    applied: list[int] = []
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _MIGRATION_LOCK_ID)
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """
+        )
+        rows = await conn.fetch("SELECT version FROM schema_migrations")
+        done = {row["version"] for row in rows}
+        for version, migration in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info("applying database migration %d", version)
+            await migration(conn)
+            await conn.execute("INSERT INTO schema_migrations (version) VALUES ($1)", version)
+            applied.append(version)
+    return applied
+
+
 async def init_db(pool: asyncpg.Pool[Any]) -> None:
+    async with pool.acquire() as conn:
+        await migrate(conn)
+        await ensure_partitions(conn, datetime.now(timezone.utc).date())
+
+
+async def ensure_partitions(conn: asyncpg.Connection, today: date, months_ahead: int = 2) -> None:
+    month = _month_start(today)
+    for _ in range(months_ahead + 1):
+        await _create_month_partition(conn, month)
+        month = _next_month(month)
+
+
+async def drop_expired_partitions(conn: asyncpg.Connection, today: date, retention_days: int) -> list[str]:
+    cutoff = today - timedelta(days=retention_days)
+    rows = await conn.fetch(
+        """
+        SELECT c.relname AS name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'check_requests'
+        """
+    )
+    dropped: list[str] = []
+    for row in rows:
+        match = _PARTITION_RE.match(row["name"])
+        if match is None:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if _next_month(month) <= cutoff:
+            await conn.execute(f"DROP TABLE IF EXISTS {row['name']}")
+            dropped.append(row["name"])
+    return dropped
+
+
+async def refresh_daily_rollup(conn: asyncpg.Connection, day: date, top: int = 10) -> None:
+    await conn.execute(
+        """
+        WITH day_rows AS (
+            SELECT inn, user_id, cache_hit
+            FROM check_requests
+            WHERE created_at >= ($1::date)::timestamp AT TIME ZONE 'UTC'
+              AND created_at < ($1::date + 1)::timestamp AT TIME ZONE 'UTC'
+        ),
+        top_inns AS (
+            SELECT inn, COUNT(*) AS cnt
+            FROM day_rows
+            WHERE inn IS NOT NULL
+            GROUP BY inn
+            ORDER BY cnt DESC, inn
+            LIMIT $2
+        )
+        INSERT INTO check_requests_daily (day, total, unique_users, cache_hits, top_inns, updated_at)
+        SELECT
+            $1::date,
+            (SELECT COUNT(*) FROM day_rows),
+            (SELECT COUNT(DISTINCT user_id) FROM day_rows),
+            (SELECT COUNT(*) FROM day_rows WHERE cache_hit),
+            COALESCE(
+                (SELECT jsonb_agg(jsonb_build_object('inn', inn, 'count', cnt) ORDER BY cnt DESC, inn) FROM top_inns),
+                '[]'::jsonb
+            ),
+            NOW()
+        ON CONFLICT (day) DO UPDATE SET
+            total = EXCLUDED.total,
+            unique_users = EXCLUDED.unique_users,
+            cache_hits = EXCLUDED.cache_hits,
+            top_inns = EXCLUDED.top_inns,
+            updated_at = EXCLUDED.updated_at
+        """,
+        day,
+        top,
+    )
+
+
+async def run_maintenance(pool: asyncpg.Pool[Any], today: date | None = None) -> None:
+    """Roll partitions forward, drop expired ones and refresh yesterday's and today's rollups."""
+    today = today or datetime.now(timezone.utc).date()
+    async with pool.acquire() as conn:
+        await ensure_partitions(conn, today)
+        dropped = await drop_expired_partitions(conn, today, config.REQUESTS_RETENTION_DAYS)
+        if dropped:
+            logger.info("dropped expired request partitions: %s", ", ".join(dropped))
+        for day in (today - timedelta(days=1), today):
+            await refresh_daily_rollup(conn, day)
+
+
+async def fetch_daily_rollups(pool: asyncpg.Pool[Any], days: int) -> list[asyncpg.Record]:
+    async with pool.acquire() as conn:
+        return await conn.fetch(
+            """
+            SELECT day, total, unique_users, cache_hits, top_inns
+            FROM check_requests_daily
+            WHERE day > (NOW() AT TIME ZONE 'UTC')::date - $1::int
+            ORDER BY day DESC
+            """,
+            days,
+        )
+
+
+async def log_request(
+    pool: asyncpg.Pool[Any],
+    query: str,
+    *,
+    query_kind: str = "name",
+    inn: str | None = None,
+    user_id: int | None = None,
+    cache_hit: bool | None = None,
+) -> None:
     async with pool.acquire() as conn:
         await conn.execute(
+            "INSERT INTO check_requests (query, query_kind, inn, user_id, cache_hit) VALUES ($1, $2, $3, $4, $5)",
+            query,
+            query_kind,
+            inn,
+            user_id,
+            cache_hit,
+        )
+
+
+async def iter_requests(
+    pool: asyncpg.Pool[Any],
+    *,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    inn: str | None = None,
+    user_id: int | None = None,
+    prefetch: int = 1000,
+) -> AsyncIterator[asyncpg.Record]:
+    """Stream request history oldest first through a server-side cursor.
+
+    Only `prefetch` rows are held in memory at a time; the connection stays checked out
+    until the iterator is exhausted or closed.
+    """
+    conditions: list[str] = []
+    args: list[Any] = []
+    for condition, value in (
+        ("created_at >= ${}", since),
+        ("created_at < ${}", until),
+        ("inn = ${}", inn),
+        ("user_id = ${}", user_id),
+    ):
+        if value is not None:
+            args.append(value)
+            conditions.append(condition.format(len(args)))
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM check_requests{where} ORDER BY created_at, id"
+    async with pool.acquire() as conn:
+        # Cursors only exist inside a transaction.
+        async with conn.transaction(readonly=True):
+            async for record in conn.cursor(query, *args, prefetch=prefetch):
+                yield record
+
+
+async def create_job(
+    pool: asyncpg.Pool[Any],
+    queries: list[str],
+    *,
+    user_id: int | None = None,
+    chat_id: int | None = None,
+) -> int:
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            job_id = await conn.fetchval(
+                "INSERT INTO check_jobs (user_id, chat_id, total) VALUES ($1, $2, $3) RETURNING id",
+                user_id,
+                chat_id,
+                len(queries),
+            )
+            await conn.copy_records_to_table(
+                "check_job_items",
+                records=[(job_id, position, query) for position, query in enumerate(queries)],
+                columns=("job_id", "position", "query"),
+            )
+    return job_id
+
+
+async def claim_job_items(pool: asyncpg.Pool[Any], limit: int, lease: float) -> list[asyncpg.Record]:
+    """Lease up to `limit` open items, oldest job first.
+
+    SKIP LOCKED lets several workers (in any number of processes) claim disjoint items;
+    items whose lease ran out (their worker died) are claimed again, and items waiting to be
+    retried only once their backoff has passed.
+    """
+    async with pool.acquire() as conn:
+        return await conn.fetch(
             """
-            CREATE TABLE IF NOT EXISTS check_requests (
-                id SERIAL PRIMARY KEY,
-                query TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT NOW()
+            WITH claimed AS (
+                SELECT job_id, position
+                FROM check_job_items
+                WHERE status IN ('pending', 'running')
+                  AND (locked_until IS NULL OR locked_until < NOW())
+                ORDER BY job_id, position
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            ), jobs AS (
+                UPDATE check_jobs SET status = 'running', updated_at = NOW()
+                WHERE id IN (SELECT job_id FROM claimed) AND status = 'queued'
             )
+            UPDATE check_job_items i
+            SET status = 'running', attempts = i.attempts + 1, locked_until = NOW() + make_interval(secs => $2)
+            FROM claimed c
+            WHERE i.job_id = c.job_id AND i.position = c.position
+            RETURNING i.job_id, i.position, i.query, i.attempts
+            """,
+            limit,
+            lease,
+        )
+
+
+async def complete_job_items(
+    pool: asyncpg.Pool[Any],
+    results: list[tuple[int, int, int, str, str | None, str | None, float | None]],
+) -> list[asyncpg.Record]:
+    """Checkpoint `(job_id, position, attempts, status, result_json, error, retry_after)` rows in one statement.
+
+    A `pending` row is not claimed again for `retry_after` seconds.
+
+    A row is only applied if the item is still held by this attempt, so a worker whose
+    lease expired cannot overwrite or double-count a newer attempt. Returns the jobs this
+    batch finished.
+    """
+    if not results:
+        return []
+    columns = list(zip(*results))
+    async with pool.acquire() as conn:
+        return await conn.fetch(
             """
+            WITH results AS (
+                SELECT * FROM unnest(
+                    $1::bigint[], $2::int[], $3::int[], $4::text[], $5::text[], $6::text[], $7::float8[]
+                ) AS r(job_id, position, attempts, status, result, error, retry_after)
+            ), updated AS (
+                UPDATE check_job_items i
+                SET status = r.status,
+                    result = r.result::jsonb,
+                    error = r.error,
+                    locked_until = NOW() + make_interval(secs => r.retry_after)
+                FROM results r
+                WHERE i.job_id = r.job_id AND i.position = r.position
+                  AND i.status = 'running' AND i.attempts = r.attempts
+                RETURNING i.job_id, i.status
+            ), counts AS (
+                SELECT
+                    job_id,
+                    COUNT(*) FILTER (WHERE status <> 'pending') AS done,
+                    COUNT(*) FILTER (WHERE status = 'error') AS failed
+                FROM updated
+                GROUP BY job_id
+            )
+            UPDATE check_jobs j
+            SET done = j.done + c.done,
+                failed = j.failed + c.failed,
+                status = CASE WHEN j.done + c.done >= j.total THEN 'done' ELSE j.status END,
+                finished_at = CASE WHEN j.done + c.done >= j.total THEN NOW() ELSE j.finished_at END,
+                updated_at = NOW()
+            FROM counts c
+            WHERE j.id = c.job_id
+            RETURNING j.id, j.status, j.user_id, j.chat_id, j.total, j.done, j.failed
+            """,
+            *columns,
         )
 
 
-async def log_request(pool: asyncpg.Pool[Any], query: str) -> None:
+async def release_job_items(pool: asyncpg.Pool[Any], items: list[tuple[int, int]]) -> None:
+    """Put claimed `(job_id, position)` items back without spending an attempt."""
+    if not items:
+        return
+    job_ids, positions = zip(*items)
     async with pool.acquire() as conn:
-        await conn.execute("INSERT INTO check_requests (query) VALUES ($1)", query)
+        await conn.execute(
+            """
+            UPDATE check_job_items i
+            SET status = 'pending', attempts = GREATEST(i.attempts - 1, 0), locked_until = NULL
+            FROM unnest($1::bigint[], $2::int[]) AS r(job_id, position)
+            WHERE i.job_id = r.job_id AND i.position = r.position AND i.status = 'running'
+            """,
+            list(job_ids),
+            list(positions),
+        )
+
 
+async def fetch_job(pool: asyncpg.Pool[Any], job_id: int) -> asyncpg.Record | None:
+    async with pool.acquire() as conn:
+        return await conn.fetchrow(
+            """
+            SELECT id, status, user_id, chat_id, total, done, failed, created_at, finished_at
+            FROM check_jobs
+            WHERE id = $1
+            """,
+            job_id,
+        )
+
+
+async def iter_job_items(pool: asyncpg.Pool[Any], job_id: int, prefetch: int = 1000) -> AsyncIterator[asyncpg.Record]:
+    async with pool.acquire() as conn:
+        async with conn.transaction(readonly=True):
+            async for record in conn.cursor(
+                "SELECT position, query, status, result, error FROM check_job_items WHERE job_id = $1 ORDER BY position",
+                job_id,
+                prefetch=prefetch,
+            ):
+                yield record
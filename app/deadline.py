@@ -0,0 +1,53 @@
+"""Time budget of the current update, carried through every await via a context variable.
+
+`UpdateProcessor` opens a scope per update; outbound calls ask `remaining()` and wait no
+longer than that, so a slow dependency cannot keep a user waiting longer than the
+update is allowed to take.  Tasks created inside the scope inherit it; work shared by
+several updates runs under `no_deadline()` and each waiter applies its own budget.
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+import httpx
+
+_deadline: ContextVar[float | None] = ContextVar("update_deadline", default=None)
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """The update ran out of time; handled wherever a network timeout is."""
+
+
+@contextmanager
+def deadline_scope(seconds: float | None) -> Iterator[None]:
+    """Limit everything awaited inside to `seconds` from now (an outer, earlier deadline wins)."""
+    if seconds is None or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def no_deadline() -> Iterator[None]:
+    """Lift the deadline, e.g. around creating a task whose result other updates will await."""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current scope (may be negative), or None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
@@ -0,0 +1,438 @@
+"""Offline EGRUL/EGRIP snapshot: importer for FNS open-data dumps and a memory-mapped reader.
+
+The snapshot directory contains two files:
+
+* ``parties.dat`` — compact JSON records, one after another;
+* ``index.bin``   — header + fixed-width entries ``(key, offset, length)`` sorted by key,
+  where the key is an INN, OGRN or OGRNIP.  Lookups are a binary search over the mmap.
+
+Usage::
+
+    python -m app.egrul OUT_DIR dump1.xml dump2.csv ...
+"""
+
+from __future__ import annotations
+
+import codecs
+import csv
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterable, Iterator
+
+if TYPE_CHECKING:
+    import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+DATA_FILE = "parties.dat"
+INDEX_FILE = "index.bin"
+SNAPSHOT_SOURCE = "egrul"
+
+_MAGIC = b"EGRIDX01"
+_HEADER = struct.Struct("<8sQ")
+_ENTRY = struct.Struct("<15sQI")
+_READ_CHUNK = 1 << 20
+_SORT_CHUNK = 1_000_000
+
+CSV_FIELDS = (
+    "type",
+    "inn",
+    "ogrn",
+    "kpp",
+    "name_full",
+    "name_short",
+    "status",
+    "registration_date",
+    "address",
+    "management_name",
+    "management_post",
+    "okved",
+)
+
+
+def _index_key(value: str) -> bytes | None:
+    digits = value.strip()
+    if not digits.isdigit() or len(digits) not in (10, 12, 13, 15):
+        return None
+    return digits.encode("ascii").ljust(15, b" ")
+
+
+# ---------------------------------------------------------------------------
+# Parsing FNS dumps
+# ---------------------------------------------------------------------------
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find(element: ET.Element, *path: str) -> ET.Element | None:
+    current: ET.Element | None = element
+    for name in path:
+        if current is None:
+            return None
+        current = next((child for child in current if _local(child.tag) == name), None)
+    return current
+
+
+def _attr(element: ET.Element | None, name: str) -> str:
+    return (element.get(name) or "").strip() if element is not None else ""
+
+
+def _status_from_xml(element: ET.Element, terminated_tag: str) -> str:
+    if _find(element, terminated_tag) is not None:
+        return "LIQUIDATED"
+    status = _find(element, "СвСтатус", "СвСтатус")
+    text = _attr(status, "НаимСтатусЮЛ").lower() or _attr(status, "НаимСтатус").lower()
+    if "банкрот" in text:
+        return "BANKRUPT"
+    if "ликвид" in text:
+        return "LIQUIDATING"
+    if "реорганиз" in text:
+        return "REORGANIZING"
+    return "ACTIVE"
+
+
+def _address_from_xml(element: ET.Element) -> str:
+    address = _find(element, "СвАдресЮЛ", "АдресРФ")
+    if address is not None:
+        parts = [_attr(address, "Индекс")]
+        for name, type_attr, value_attr in (
+            ("Регион", "ТипРегион", "НаимРегион"),
+            ("Район", "ТипРайон", "НаимРайон"),
+            ("Город", "ТипГород", "НаимГород"),
+            ("НаселПункт", "ТипНаселПункт", "НаимНаселПункт"),
+            ("Улица", "ТипУлица", "НаимУлица"),
+        ):
+            part = _find(address, name)
+            text = " ".join(p for p in (_attr(part, type_attr), _attr(part, value_attr)) if p)
+            parts.append(text)
+        parts.extend(_attr(address, attr) for attr in ("Дом", "Корпус", "Кварт"))
+        return ", ".join(part for part in parts if part)
+
+    fias = _find(element, "СвАдресЮЛ", "СвАдрЮЛФИАС")
+    if fias is not None:
+        parts = [_attr(fias, "Индекс")]
+        for child in fias.iter():
+            if child is fias:
+                continue
+            parts.extend(value.strip() for value in child.attrib.values() if value and not value.isdigit())
+        return ", ".join(part for part in parts if part)
+    return ""
+
+
+def _person_name(element: ET.Element | None) -> str:
+    return " ".join(p for p in (_attr(element, "Фамилия"), _attr(element, "Имя"), _attr(element, "Отчество")) if p)
+
+
+def _legal_record(element: ET.Element) -> dict[str, Any]:
+    names = _find(element, "СвНаимЮЛ")
+    manager = _find(element, "СведДолжнФЛ")
+    management_name = _person_name(_find(manager, "СвФЛ")) if manager is not None else ""
+    management_post = _attr(_find(manager, "СвДолжн"), "НаимДолжн") if manager is not None else ""
+    if not management_name:
+        managing_org = _find(element, "СвУпрОрг", "НаимИННЮЛ")
+        management_name = _attr(managing_org, "НаимЮЛПолн")
+        management_post = "Управляющая организация" if management_name else ""
+    return {
+        "type": "LEGAL",
+        "inn": _attr(element, "ИНН"),
+        "ogrn": _attr(element, "ОГРН"),
+        "kpp": _attr(element, "КПП"),
+        "name_full": _attr(names, "НаимЮЛПолн"),
+        "name_short": _attr(_find(names, "СвНаимЮЛСокр"), "НаимСокр") if names is not None else "",
+        "status": _status_from_xml(element, "СвПрекрЮЛ"),
+        "registration_date": _attr(element, "ДатаОГРН"),
+        "address": _address_from_xml(element),
+        "management_name": management_name,
+        "management_post": management_post,
+        "okved": _attr(_find(element, "СвОКВЭД", "СвОКВЭДОсн"), "КодОКВЭД"),
+    }
+
+
+def _individual_record(element: ET.Element) -> dict[str, Any]:
+    fio = _person_name(_find(element, "СвФЛ", "ФИОРус"))
+    return {
+        "type": "INDIVIDUAL",
+        "inn": _attr(element, "ИННФЛ"),
+        "ogrn": _attr(element, "ОГРНИП"),
+        "kpp": "",
+        "name_full": f"Индивидуальный предприниматель {fio}".strip(),
+        "name_short": f"ИП {fio}".strip(),
+        "status": _status_from_xml(element, "СвПрекрИП"),
+        "registration_date": _attr(element, "ДатаОГРНИП"),
+        "address": "",
+        "management_name": "",
+        "management_post": "",
+        "okved": _attr(_find(element, "СвОКВЭД", "СвОКВЭДОсн"), "КодОКВЭД"),
+    }
+
+
+def iter_xml_records(path: str | Path) -> Iterator[dict[str, Any]]:
+    # The XML parser is only needed by the importer, not to serve lookups.
+    import xml.etree.ElementTree as ET
+
+    events = ET.iterparse(str(path), events=("start", "end"))
+    _, root = next(events)
+    for event, element in events:
+        if event != "end":
+            continue
+        tag = _local(element.tag)
+        if tag == "СвЮЛ":
+            yield _legal_record(element)
+        elif tag == "СвИП":
+            yield _individual_record(element)
+        else:
+            continue
+        # Drop processed documents so memory stays flat on multi-gigabyte dumps.
+        root.clear()
+
+
+def iter_csv_records(path: str | Path) -> Iterator[dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        sample = fh.read(4096)
+        fh.seek(0)
+        try:
+            dialect: type[csv.Dialect] | csv.Dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        for row in csv.DictReader(fh, dialect=dialect):
+            record = {field: (row.get(field) or "").strip() for field in CSV_FIELDS}
+            record["type"] = record["type"].upper() or ("INDIVIDUAL" if len(record["inn"]) == 12 else "LEGAL")
+            record["status"] = record["status"].upper() or "ACTIVE"
+            yield record
+
+
+def iter_dump_records(paths: Iterable[str | Path]) -> Iterator[dict[str, Any]]:
+    for path in paths:
+        suffix = Path(path).suffix.lower()
+        if suffix == ".xml":
+            yield from iter_xml_records(path)
+        elif suffix in {".csv", ".tsv", ".txt"}:
+            yield from iter_csv_records(path)
+        else:
+            logger.warning("skipping %s: unsupported dump format", path)
+
+
+# ---------------------------------------------------------------------------
+# Building the snapshot
+# ---------------------------------------------------------------------------
+
+
+def _compact(record: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in record.items() if value}
+
+
+def _flush_chunk(entries: list[bytes], tmp_dir: str) -> str:
+    entries.sort()
+    fd, path = tempfile.mkstemp(dir=tmp_dir, suffix=".idx")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(b"".join(entries))
+    entries.clear()
+    return path
+
+
+def _read_entries(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as fh:
+        while chunk := fh.read(_ENTRY.size):
+            yield chunk
+
+
+def _write_index(chunk_paths: list[str], out: BinaryIO) -> int:
+    out.write(_HEADER.pack(_MAGIC, 0))
+    count = 0
+    previous_key: bytes | None = None
+    for entry in heapq.merge(*(_read_entries(path) for path in chunk_paths)):
+        key = entry[:15]
+        if key == previous_key:
+            # Duplicate INN/OGRN across dump files: the first (smallest offset) record wins.
+            continue
+        previous_key = key
+        out.write(entry)
+        count += 1
+    out.seek(0)
+    out.write(_HEADER.pack(_MAGIC, count))
+    return count
+
+
+def build_snapshot(records: Iterable[dict[str, Any]], out_dir: str | Path) -> int:
+    """Write records into `out_dir` and return the number of indexed keys."""
+    out_path = Path(out_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+    entries: list[bytes] = []
+    chunk_paths: list[str] = []
+    with tempfile.TemporaryDirectory(dir=out_path) as tmp_dir:
+        with open(out_path / DATA_FILE, "wb") as data:
+            offset = 0
+            for record in records:
+                keys = {key for key in (_index_key(record.get("inn", "")), _index_key(record.get("ogrn", ""))) if key}
+                if not keys:
+                    continue
+                blob = json.dumps(_compact(record), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                data.write(blob)
+                for key in keys:
+                    entries.append(_ENTRY.pack(key, offset, len(blob)))
+                offset += len(blob)
+                if len(entries) >= _SORT_CHUNK:
+                    chunk_paths.append(_flush_chunk(entries, tmp_dir))
+        if entries:
+            chunk_paths.append(_flush_chunk(entries, tmp_dir))
+        with open(out_path / INDEX_FILE, "wb") as index:
+            return _write_index(chunk_paths, index)
+
+
+# ---------------------------------------------------------------------------
+# Reading the snapshot
+# ---------------------------------------------------------------------------
+
+
+def _registration_ms(value: str) -> int | str:
+    try:
+        parsed = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return value
+    return int(parsed.timestamp() * 1000)
+
+
+def to_suggestion(record: dict[str, Any]) -> dict[str, Any]:
+    """Shape a snapshot record like a DaData party suggestion (basic card fields only)."""
+    name_short = record.get("name_short") or record.get("name_full") or ""
+    data: dict[str, Any] = {
+        "inn": record.get("inn"),
+        "ogrn": record.get("ogrn"),
+        "kpp": record.get("kpp"),
+        "type": record.get("type"),
+        "name": {
+            "full_with_opf": record.get("name_full") or name_short,
+            "short_with_opf": name_short,
+        },
+        "state": {
+            "status": record.get("status") or "ACTIVE",
+            "registration_date": _registration_ms(record.get("registration_date") or ""),
+        },
+        "okved": record.get("okved"),
+    }
+    if record.get("address"):
+        data["address"] = {"value": record["address"]}
+    if record.get("management_name"):
+        data["management"] = {"name": record["management_name"], "post": record.get("management_post")}
+    return {"value": name_short, "data": data, "source": SNAPSHOT_SOURCE}
+
+
+def _size(fh: BinaryIO) -> int:
+    return os.fstat(fh.fileno()).st_size
+
+
+class EgrulSnapshot:
+    def __init__(self, directory: str | Path) -> None:
+        directory = Path(directory)
+        self._data_file = open(directory / DATA_FILE, "rb")
+        self._index_file = open(directory / INDEX_FILE, "rb")
+        self._data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ) if _size(self._data_file) else b""
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._index, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{directory / INDEX_FILE} is not an EGRUL snapshot index")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, position: int) -> tuple[bytes, int, int]:
+        return _ENTRY.unpack_from(self._index, _HEADER.size + position * _ENTRY.size)
+
+    def lookup(self, query: str) -> dict[str, Any] | None:
+        key = _index_key(query)
+        if key is None:
+            return None
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count:
+            return None
+        found, offset, length = self._entry(low)
+        if found != key:
+            return None
+        return json.loads(self._data[offset : offset + length])
+
+    def suggestion(self, query: str) -> dict[str, Any] | None:
+        record = self.lookup(query)
+        return to_suggestion(record) if record is not None else None
+
+    def iter_records(self) -> Iterator[dict[str, Any]]:
+        """Every record once, in file order; reads the data file in chunks."""
+        decoder = json.JSONDecoder()
+        text = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        for start in range(0, len(self._data), _READ_CHUNK):
+            buffer += text.decode(self._data[start : start + _READ_CHUNK])
+            position = 0
+            while position < len(buffer):
+                try:
+                    record, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    break  # the record continues in the next chunk
+                yield record
+            buffer = buffer[position:]
+        if buffer.strip():
+            raise ValueError(f"{DATA_FILE} ends with a truncated record")
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._index.close()
+        self._data_file.close()
+        self._index_file.close()
+
+
+_snapshot: EgrulSnapshot | None = None
+_snapshot_dir: str | None = None
+_failed_dir: str | None = None
+
+
+def get_snapshot(directory: str) -> EgrulSnapshot | None:
+    """Open (once) and return the snapshot in `directory`, or None if it is unusable."""
+    global _snapshot, _snapshot_dir, _failed_dir
+    if not directory or directory == _failed_dir:
+        return None
+    if _snapshot is not None and _snapshot_dir == directory:
+        return _snapshot
+    try:
+        snapshot = EgrulSnapshot(directory)
+    except (OSError, ValueError) as exc:
+        logger.warning("EGRUL snapshot in %s is unavailable: %s", directory, exc)
+        _failed_dir = directory
+        return None
+    if _snapshot is not None:
+        _snapshot.close()
+    _snapshot, _snapshot_dir = snapshot, directory
+    logger.info("EGRUL snapshot loaded from %s (%d keys)", directory, len(snapshot))
+    return snapshot
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) < 2:
+        print("usage: python -m app.egrul OUT_DIR DUMP [DUMP ...]", file=sys.stderr)
+        return 2
+    logging.basicConfig(level=logging.INFO)
+    out_dir, paths = args[0], args[1:]
+    count = build_snapshot(iter_dump_records(paths), out_dir)
+    print(f"indexed {count} INN/OGRN keys into {out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,52 @@
+"""Serialize request history rows to CSV or NDJSON, chunk by chunk."""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, AsyncIterable, AsyncIterator, Mapping, Sequence
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+# Rows per yielded chunk: large enough to keep writes cheap, small enough to stay flat.
+_CHUNK_ROWS = 500
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+async def export_chunks(
+    rows: AsyncIterable[Mapping[str, Any]],
+    columns: Sequence[str],
+    fmt: str,
+    chunk_rows: int = _CHUNK_ROWS,
+) -> AsyncIterator[str]:
+    """Yield the export as text chunks; for CSV the first chunk holds the header."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unsupported export format: {fmt}")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(columns)
+    pending = 0
+    async for row in rows:
+        if writer is not None:
+            writer.writerow(["" if row[column] is None else _plain(row[column]) for column in columns])
+        else:
+            record = {column: _plain(row[column]) for column in columns}
+            buffer.write(json.dumps(record, ensure_ascii=False) + "\n")
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
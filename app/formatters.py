@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+import json
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Iterable, Mapping
 
 _MARKDOWN_SPECIAL_CHARS = "_*`["
 _STATUS_LABELS = {
@@ -28,6 +29,13 @@ def _status_label(status: str) -> str:
     return _STATUS_LABELS.get(status, status or "—")
 
 
+def number_label(number: str) -> str:
+    """ИНН, ОГРН or ОГРНИП (15 digits, sole proprietors), by the length of `number`."""
+    if len(number) in {10, 12}:
+        return "ИНН"
+    return "ОГРНИП" if len(number) == 15 else "ОГРН"
+
+
 def _format_date(val: Any) -> str:
     """Convert DaData registration_date (ms timestamp or date string) to DD.MM.YYYY."""
     if val is None or val == "":
@@ -63,10 +71,11 @@ def format_card(suggestion: dict[str, Any]) -> str:
     name = _s(name_obj.get("short_with_opf") or name_obj.get("short") or suggestion.get("value"), "—")
 
     state = data.get("state") or {}
+    ogrn = _s(data.get("ogrn"), "—")
     lines = [
         f"🏢 *{_md(name)}*",
         f"Статус: *{_md(_status_label(_s(state.get('status'), '—')))}*",
-        f"ИНН: `{_md(_s(data.get('inn'), '—'))}` | ОГРН: `{_md(_s(data.get('ogrn'), '—'))}` | КПП: `{_md(_s(data.get('kpp'), '—'))}`",
+        f"ИНН: `{_md(_s(data.get('inn'), '—'))}` | {number_label(ogrn)}: `{_md(ogrn)}` | КПП: `{_md(_s(data.get('kpp'), '—'))}`",
         f"Регистрация: *{_md(_format_date(state.get('registration_date')))}*",
         f"Адрес: {_md(_short_address(data))}",
         f"Руководитель: {_md(_s((data.get('management') or {}).get('name'), '—'))}",
@@ -81,10 +90,11 @@ def format_requisites(suggestion: dict[str, Any]) -> str:
     name_obj = data.get("name") or {}
     name = _s(name_obj.get("full_with_opf") or name_obj.get("short_with_opf") or suggestion.get("value"), "—")
     name_clean = name.replace("`", "'")
+    ogrn = _s(data.get("ogrn"), "—")
     lines = [
         f"Наименование: {name_clean}",
         f"ИНН: {_s(data.get('inn'), '—')}",
-        f"ОГРН: {_s(data.get('ogrn'), '—')}",
+        f"{number_label(ogrn)}: {ogrn}",
         f"КПП: {_s(data.get('kpp'), '—')}",
         f"Адрес: {_s((data.get('address') or {}).get('value'), '—')}",
     ]
@@ -138,6 +148,45 @@ def format_founders(suggestion: dict[str, Any]) -> str:
     return "\n".join(lines)
 
 
+def format_affiliates(graph: Any) -> str:
+    """Compact tree of an `AffiliateGraph`: companies 🏢 and people 👤 with their role."""
+    lines = ["🔗 *Связи*"]
+    if not graph.root.children:
+        lines.append("Связанные компании не найдены.")
+
+    def walk(node: Any, prefix: str) -> None:
+        for position, child in enumerate(node.children):
+            last = position == len(node.children) - 1
+            icon = "🏢" if child.kind == "company" else "👤"
+            details = [child.role] if child.role else []
+            if child.status and child.status != "ACTIVE":
+                details.append(_status_label(child.status))
+            suffix = f" — {', '.join(details)}" if details else ""
+            inn = f" `{child.key}`" if child.kind == "company" else ""
+            lines.append(f"{prefix}{'└' if last else '├'} {icon} {_md(child.name)}{inn}{_md(suffix)}")
+            walk(child, prefix + ("   " if last else "│  "))
+
+    walk(graph.root, "")
+
+    def footer(truncated: bool) -> str:
+        text = f"Узлов: {graph.nodes}, {graph.elapsed:.1f} с"
+        if truncated:
+            text += " · показана часть связей (лимит узлов или времени)"
+        if graph.failed:
+            text += f" · не загрузилось: {graph.failed}"
+        if graph.affiliated_unavailable:
+            text += " · связи через людей недоступны на текущем тарифе DaData"
+        return f"_{_md(text)}_"
+
+    # Cutting inside a line could split a `code` span and break the Markdown, so whole
+    # tree lines are dropped from the end until the message fits.
+    truncated = graph.truncated
+    while len("\n".join([*lines, footer(truncated)])) > 3500 and len(lines) > 1:
+        lines.pop()
+        truncated = True
+    return "\n".join([*lines, footer(truncated)])
+
+
 def format_turnover(suggestion: dict[str, Any]) -> str:
     finance = (suggestion.get("data") or {}).get("finance") or {}
     lines = ["💰 *Оборот и финансы*"]
@@ -235,3 +284,121 @@ def format_branch(branch: dict[str, Any]) -> str:
     if address:
         parts.append(f"📍 {_md(address)}")
     return "\n".join(parts)
+
+
+def format_batch_summary(rows: Iterable[tuple[str, dict[str, Any] | None, str | None]]) -> str:
+    """One line per checked number: `(number, suggestion or None, error text or None)`."""
+    lines = ["📋 *Результаты проверки*"]
+    for position, (number, suggestion, error) in enumerate(rows, start=1):
+        if suggestion is None:
+            lines.append(f"{position}. `{_md(number)}` — {_md(error or 'не найдено')}")
+            continue
+        data = suggestion.get("data") or {}
+        name_obj = data.get("name") or {}
+        name = _s(name_obj.get("short_with_opf") or name_obj.get("short") or suggestion.get("value"), "—")
+        status = _status_label(_s((data.get("state") or {}).get("status"), "—"))
+        lines.append(f"{position}. `{_md(number)}` — *{_md(name)}*, {_md(status)}")
+    text = "\n".join(lines)
+    return text[:3497] + "…" if len(text) > 3500 else text
+
+
+_JOB_STATUS_LABELS = {"queued": "в очереди", "running": "выполняется", "done": "готово"}
+
+
+def format_job_status(job: Mapping[str, Any]) -> str:
+    total = int(job["total"] or 0)
+    done = int(job["done"] or 0)
+    percent = done * 100 // total if total else 100
+    status = _JOB_STATUS_LABELS.get(job["status"], _s(job["status"]))
+    text = f"📦 Задание #{job['id']}: {status}, проверено {done} из {total} ({percent}%)"
+    if job["failed"]:
+        text += f", ошибок: {job['failed']}"
+    return text
+
+
+def format_daily_report(rows: Iterable[Mapping[str, Any]]) -> str:
+    rows = list(rows)
+    lines = ["📊 *Отчёт по запросам*"]
+    if not rows:
+        lines.append("Данных за период нет.")
+        return "\n".join(lines)
+
+    top_total: dict[str, int] = {}
+    for row in rows:
+        total = int(row["total"] or 0)
+        hits = int(row["cache_hits"] or 0)
+        hit_rate = f"{hits * 100 // total}%" if total else "—"
+        day = row["day"]
+        day_text = day.strftime("%d.%m.%Y") if hasattr(day, "strftime") else str(day)
+        lines.append(f"{_md(day_text)}: {total} запр., {int(row['unique_users'] or 0)} польз., кэш {hit_rate}")
+
+        top_inns = row["top_inns"] or []
+        if isinstance(top_inns, str):
+            top_inns = json.loads(top_inns)
+        for item in top_inns:
+            inn = str(item.get("inn") or "")
+            if inn:
+                top_total[inn] = top_total.get(inn, 0) + int(item.get("count") or 0)
+
+    if top_total:
+        lines.append("")
+        lines.append("Топ ИНН:")
+        for inn, count in sorted(top_total.items(), key=lambda item: (-item[1], item[0]))[:10]:
+            lines.append(f"• `{_md(inn)}` — {count}")
+    return "\n".join(lines)
+
+
+def _format_ms(seconds: float | None) -> str:
+    return "—" if seconds is None else f"{seconds * 1000:.0f} мс"
+
+
+def format_stats(snapshot: Mapping[str, Any]) -> str:
+    rates = snapshot["request_rates"]
+    latency = snapshot["dadata_latency"]
+    lines = [
+        "📈 *Нагрузка*",
+        "Запросов/мин: " + " / ".join(f"{rates[m] * 60:.1f}" for m in (1, 5, 15)) + " (1/5/15 мин)",
+        f"Всего запросов: {snapshot['requests_total']}",
+        f"Отклонено rate limit: {snapshot['rate_limited_15m']} за 15 мин, {snapshot['rate_limited_total']} всего",
+        "DaData p50/p95/p99: " + " / ".join(_format_ms(latency[q]) for q in (0.5, 0.95, 0.99)),
+    ]
+    hedges = snapshot.get("dadata_hedges") or {}
+    if hedges.get("fired"):
+        lines.append(f"Дублирующих запросов DaData: {hedges['fired']}, ответили первыми: {hedges['won']}")
+    if snapshot.get("lookups_superseded") or snapshot.get("dadata_coalesced"):
+        lines.append(
+            f"Поисков заменено новым запросом: {snapshot['lookups_superseded']}, "
+            f"запросов DaData объединено: {snapshot['dadata_coalesced']}, отменено: {snapshot['dadata_cancelled']}"
+        )
+    loop_lag = snapshot.get("loop_lag")
+    if loop_lag is not None:
+        lines.append(
+            "Задержка event loop p50/p99/max: " + " / ".join(_format_ms(loop_lag[q]) for q in (0.5, 0.99, 1.0))
+        )
+    if snapshot.get("slow_handlers_15m"):
+        names = ", ".join(f"{name} ({count})" for name, count in snapshot["slow_handlers"])
+        lines.append(f"Медленных обработчиков за 15 мин: {snapshot['slow_handlers_15m']} — {_md(names)}")
+    for name, cache in snapshot["caches"].items():
+        ratio = "—" if cache["ratio"] is None else f"{cache['ratio'] * 100:.0f}%"
+        lines.append(f"Кэш {_md(name)}: {ratio} ({cache['hits']}/{cache['total']})")
+    calls = snapshot.get("telegram_calls") or {}
+    lookups = sum(calls.values())
+    if lookups:
+        average = sum(count * n for count, n in calls.items()) / lookups
+        shares = ", ".join(f"{count}: {n * 100 // lookups}%" for count, n in calls.items())
+        lines.append(f"Вызовов Telegram на поиск: {average:.2f} ({_md(shares)})")
+    keys = snapshot.get("dadata_keys") or {}
+    if len(keys) > 1:
+        lines.append("Ключи DaData:")
+        for name, key in keys.items():
+            state = f", пауза {key['ejected_for']:.0f} с" if key["ejected_for"] else ""
+            left = f", осталось {key['remaining']}" if key["remaining"] is not None else ""
+            lines.append(
+                f"• `{_md(name)}` — сегодня {key['used_today']}{left}, "
+                f"ошибок {key['failures']}{state}"
+            )
+    if snapshot["top_inns"]:
+        lines.append("Топ ИНН:")
+        for inn, count in snapshot["top_inns"]:
+            lines.append(f"• `{_md(inn)}` — {count}")
+    return "\n".join(lines)
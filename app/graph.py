@@ -0,0 +1,202 @@
+"""Related companies of a party: breadth-first walk over founders and managers.
+
+Companies are linked through legal-entity founders (`findById/party`) and through people
+who found or manage other companies (`findAffiliated/party`). Every INN is visited once,
+responses go through the shared DaData cache, and the walk stops at a depth, node and
+time budget, returning whatever it has collected so far. A 403 from `findAffiliated/party`
+means the plan does not include it: the walk then goes on through founders only.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterator
+
+import httpx
+
+from app.config import config
+from app.dadata_client import find_affiliated_party, find_by_id_party
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GraphNode:
+    key: str
+    name: str
+    kind: str  # "company" or "person"
+    role: str = ""
+    status: str = ""
+    children: list[GraphNode] = field(default_factory=list)
+
+
+@dataclass
+class AffiliateGraph:
+    root: GraphNode
+    nodes: int = 1
+    truncated: bool = False
+    failed: int = 0
+    elapsed: float = 0.0
+    affiliated_unavailable: bool = False
+
+
+def _person_name(item: dict[str, Any]) -> str:
+    fio = item.get("fio") or {}
+    parts = [fio.get("surname"), fio.get("name"), fio.get("patronymic")]
+    return " ".join(part for part in parts if part) or fio.get("source") or item.get("name") or ""
+
+
+def _relations(data: dict[str, Any]) -> Iterator[tuple[str, str, str, str]]:
+    """`(kind, inn, name, role)` for every founder and manager with an INN."""
+    for founder in data.get("founders") or []:
+        inn = str(founder.get("inn") or "")
+        if not inn:
+            continue
+        if founder.get("type") == "LEGAL" or len(inn) == 10:
+            yield "company", inn, founder.get("name") or inn, "учредитель"
+        else:
+            yield "person", inn, _person_name(founder) or inn, "учредитель"
+    for manager in data.get("managers") or []:
+        inn = str(manager.get("inn") or "")
+        if not inn:
+            continue
+        role = (manager.get("post") or "руководитель").lower()
+        if manager.get("type") == "LEGAL" or len(inn) == 10:
+            yield "company", inn, manager.get("name") or inn, "управляющая компания"
+        else:
+            yield "person", inn, _person_name(manager) or inn, role
+
+
+def _company(suggestion: dict[str, Any]) -> tuple[GraphNode, dict[str, Any]]:
+    data = suggestion.get("data") or {}
+    name_obj = data.get("name") or {}
+    node = GraphNode(
+        key=str(data.get("inn") or data.get("ogrn") or ""),
+        name=name_obj.get("short_with_opf") or suggestion.get("value") or "",
+        kind="company",
+        status=str((data.get("state") or {}).get("status") or ""),
+    )
+    return node, data
+
+
+class _Walk:
+    def __init__(self, graph: AffiliateGraph, max_nodes: int, concurrency: int, deadline: float) -> None:
+        self.graph = graph
+        self.max_nodes = max_nodes
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.deadline = deadline
+        self.seen = {graph.root.key}
+
+    def add(self, parent: GraphNode, child: GraphNode) -> bool:
+        if not child.key or child.key in self.seen:
+            return False
+        if self.graph.nodes >= self.max_nodes:
+            self.graph.truncated = True
+            return False
+        self.seen.add(child.key)
+        parent.children.append(child)
+        self.graph.nodes += 1
+        return True
+
+    async def fetch_all(
+        self,
+        nodes: list[GraphNode],
+        fetch: Callable[[str], Awaitable[dict[str, Any]]],
+    ) -> list[tuple[GraphNode, dict[str, Any]]]:
+        """Fetch every node with bounded concurrency; drop failures and whatever misses the deadline."""
+
+        async def _one(node: GraphNode) -> dict[str, Any]:
+            async with self.semaphore:
+                return await fetch(node.key)
+
+        if not nodes:
+            return []
+        tasks = [asyncio.create_task(_one(node)) for node in nodes]
+        _, pending = await asyncio.wait(tasks, timeout=max(self.deadline - time.monotonic(), 0))
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.graph.truncated = True
+        results = []
+        for node, task in zip(nodes, tasks):
+            if task in pending:
+                continue
+            if task.exception() is not None:
+                self.graph.failed += 1
+                logger.debug("affiliates lookup failed for %s: %s", node.key, task.exception())
+                continue
+            results.append((node, task.result()))
+        return results
+
+
+async def explore_affiliates(
+    api_key: str,
+    party: dict[str, Any],
+    *,
+    max_depth: int | None = None,
+    max_nodes: int | None = None,
+    concurrency: int | None = None,
+    time_budget: float | None = None,
+) -> AffiliateGraph:
+    """Collect companies related to `party` up to `max_depth` company hops away."""
+    max_depth = config.GRAPH_MAX_DEPTH if max_depth is None else max_depth
+    started = time.monotonic()
+    root, root_data = _company(party)
+    graph = AffiliateGraph(root)
+    walk = _Walk(
+        graph,
+        max_nodes=config.GRAPH_MAX_NODES if max_nodes is None else max_nodes,
+        concurrency=config.GRAPH_CONCURRENCY if concurrency is None else concurrency,
+        deadline=started + (config.GRAPH_TIME_BUDGET if time_budget is None else time_budget),
+    )
+
+    async def affiliated(inn: str) -> dict[str, Any]:
+        try:
+            return await find_affiliated_party(api_key, inn)
+        except httpx.HTTPStatusError as exc:
+            if exc.response.status_code != 403:
+                raise
+            graph.affiliated_unavailable = True
+            return {}
+
+    frontier = [(root, root_data)]
+    for depth in range(1, max_depth + 1):
+        if time.monotonic() >= walk.deadline:
+            graph.truncated = True
+            break
+        people: list[GraphNode] = []
+        founder_companies: list[GraphNode] = []
+        next_frontier: list[tuple[GraphNode, dict[str, Any]]] = []
+        for node, data in frontier:
+            for kind, inn, name, role in _relations(data):
+                child = GraphNode(key=inn, name=name, kind=kind, role=role)
+                if walk.add(node, child):
+                    (people if kind == "person" else founder_companies).append(child)
+
+        if graph.affiliated_unavailable:
+            people = []
+        for person, response in await walk.fetch_all(people, affiliated):
+            for suggestion in response.get("suggestions") or []:
+                company, data = _company(suggestion)
+                if walk.add(person, company):
+                    next_frontier.append((company, data))
+
+        # Legal-entity founders only need their own card if the walk goes deeper.
+        if depth < max_depth:
+            fetched = await walk.fetch_all(founder_companies, lambda inn: find_by_id_party(api_key, inn, count=1))
+            for company, response in fetched:
+                suggestions = response.get("suggestions") or []
+                if suggestions:
+                    _, data = _company(suggestions[0])
+                    company.status = str((data.get("state") or {}).get("status") or "")
+                    next_frontier.append((company, data))
+
+        frontier = next_frontier
+        if not frontier:
+            break
+
+    graph.elapsed = time.monotonic() - started
+    return graph
@@ -0,0 +1,127 @@
+"""Readiness snapshot computed in the background and served from memory by `/ready`."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable
+
+from app import bot as bot_module
+from app import dadata_client
+from app.config import config
+from app.dadata_keys import key_pool
+from app.db import postgres_enabled
+from app.loop_monitor import lag_probe
+from app.updates import UpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+DB_PROBE_TIMEOUT_SEC = 2.0
+# DaData answers 401/403 when the key is wrong or the plan limit is exhausted.
+_DADATA_KEY_REJECTED = {401, 403}
+
+
+class HealthMonitor:
+    def __init__(self, updates: UpdateProcessor, *, bot_configured: Callable[[], bool]) -> None:
+        self._updates = updates
+        self._bot_configured = bot_configured
+        self._snapshot: dict[str, Any] | None = None
+
+    @property
+    def snapshot(self) -> dict[str, Any] | None:
+        return self._snapshot
+
+    async def current(self) -> dict[str, Any]:
+        if self._snapshot is None:
+            return await self.refresh()
+        return self._snapshot
+
+    async def refresh(self) -> dict[str, Any]:
+        checks = {
+            "bot": self._check_bot(),
+            "db": await self._check_db(),
+            "dadata": self._check_dadata(),
+            "updates": self._check_updates(),
+            "loop": self._check_loop(),
+        }
+        self._snapshot = {
+            "ready": all(check["ok"] for check in checks.values()),
+            "checked_at": time.time(),
+            "checks": checks,
+        }
+        return self._snapshot
+
+    async def run(self, interval: float) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("failed to refresh health snapshot")
+            await asyncio.sleep(interval)
+
+    def _check_bot(self) -> dict[str, Any]:
+        token_set = bool((config.TELEGRAM_BOT_TOKEN or "").strip())
+        dadata_set = bool((config.DADATA_API_KEY or "").strip())
+        configured = self._bot_configured()
+        return {
+            "ok": configured and dadata_set,
+            "telegram_token": token_set,
+            "dadata_key": dadata_set,
+            "webhook_url": bool((config.WEBHOOK_URL or "").strip()),
+        }
+
+    async def _check_db(self) -> dict[str, Any]:
+        if not postgres_enabled():
+            return {"ok": True, "enabled": False}
+
+        pool = bot_module.db_pool
+        if pool is None:
+            return {"ok": False, "enabled": True, "error": "pool is not initialized"}
+
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        max_size = pool.get_max_size()
+        result: dict[str, Any] = {
+            "enabled": True,
+            "size": size,
+            "idle": idle,
+            "max_size": max_size,
+            "saturation": round((size - idle) / max_size, 3) if max_size else 0.0,
+        }
+        try:
+            async with pool.acquire(timeout=DB_PROBE_TIMEOUT_SEC) as conn:
+                await conn.fetchval("SELECT 1", timeout=DB_PROBE_TIMEOUT_SEC)
+        except Exception as exc:
+            result.update(ok=False, error=type(exc).__name__)
+        else:
+            result["ok"] = True
+        return result
+
+    def _check_dadata(self) -> dict[str, Any]:
+        stats = dadata_client.stats.as_dict()
+        if len(key_pool) > 1:
+            # One rejected key is ejected from the pool; only an empty pool is fatal.
+            key_rejected = key_pool.available() == 0
+        else:
+            key_rejected = stats["last_status"] in _DADATA_KEY_REJECTED
+        failing = stats["consecutive_failures"] >= config.DADATA_FAILURE_THRESHOLD
+        return {"ok": not key_rejected and not failing, **stats, "keys": key_pool.as_dict()}
+
+    def _check_updates(self) -> dict[str, Any]:
+        max_tasks = self._updates.max_tasks
+        waiting = self._updates.waiting
+        return {
+            "ok": waiting < max_tasks,
+            "in_flight": self._updates.in_flight,
+            "waiting": waiting,
+            "max_tasks": max_tasks,
+        }
+
+    def _check_loop(self) -> dict[str, Any]:
+        worst = lag_probe.take_max()
+        return {
+            "ok": worst < config.LOOP_LAG_UNHEALTHY,
+            "lag": round(lag_probe.last, 4),
+            "max_lag": round(worst, 4),
+        }
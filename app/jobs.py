@@ -0,0 +1,151 @@
+"""Durable batch checks: a worker that drains `check_job_items` through the DaData client.
+
+Jobs survive restarts because every item lives in Postgres: a worker leases a batch,
+looks it up with bounded concurrency and checkpoints the results in one statement.
+Items of a worker that died are leased again once their lease expires; items that failed
+are retried after an exponential backoff.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Mapping
+
+from app.config import config
+from app.dadata_client import lookup_parties
+from app.dadata_keys import NoAvailableKeyError
+from app.db import claim_job_items, complete_job_items, release_job_items
+
+if TYPE_CHECKING:
+    import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Columns of a flattened job result (CSV export in the bot).
+JOB_RESULT_COLUMNS = ("position", "query", "status", "inn", "ogrn", "name", "state", "error")
+
+# Upper bound of the backoff between two attempts of an item, seconds.
+MAX_RETRY_DELAY = 3600.0
+
+JobNotifier = Callable[["asyncpg.Record"], Awaitable[None]]
+_notifier: JobNotifier | None = None
+
+
+def set_job_notifier(notifier: JobNotifier | None) -> None:
+    """Register a callback for finished jobs (the bot uses it to message the author)."""
+    global _notifier
+    _notifier = notifier
+
+
+def job_item_result(record: Mapping[str, Any]) -> dict[str, Any] | None:
+    result = record["result"]
+    return json.loads(result) if isinstance(result, str) else result
+
+
+def flatten_job_item(record: Mapping[str, Any]) -> dict[str, Any]:
+    suggestion = job_item_result(record) or {}
+    data = suggestion.get("data") or {}
+    return {
+        "position": record["position"] + 1,
+        "query": record["query"],
+        "status": record["status"],
+        "inn": data.get("inn"),
+        "ogrn": data.get("ogrn"),
+        "name": suggestion.get("value"),
+        "state": (data.get("state") or {}).get("status"),
+        "error": record["error"],
+    }
+
+
+class JobWorker:
+    def __init__(
+        self,
+        pool: asyncpg.Pool[Any],
+        *,
+        batch_size: int,
+        concurrency: int,
+        lease: float,
+        max_attempts: int,
+        idle_delay: float,
+        retry_delay: float = 30.0,
+    ) -> None:
+        self._pool = pool
+        self._batch_size = batch_size
+        self._concurrency = concurrency
+        self._lease = lease
+        self._max_attempts = max_attempts
+        self._idle_delay = idle_delay
+        self._retry_delay = retry_delay
+
+    @classmethod
+    def from_config(cls, pool: asyncpg.Pool[Any]) -> JobWorker:
+        return cls(
+            pool,
+            batch_size=config.JOB_BATCH_SIZE,
+            concurrency=config.JOB_CONCURRENCY,
+            lease=config.JOB_LEASE,
+            max_attempts=config.JOB_MAX_ATTEMPTS,
+            idle_delay=config.JOB_IDLE_DELAY,
+            retry_delay=config.JOB_RETRY_DELAY,
+        )
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self._retry_delay * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+
+    async def run_once(self) -> tuple[int, bool]:
+        """Process one leased batch; return `(items claimed, keys exhausted)`."""
+        items = await claim_job_items(self._pool, self._batch_size, self._lease)
+        if not items:
+            return 0, False
+
+        by_query: dict[str, list[Any]] = {}
+        for item in items:
+            by_query.setdefault(item["query"], []).append(item)
+
+        results: list[tuple[int, int, int, str, str | None, str | None, float | None]] = []
+        released: list[tuple[int, int]] = []
+        async for query, outcome in lookup_parties(
+            config.DADATA_API_KEY, list(by_query), concurrency=self._concurrency
+        ):
+            for item in by_query[query]:
+                key = (item["job_id"], item["position"], item["attempts"])
+                if isinstance(outcome, NoAvailableKeyError):
+                    # Quota, not the item, is the problem: retry later without spending an attempt.
+                    released.append(key[:2])
+                elif isinstance(outcome, Exception):
+                    error = str(outcome) or type(outcome).__name__
+                    if item["attempts"] >= self._max_attempts:
+                        results.append((*key, "error", None, error, None))
+                    else:
+                        results.append((*key, "pending", None, error, self._backoff(item["attempts"])))
+                elif outcome.get("suggestions"):
+                    suggestion = json.dumps(outcome["suggestions"][0], ensure_ascii=False)
+                    results.append((*key, "found", suggestion, None, None))
+                else:
+                    results.append((*key, "not_found", None, None, None))
+
+        finished = await complete_job_items(self._pool, results)
+        await release_job_items(self._pool, released)
+        for job in finished:
+            if job["status"] == "done":
+                logger.info("check job %s finished: %s items, %s failed", job["id"], job["total"], job["failed"])
+                if _notifier is not None:
+                    try:
+                        await _notifier(job)
+                    except Exception:
+                        logger.exception("failed to notify about finished job %s", job["id"])
+        return len(items), bool(released)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                claimed, exhausted = await self.run_once()
+            except Exception:
+                logger.exception("check job worker iteration failed")
+                claimed, exhausted = 0, False
+            if exhausted:
+                await asyncio.sleep(config.DADATA_KEY_COOLDOWN)
+            elif not claimed:
+                await asyncio.sleep(self._idle_delay)
@@ -0,0 +1,154 @@
+"""Event-loop health: scheduling lag and handlers that block the loop.
+
+Every update shares one event loop, so any synchronous stretch of a handler (a large JSON
+decode, formatting a long founders list) delays all other updates by the same amount.
+`LagProbe` measures that delay directly: it sleeps for a fixed interval and records how
+late it woke up.  `SlowHandlerMiddleware` times each synchronous segment of a handler —
+the code between two suspension points — and logs the handlers whose segments exceed a
+threshold.  Work a handler moves into a child task is timed too when the task's coroutine
+is wrapped with `timed()`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Coroutine, Generator
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LagProbe:
+    def __init__(self) -> None:
+        self.last = 0.0
+        self._max = 0.0
+
+    def record(self, lag: float) -> None:
+        self.last = lag
+        self._max = max(self._max, lag)
+        metrics.loop_lag.observe(lag)
+
+    def take_max(self) -> float:
+        """Largest lag since the previous call."""
+        worst, self._max = max(self._max, self.last), 0.0
+        return worst
+
+    async def run(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.record(max(loop.time() - started - interval, 0.0))
+
+
+lag_probe = LagProbe()
+
+
+class _TimedAwait:
+    """Awaits `coro`, reporting the longest run between two suspensions to `on_done`."""
+
+    def __init__(self, coro: Coroutine[Any, Any, Any], on_done: Callable[[float], None]) -> None:
+        self._coro = coro
+        self._on_done = on_done
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        coro = self._coro
+        longest = 0.0
+        value: Any = None
+        error: BaseException | None = None
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    future = coro.send(value) if error is None else coro.throw(error)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    longest = max(longest, time.perf_counter() - started)
+                try:
+                    value, error = (yield future), None
+                except BaseException as exc:
+                    value, error = None, exc
+        finally:
+            self._on_done(longest)
+
+
+class _Longest:
+    """Longest synchronous segment seen by a handler and the child tasks it started."""
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def __call__(self, longest: float) -> None:
+        self.value = max(self.value, longest)
+
+
+_handler_segments: ContextVar[_Longest | None] = ContextVar("handler_segments", default=None)
+
+
+async def _timed_child(coro: Coroutine[Any, Any, Any], segments: _Longest) -> Any:
+    return await _TimedAwait(coro, segments)
+
+
+def timed(coro: Coroutine[Any, Any, Any]) -> Coroutine[Any, Any, Any]:
+    """Wrap `coro` before `asyncio.create_task` so the handler running now is charged for it."""
+    segments = _handler_segments.get()
+    if segments is None:
+        return coro
+    return _timed_child(coro, segments)
+
+
+def _context_key(event: TelegramObject) -> str:
+    if isinstance(event, CallbackQuery):
+        return event.data or ""
+    if isinstance(event, Message):
+        if event.document is not None:
+            return event.document.file_name or "document"
+        return (event.text or event.caption or "")[:64]
+    return ""
+
+
+class SlowHandlerMiddleware(BaseMiddleware):
+    """Inner middleware logging handlers that keep the loop busy for `threshold` seconds at once."""
+
+    def __init__(self, threshold: float) -> None:
+        self.threshold = threshold
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        def report(longest: float) -> None:
+            if longest < self.threshold:
+                return
+            handler_object = data.get("handler")
+            name = getattr(getattr(handler_object, "callback", None), "__name__", "?")
+            update = data.get("event_update")
+            metrics.slow_handler(name)
+            logger.warning(
+                "slow handler %s blocked the event loop for %.0f ms (update %s, key %r)",
+                name,
+                longest * 1000,
+                update.event_type if update is not None else type(event).__name__,
+                _context_key(event),
+            )
+
+        segments = _Longest()
+        token = _handler_segments.set(segments)
+        try:
+            awaitable = handler(event, data)
+            if not asyncio.iscoroutine(awaitable):
+                return await awaitable
+            return await _TimedAwait(awaitable, segments)
+        finally:
+            _handler_segments.reset(token)
+            report(segments.value)
@@ -1,20 +1,46 @@
 from __future__ import annotations
 
+import asyncio
+import hmac
+import json
 import logging
 import sys
-from contextlib import asynccontextmanager
+import threading
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator, Iterable, TypeVar
 from urllib.parse import urlparse
 
 from aiogram import Bot
 from aiogram.types import Update
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 
-from app.bot import create_dispatcher, set_db_pool
+from app import bot as bot_module
+from app.bot import create_dispatcher, drain_background_tasks, notify_job_finished
 from app.config import config
-from app.db import create_pool, init_db, postgres_enabled
+from app.dadata_client import lookup_parties, normalize_query_input
+from app.db import (
+    EXPORT_COLUMNS,
+    create_job,
+    fetch_job,
+    iter_job_items,
+    iter_requests,
+    postgres_enabled,
+)
+from app.export import EXPORT_FORMATS, export_chunks
+from app.health import HealthMonitor
+from app.jobs import job_item_result, set_job_notifier
+from app.metrics import metrics
+from app.profiling import SORT_KEYS, UpdateProfiler, format_collapsed, profile_lock, sample_stacks
+from app.runtime import start_runtime, stop_runtime
+from app.send_scheduler import install_send_scheduler
+from app.telegram_session import create_bot
+from app.updates import UpdateProcessor
 
 logger = logging.getLogger(__name__)
 
@@ -38,34 +64,46 @@ def _build_webhook_url(base_url: str) -> str | None:
     return f"{cleaned}{WEBHOOK_PATH}"
 
 
+def _require_bearer(request: Request, tokens: Iterable[str]) -> None:
+    allowed = [token for token in tokens if token]
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Endpoint is disabled")
+    scheme, _, presented = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not any(
+        hmac.compare_digest(presented.strip().encode(), token.encode()) for token in allowed
+    ):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+
+def _as_utc(moment: datetime | None) -> datetime | None:
+    if moment is None or moment.tzinfo is not None:
+        return moment
+    return moment.replace(tzinfo=timezone.utc)
+
+
 _ensure_project_root_on_syspath(__file__)
 
 dp = create_dispatcher()
+updates = UpdateProcessor(dp, config.UPDATE_MAX_TASKS, config.UPDATE_DEADLINE)
 bot: Bot | None = None
+health_monitor = HealthMonitor(updates, bot_configured=lambda: bot is not None)
+update_profiler = UpdateProfiler(config.PROFILE_UPDATE_RATE)
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     global bot
 
-    db_pool = None
-    if postgres_enabled():
-        try:
-            db_pool = await create_pool()
-            await init_db(db_pool)
-            set_db_pool(db_pool)
-            logger.info("PostgreSQL logging enabled")
-        except Exception:
-            logger.exception("Failed to initialize PostgreSQL; continuing without DB logging")
-            set_db_pool(None)
-            db_pool = None
+    db_pool = await start_runtime(use_postgres=postgres_enabled())
 
     local_bot: Bot | None = None
     token = (config.TELEGRAM_BOT_TOKEN or "").strip()
     if not token:
         logger.warning("TELEGRAM_BOT_TOKEN is not set, webhook endpoint will return 503")
     else:
-        local_bot = Bot(token=token)
+        local_bot = create_bot(token)
+        install_send_scheduler(local_bot)
+        set_job_notifier(partial(notify_job_finished, local_bot))
         bot = local_bot
         try:
             webhook_url = _build_webhook_url(config.WEBHOOK_URL)
@@ -79,13 +117,22 @@ async def lifespan(_: FastAPI):
         except Exception:
             logger.exception("Failed to register Telegram webhook")
 
+    health_task = asyncio.create_task(health_monitor.run(config.HEALTH_REFRESH_INTERVAL))
     try:
         yield
     finally:
+        health_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await health_task
+        # Handlers still write to the cache; stop_runtime snapshots it only after the drain.
+        await updates.drain(config.SHUTDOWN_DRAIN_TIMEOUT)
+        # Request-log rows of the last updates are written before the DB pool closes.
+        await drain_background_tasks(config.SHUTDOWN_DRAIN_TIMEOUT)
         if local_bot is not None:
+            set_job_notifier(None)
+            bot = None
             await local_bot.session.close()
-        if db_pool is not None:
-            await db_pool.close()
+        await stop_runtime(db_pool)
 
 
 app = FastAPI(lifespan=lifespan)
@@ -96,6 +143,12 @@ async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    snapshot = await health_monitor.current()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+
 @app.post(WEBHOOK_PATH)
 async def telegram_webhook(request: Request) -> JSONResponse:
     if bot is None:
@@ -111,5 +164,227 @@ async def telegram_webhook(request: Request) -> JSONResponse:
     except Exception as exc:
         raise HTTPException(status_code=400, detail="Invalid Telegram update payload") from exc
 
-    await dp.feed_update(bot, update)
+    await update_profiler.run(partial(updates.process, bot, update))
     return JSONResponse({"ok": True})
+
+
+@app.get("/admin/export")
+async def export_requests(
+    request: Request,
+    fmt: str = Query("csv", alias="format"),
+    since: datetime | None = None,
+    until: datetime | None = None,
+    inn: str | None = None,
+    user_id: int | None = None,
+) -> StreamingResponse:
+    _require_bearer(request, [config.ADMIN_API_TOKEN])
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if bot_module.db_pool is None:
+        raise HTTPException(status_code=503, detail="PostgreSQL is not configured")
+
+    rows = iter_requests(
+        bot_module.db_pool,
+        since=_as_utc(since),
+        until=_as_utc(until),
+        inn=inn,
+        user_id=user_id,
+    )
+    return StreamingResponse(
+        export_chunks(rows, EXPORT_COLUMNS, fmt),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="check_requests.{fmt}"'},
+    )
+
+
+@app.get("/admin/profile")
+async def profile_event_loop(
+    request: Request,
+    seconds: float = Query(10.0, gt=0),
+    interval: float = Query(0.005, ge=0.001),
+) -> PlainTextResponse:
+    """Sample the event-loop thread's stacks for `seconds`; collapsed stacks for flame graphs."""
+    _require_bearer(request, [config.ADMIN_API_TOKEN])
+    if not profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        stacks, samples = await asyncio.to_thread(
+            sample_stacks, threading.get_ident(), min(seconds, config.PROFILE_MAX_SECONDS), interval
+        )
+    finally:
+        profile_lock.release()
+    return PlainTextResponse(format_collapsed(stacks), headers={"X-Profile-Samples": str(samples)})
+
+
+@app.get("/admin/profile/updates")
+async def update_profile_report(
+    request: Request,
+    sort: str = "cumulative",
+    limit: int = Query(50, ge=1),
+) -> PlainTextResponse:
+    _require_bearer(request, [config.ADMIN_API_TOKEN])
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(SORT_KEYS)}")
+    return PlainTextResponse(update_profiler.report(sort, limit))
+
+
+@app.post("/admin/profile/updates")
+async def configure_update_profile(
+    request: Request,
+    rate: float = Query(ge=0, le=1),
+    reset: bool = False,
+) -> dict[str, Any]:
+    """Profile a `rate` fraction of webhook updates from now on (0 turns it off)."""
+    _require_bearer(request, [config.ADMIN_API_TOKEN])
+    update_profiler.set_rate(rate)
+    if reset:
+        update_profiler.reset()
+    return {"rate": update_profiler.rate, "profiled": update_profiler.profiled}
+
+
+class PartyCheckRequest(BaseModel):
+    queries: list[str] = Field(min_length=1)
+
+
+class JobCreateRequest(BaseModel):
+    queries: list[str] = Field(min_length=1)
+
+
+_Body = TypeVar("_Body", bound=BaseModel)
+
+
+def _require_api_token(request: Request) -> None:
+    """Route dependency for /api/v1: the endpoints read their body themselves, after this check,
+    so an anonymous client cannot make the server parse a body or see validation details."""
+    _require_bearer(request, config.API_TOKENS)
+
+
+def _json_body(model: type[_Body]) -> dict[str, Any]:
+    """OpenAPI description of a body that the endpoint parses with `_read_body`."""
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": model.model_json_schema()}}}}
+
+
+async def _read_body(request: Request, model: type[_Body]) -> _Body:
+    try:
+        return model.model_validate_json(await request.body())
+    except ValidationError as exc:
+        errors = [{**error, "loc": ("body", *error["loc"])} for error in exc.errors(include_url=False)]
+        raise RequestValidationError(errors) from exc
+
+
+def _ndjson(record: dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+async def _check_parties(queries: list[str]) -> AsyncIterator[str]:
+    """One NDJSON line per distinct query: invalid ones first, the rest as lookups complete.
+
+    `query` echoes the string the client sent and `number` is the normalized INN/OGRN;
+    spellings of the same number share one lookup.
+    """
+    numbers: dict[str, list[str]] = {}
+    for query in dict.fromkeys(queries):
+        number, kind = normalize_query_input(query)
+        if kind in {"inn", "ogrn"}:
+            numbers.setdefault(number, []).append(query)
+        else:
+            yield _ndjson({"query": query, "status": "invalid"})
+
+    metrics.requests.add(len(numbers))
+    async for number, outcome in lookup_parties(
+        config.DADATA_API_KEY, list(numbers), concurrency=config.LOOKUP_CONCURRENCY
+    ):
+        if isinstance(outcome, Exception):
+            result = {"status": "error", "error": str(outcome) or type(outcome).__name__}
+        elif outcome.get("suggestions"):
+            suggestion = outcome["suggestions"][0]
+            result = {"status": "found", "value": suggestion.get("value"), "data": suggestion.get("data")}
+        else:
+            result = {"status": "not_found"}
+        for query in numbers[number]:
+            yield _ndjson({"query": query, "number": number, **result})
+
+
+@app.post(
+    "/api/v1/parties/check",
+    dependencies=[Depends(_require_api_token)],
+    openapi_extra=_json_body(PartyCheckRequest),
+)
+async def check_parties(request: Request) -> StreamingResponse:
+    payload = await _read_body(request, PartyCheckRequest)
+    if len(payload.queries) > config.API_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {config.API_MAX_IDS} queries per request")
+    if not config.DADATA_API_KEY:
+        raise HTTPException(status_code=503, detail="DADATA_API_KEY is not configured")
+    return StreamingResponse(_check_parties(payload.queries), media_type="application/x-ndjson")
+
+
+def _require_jobs_pool() -> Any:
+    if bot_module.db_pool is None:
+        raise HTTPException(status_code=503, detail="PostgreSQL is not configured")
+    return bot_module.db_pool
+
+
+@app.post(
+    "/api/v1/jobs",
+    status_code=202,
+    dependencies=[Depends(_require_api_token)],
+    openapi_extra=_json_body(JobCreateRequest),
+)
+async def create_check_job(request: Request) -> dict[str, Any]:
+    """Queue a durable batch check; poll `GET /api/v1/jobs/{id}` and fetch `/results` when done."""
+    payload = await _read_body(request, JobCreateRequest)
+    if len(payload.queries) > config.JOB_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {config.JOB_MAX_IDS} queries per job")
+    pool = _require_jobs_pool()
+
+    numbers: dict[str, None] = {}
+    invalid = []
+    for query in payload.queries:
+        number, kind = normalize_query_input(query)
+        if kind in {"inn", "ogrn"}:
+            numbers[number] = None
+        else:
+            invalid.append(query)
+    if not numbers:
+        raise HTTPException(status_code=400, detail="No valid INN/OGRN in queries")
+    job_id = await create_job(pool, list(numbers))
+    return {"job_id": job_id, "total": len(numbers), "invalid": invalid}
+
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_check_job(request: Request, job_id: int) -> dict[str, Any]:
+    _require_bearer(request, config.API_TOKENS)
+    job = await fetch_job(_require_jobs_pool(), job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "total": job["total"],
+        "done": job["done"],
+        "failed": job["failed"],
+        "created_at": job["created_at"].isoformat(),
+        "finished_at": job["finished_at"].isoformat() if job["finished_at"] else None,
+    }
+
+
+async def _job_results(pool: Any, job_id: int) -> AsyncIterator[str]:
+    async for record in iter_job_items(pool, job_id):
+        line: dict[str, Any] = {"query": record["query"], "status": record["status"]}
+        suggestion = job_item_result(record)
+        if suggestion is not None:
+            line.update(value=suggestion.get("value"), data=suggestion.get("data"))
+        if record["error"]:
+            line["error"] = record["error"]
+        yield _ndjson(line)
+
+
+@app.get("/api/v1/jobs/{job_id}/results")
+async def get_check_job_results(request: Request, job_id: int) -> StreamingResponse:
+    """Stream every item of the job in input order; unfinished items have status pending/running."""
+    _require_bearer(request, config.API_TOKENS)
+    pool = _require_jobs_pool()
+    if await fetch_job(pool, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(_job_results(pool, job_id), media_type="application/x-ndjson")
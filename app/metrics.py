@@ -0,0 +1,211 @@
+"""In-process rolling aggregates for the admin `/stats` command.
+
+Every structure here has a fixed memory footprint and O(1) update cost so it can be
+touched on the hot path of every update.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from typing import Any
+
+WINDOW_SEC = 15 * 60
+# Lookups that needed this many Telegram calls or more share the last histogram bucket.
+_MAX_CALLS_BUCKET = 5
+
+
+class RollingCounter:
+    """Per-second ring buffer of event counts over the last `window` seconds."""
+
+    def __init__(self, window: int = WINDOW_SEC) -> None:
+        self._window = window
+        self._counts = [0] * window
+        self._seconds = [-1] * window
+        self.total = 0
+
+    def add(self, n: int = 1, now: float | None = None) -> None:
+        second = int(time.monotonic() if now is None else now)
+        slot = second % self._window
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._counts[slot] = 0
+        self._counts[slot] += n
+        self.total += n
+
+    def count(self, seconds: int, now: float | None = None) -> int:
+        current = int(time.monotonic() if now is None else now)
+        oldest = current - min(seconds, self._window) + 1
+        return sum(
+            count for count, second in zip(self._counts, self._seconds) if oldest <= second <= current
+        )
+
+    def rate(self, seconds: int, now: float | None = None) -> float:
+        """Average events per second over the last `seconds`."""
+        return self.count(seconds, now) / min(seconds, self._window)
+
+
+class LatencySketch:
+    """Windowed log-bucket histogram (per-minute slots) for approximate latency quantiles.
+
+    Buckets grow by 10%, so a reported quantile overestimates the true value by at most 10%.
+    """
+
+    MIN_SEC = 0.001
+    GROWTH = 1.1
+    BUCKETS = 120  # 1 ms * 1.1**120 ≈ 92 s
+
+    def __init__(self, minutes: int = 15) -> None:
+        self._minutes = minutes
+        self._slots = [[0] * self.BUCKETS for _ in range(minutes)]
+        self._slot_minute = [-1] * minutes
+        self._log_growth = math.log(self.GROWTH)
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.MIN_SEC:
+            return 0
+        return min(self.BUCKETS - 1, int(math.log(value / self.MIN_SEC) / self._log_growth) + 1)
+
+    def _upper_bound(self, bucket: int) -> float:
+        return self.MIN_SEC * self.GROWTH**bucket
+
+    def observe(self, seconds: float, now: float | None = None) -> None:
+        minute = int((time.monotonic() if now is None else now) // 60)
+        slot = minute % self._minutes
+        if self._slot_minute[slot] != minute:
+            self._slot_minute[slot] = minute
+            self._slots[slot] = [0] * self.BUCKETS
+        self._slots[slot][self._bucket(seconds)] += 1
+
+    def quantiles(self, qs: tuple[float, ...], now: float | None = None) -> dict[float, float | None]:
+        current = int((time.monotonic() if now is None else now) // 60)
+        merged = [0] * self.BUCKETS
+        for minute, buckets in zip(self._slot_minute, self._slots):
+            if current - self._minutes < minute <= current:
+                for i, count in enumerate(buckets):
+                    merged[i] += count
+        total = sum(merged)
+        result: dict[float, float | None] = {}
+        for q in qs:
+            if total == 0:
+                result[q] = None
+                continue
+            rank = q * total
+            seen = 0
+            for i, count in enumerate(merged):
+                seen += count
+                if seen >= rank:
+                    result[q] = self._upper_bound(i)
+                    break
+        return result
+
+    def quantile(self, q: float, now: float | None = None) -> float | None:
+        return self.quantiles((q,), now)[q]
+
+
+class TopK:
+    """Space-Saving heavy hitters sketch holding at most `capacity` keys.
+
+    Keys are grouped by count (a stream summary), so finding the key to evict is O(1).
+    """
+
+    def __init__(self, capacity: int = 50) -> None:
+        self._capacity = capacity
+        self._counts: dict[str, int] = {}
+        # count -> keys with that count, oldest first
+        self._buckets: dict[int, dict[str, None]] = {}
+        self._min = 0
+
+    def _place(self, key: str, count: int) -> None:
+        self._counts[key] = count
+        self._buckets.setdefault(count, {})[key] = None
+
+    def _unplace(self, key: str) -> int:
+        count = self._counts.pop(key)
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+            if count == self._min:
+                # The key moves to count + 1, so that bucket is the new minimum.
+                self._min = count + 1
+        return count
+
+    def add(self, key: str) -> None:
+        if key in self._counts:
+            self._place(key, self._unplace(key) + 1)
+        elif len(self._counts) < self._capacity:
+            self._place(key, 1)
+            self._min = 1
+        else:
+            victim = next(iter(self._buckets[self._min]))
+            self._place(key, self._unplace(victim) + 1)
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        return sorted(self._counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+    def clear(self) -> None:
+        self._counts.clear()
+        self._buckets.clear()
+        self._min = 0
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests = RollingCounter()
+        self.rate_limited = RollingCounter()
+        self.dadata_latency = LatencySketch()
+        self.cache_hits: dict[str, int] = {}
+        self.cache_misses: dict[str, int] = {}
+        self.top_inns = TopK()
+        self.telegram_calls: dict[int, int] = {}
+        self.dadata_hedges = 0
+        self.dadata_hedge_wins = 0
+        self.dadata_coalesced = 0
+        self.dadata_cancelled = 0
+        self.lookups_superseded = 0
+        self.loop_lag = LatencySketch()
+        self.slow_handlers = RollingCounter()
+        self.slow_handler_names = TopK(capacity=20)
+
+    def cache_lookup(self, name: str, hit: bool) -> None:
+        counters = self.cache_hits if hit else self.cache_misses
+        counters[name] = counters.get(name, 0) + 1
+
+    def lookup_telegram_calls(self, calls: int) -> None:
+        bucket = min(calls, _MAX_CALLS_BUCKET)
+        self.telegram_calls[bucket] = self.telegram_calls.get(bucket, 0) + 1
+
+    def slow_handler(self, name: str) -> None:
+        self.slow_handlers.add()
+        self.slow_handler_names.add(name)
+
+    def snapshot(self) -> dict[str, Any]:
+        caches = {}
+        for name in sorted(set(self.cache_hits) | set(self.cache_misses)):
+            hits = self.cache_hits.get(name, 0)
+            total = hits + self.cache_misses.get(name, 0)
+            caches[name] = {"hits": hits, "total": total, "ratio": hits / total if total else None}
+        return {
+            "request_rates": {minutes: self.requests.rate(minutes * 60) for minutes in (1, 5, 15)},
+            "requests_total": self.requests.total,
+            "rate_limited_15m": self.rate_limited.count(WINDOW_SEC),
+            "rate_limited_total": self.rate_limited.total,
+            "dadata_latency": self.dadata_latency.quantiles((0.5, 0.95, 0.99)),
+            "caches": caches,
+            "top_inns": self.top_inns.top(10),
+            "telegram_calls": dict(sorted(self.telegram_calls.items())),
+            "dadata_hedges": {"fired": self.dadata_hedges, "won": self.dadata_hedge_wins},
+            "lookups_superseded": self.lookups_superseded,
+            "dadata_coalesced": self.dadata_coalesced,
+            "dadata_cancelled": self.dadata_cancelled,
+            "loop_lag": self.loop_lag.quantiles((0.5, 0.99, 1.0)),
+            "slow_handlers_15m": self.slow_handlers.count(WINDOW_SEC),
+            "slow_handlers": self.slow_handler_names.top(5),
+        }
+
+
+metrics = Metrics()
@@ -0,0 +1,175 @@
+"""In-process trigram index over company names seen in DaData responses or the EGRUL snapshot."""
+
+from __future__ import annotations
+
+import heapq
+import re
+import threading
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+# Legal-form words carry no signal for matching and would make every posting list huge.
+_STOP_WORDS = frozenset(
+    {
+        "ооо", "оао", "зао", "пао", "ао", "нао", "ип", "нко", "ано", "гуп", "муп", "фгуп",
+        "общество", "с", "ограниченной", "ответственностью", "акционерное", "публичное",
+        "закрытое", "открытое", "непубличное", "индивидуальный", "предприниматель",
+        "llc", "ltd", "inc",
+    }
+)
+_NON_WORD_RE = re.compile(r"[^0-9a-zа-я]+")
+# Stop collecting candidates once this many postings have been scanned; a single
+# very common trigram is only scanned up to this many documents.
+_CANDIDATE_BUDGET = 10_000
+_RERANK_CANDIDATES = 300
+
+
+def normalize_name(text: str) -> str:
+    words = _NON_WORD_RE.sub(" ", (text or "").lower().replace("ё", "е")).split()
+    return " ".join(word for word in words if word not in _STOP_WORDS)
+
+
+def trigrams(normalized: str) -> set[str]:
+    """pg_trgm-style trigrams: each word padded with two leading and one trailing space."""
+    result: set[str] = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def _padded(normalized: str) -> str:
+    # Contains every trigram of `normalized` as a substring, and no other trigram without
+    # a double trailing space, so `trigram in _padded(name)` is a set-membership test.
+    return "  " + normalized.replace(" ", "   ") + " "
+
+
+@dataclass(frozen=True)
+class NameMatch:
+    key: str
+    name: str
+    score: float
+
+
+class NameIndex:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._doc_by_key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._doc_by_key
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys: list[str] = []
+            self._names: list[str] = []
+            self._normalized: list[str] = []
+            # Trigram count per document, for cheap Jaccard estimates before re-ranking.
+            self._sizes = array("H")
+            self._doc_by_key: dict[str, int] = {}
+            self._postings: dict[str, array] = {}
+
+    def add(self, key: str, name: str) -> bool:
+        """Index `name` under `key` (INN/OGRN); return False if nothing changed."""
+        key = (key or "").strip()
+        normalized = normalize_name(name)
+        if not key or not normalized:
+            return False
+        name_trigrams = trigrams(normalized)
+        with self._lock:
+            doc = self._doc_by_key.get(key)
+            if doc is not None and self._normalized[doc] == normalized:
+                return False
+            if doc is None:
+                doc = len(self._keys)
+                self._keys.append(key)
+                self._names.append(name)
+                self._normalized.append(normalized)
+                self._sizes.append(min(len(name_trigrams), 0xFFFF))
+                self._doc_by_key[key] = doc
+            else:
+                # Renamed company: stale postings stay but are filtered out by re-ranking.
+                self._names[doc] = name
+                self._normalized[doc] = normalized
+                self._sizes[doc] = min(len(name_trigrams), 0xFFFF)
+            for trigram in name_trigrams:
+                postings = self._postings.get(trigram)
+                if postings is None:
+                    self._postings[trigram] = postings = array("I")
+                if not postings or postings[-1] != doc:
+                    postings.append(doc)
+        return True
+
+    def add_many(self, items: Iterable[tuple[str, str]]) -> int:
+        return sum(1 for key, name in items if self.add(key, name))
+
+    def add_suggestions(self, suggestions: Iterable[dict[str, Any]]) -> None:
+        for suggestion in suggestions:
+            data = suggestion.get("data") or {}
+            key = str(data.get("inn") or data.get("ogrn") or "")
+            name_obj = data.get("name") or {}
+            name = name_obj.get("short_with_opf") or name_obj.get("short") or suggestion.get("value") or ""
+            self.add(key, str(name))
+
+    def search(self, query: str, limit: int = 5, min_score: float = 0.3) -> list[NameMatch]:
+        query_trigrams = trigrams(normalize_name(query))
+        if not query_trigrams:
+            return []
+
+        with self._lock:
+            lists = sorted(
+                (self._postings[t] for t in query_trigrams if t in self._postings),
+                key=len,
+            )
+            counts: Counter[int] = Counter()
+            scanned = 0
+            unscanned = len(lists)
+            for postings in lists:
+                if scanned and scanned + len(postings) > _CANDIDATE_BUDGET:
+                    break
+                scanned += len(postings)
+                unscanned -= 1
+                counts.update(postings[:_CANDIDATE_BUDGET])
+            if not counts:
+                return []
+            # Only documents that share (nearly) the most scanned trigrams can win.  Cap that
+            # pool by an upper bound of the score (as if every unscanned trigram matched),
+            # then compute the exact Jaccard score for what is left.
+            best = max(counts.values())
+            pool = [doc for doc, count in counts.items() if count >= best - 1]
+            size = len(query_trigrams)
+            sizes = self._sizes
+            if len(pool) > _RERANK_CANDIDATES:
+
+                def upper_bound(doc: int) -> float:
+                    common = min(counts[doc] + unscanned, sizes[doc])
+                    return common / (size + sizes[doc] - common)
+
+                pool = heapq.nlargest(_RERANK_CANDIDATES, pool, key=upper_bound)
+            ordered = list(query_trigrams)
+            scored = []
+            for doc in pool:
+                padded = _padded(self._normalized[doc])
+                common = sum(trigram in padded for trigram in ordered)
+                score = common / (size + sizes[doc] - common)
+                if score >= min_score:
+                    scored.append(NameMatch(self._keys[doc], self._names[doc], round(score, 4)))
+        scored.sort(key=lambda match: (-match.score, match.name))
+        return scored[:limit]
+
+    def best_match(self, query: str, min_score: float, min_margin: float = 0.1) -> NameMatch | None:
+        """Return the top match only if it is confident and clearly ahead of the runner-up."""
+        matches = self.search(query, limit=2, min_score=min_score)
+        if not matches:
+            return None
+        if len(matches) > 1 and matches[0].score - matches[1].score < min_margin:
+            return None
+        return matches[0]
+
+
+name_index = NameIndex()
@@ -0,0 +1,112 @@
+"""Long-polling runtime for deployments without a public webhook URL."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+from contextlib import suppress
+from functools import partial
+
+from aiogram import Bot
+from aiogram.types import Update
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from app.bot import create_dispatcher, drain_background_tasks, notify_job_finished
+from app.config import config
+from app.db import postgres_enabled
+from app.jobs import set_job_notifier
+from app.runtime import start_runtime, stop_runtime
+from app.send_scheduler import install_send_scheduler
+from app.telegram_session import create_bot
+from app.updates import UpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+POLLING_BACKOFF = BackoffConfig(min_delay=1.0, max_delay=30.0, factor=1.5, jitter=0.1)
+
+
+async def _fetch_updates(bot: Bot, offset: int | None, stop: asyncio.Event) -> list[Update] | None:
+    """Return the next batch of updates, or None once `stop` is set."""
+    fetch = asyncio.create_task(
+        bot.get_updates(
+            offset=offset,
+            timeout=config.POLLING_TIMEOUT,
+            request_timeout=config.POLLING_TIMEOUT + 10,
+        )
+    )
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait({fetch, stopped}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stopped.cancel()
+    if not fetch.done():
+        fetch.cancel()
+        return None
+    return fetch.result()
+
+
+async def poll_updates(bot: Bot, processor: UpdateProcessor, stop: asyncio.Event) -> None:
+    backoff = Backoff(config=POLLING_BACKOFF)
+    offset: int | None = None
+    while not stop.is_set():
+        try:
+            batch = await _fetch_updates(bot, offset, stop)
+        except Exception as exc:
+            delay = next(backoff)
+            logger.warning("getUpdates failed (%s), retrying in %.1fs", exc, delay)
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            continue
+        backoff.reset()
+        if batch is None:
+            break
+        for update in batch:
+            offset = update.update_id + 1
+            await processor.submit(bot, update)
+
+
+def _install_signal_handlers(stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows and non-main threads do not support loop signal handlers.
+            pass
+
+
+async def run_polling(stop: asyncio.Event | None = None) -> None:
+    token = (config.TELEGRAM_BOT_TOKEN or "").strip()
+    if not token:
+        raise RuntimeError("TELEGRAM_BOT_TOKEN is required for polling mode")
+
+    stop = stop or asyncio.Event()
+    _install_signal_handlers(stop)
+
+    dp = create_dispatcher()
+    processor = UpdateProcessor(dp, config.UPDATE_MAX_TASKS, config.UPDATE_DEADLINE)
+    db_pool = await start_runtime(use_postgres=postgres_enabled())
+    bot = create_bot(token)
+    install_send_scheduler(bot)
+    set_job_notifier(partial(notify_job_finished, bot))
+    try:
+        await bot.delete_webhook(drop_pending_updates=False)
+        logger.info("Polling started (max %d concurrent updates)", processor.max_tasks)
+        await poll_updates(bot, processor, stop)
+    finally:
+        logger.info("Polling stopped, draining %d in-flight updates", processor.in_flight)
+        await processor.drain(config.SHUTDOWN_DRAIN_TIMEOUT)
+        await drain_background_tasks(config.SHUTDOWN_DRAIN_TIMEOUT)
+        set_job_notifier(None)
+        await bot.session.close()
+        await stop_runtime(db_pool)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_polling())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Profiling of a running instance without a redeploy.
+
+`sample_stacks` is a wall-clock sampling profiler: a helper thread reads the event-loop
+thread's current Python stack every few milliseconds and counts identical stacks, so the
+loop itself runs unmodified.  The result is in collapsed-stack format
+(`frame;frame;frame count` per line), which flamegraph.pl, speedscope and inferno read.
+
+`UpdateProfiler` runs cProfile around a sampled fraction of webhook updates and keeps the
+aggregated statistics.  cProfile traces the whole thread, so a profile also contains what
+other coroutines ran while the sampled update was in flight; only one update is profiled
+at a time.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+SORT_KEYS = ("cumulative", "tottime", "ncalls")
+
+# One sampling profile at a time per process.
+profile_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    """Path relative to the longest matching sys.path entry (`aiogram/dispatcher/router.py`)."""
+    best = ""
+    for entry in sys.path:
+        prefix = os.path.join(os.path.abspath(entry or "."), "")
+        if filename.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return filename[len(best) :] if best else filename
+
+
+def collapse_stack(frame: Any) -> str:
+    """`outermost;…;innermost` frame names of `frame` and its callers."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float) -> tuple[Counter[str], int]:
+    """Sample the stack of `thread_id` every `interval` seconds for `seconds`; blocks the caller.
+
+    Returns the stack counts and the number of samples taken.
+    """
+    stacks: Counter[str] = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        stacks[collapse_stack(frame)] += 1
+        samples += 1
+        del frame
+        time.sleep(interval)
+    return stacks, samples
+
+
+def format_collapsed(stacks: Counter[str]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class UpdateProfiler:
+    def __init__(self, rate: float = 0.0, rng: Callable[[], float] = random.random) -> None:
+        self.rate = rate
+        self._rng = rng
+        self._active = False
+        self._stats: pstats.Stats | None = None
+        self.profiled = 0
+
+    def set_rate(self, rate: float) -> None:
+        self.rate = min(max(rate, 0.0), 1.0)
+
+    def reset(self) -> None:
+        self._stats = None
+        self.profiled = 0
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Await `call()`, under cProfile for a `rate` fraction of calls."""
+        if self.rate <= 0 or self._active or self._rng() >= self.rate:
+            return await call()
+        self._active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return await call()
+        finally:
+            profile.disable()
+            self._active = False
+            self.profiled += 1
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def report(self, sort: str = "cumulative", limit: int = 50) -> str:
+        if self._stats is None:
+            return "no updates profiled yet\n"
+        out = io.StringIO()
+        self._stats.stream = out
+        out.write(f"{self.profiled} updates profiled (rate {self.rate:g})\n")
+        self._stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
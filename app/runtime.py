@@ -0,0 +1,142 @@
+"""Resources shared by the webhook (`app.main`) and polling (`app.polling`) runtimes."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import suppress
+from typing import TYPE_CHECKING, Any
+
+from app.bot import set_db_pool
+from app.cache import party_cache
+from app.config import config
+from app.dadata_client import close_http_client, open_http_client
+from app.db import create_pool, init_db, run_maintenance
+from app.egrul import EgrulSnapshot, get_snapshot
+from app.jobs import JobWorker
+from app.loop_monitor import lag_probe
+from app.name_index import name_index
+
+if TYPE_CHECKING:
+    import asyncpg
+
+logger = logging.getLogger(__name__)
+
+_maintenance_task: asyncio.Task[None] | None = None
+_name_index_task: asyncio.Task[None] | None = None
+_job_worker_task: asyncio.Task[None] | None = None
+_lag_probe_task: asyncio.Task[None] | None = None
+
+
+async def open_db_pool() -> asyncpg.Pool[Any] | None:
+    try:
+        db_pool = await create_pool()
+        await init_db(db_pool)
+    except Exception:
+        logger.exception("Failed to initialize PostgreSQL; continuing without DB logging")
+        set_db_pool(None)
+        return None
+    set_db_pool(db_pool)
+    logger.info("PostgreSQL logging enabled")
+    return db_pool
+
+
+async def _maintenance_loop(db_pool: asyncpg.Pool[Any], interval: float) -> None:
+    while True:
+        try:
+            await run_maintenance(db_pool)
+        except Exception:
+            logger.exception("database maintenance failed")
+        await asyncio.sleep(interval)
+
+
+def _index_snapshot_names(snapshot: EgrulSnapshot) -> int:
+    return name_index.add_many(
+        (record.get("inn") or record.get("ogrn") or "", record.get("name_short") or record.get("name_full") or "")
+        for record in snapshot.iter_records()
+    )
+
+
+async def _load_name_index(snapshot: EgrulSnapshot) -> None:
+    try:
+        added = await asyncio.to_thread(_index_snapshot_names, snapshot)
+    except Exception:
+        logger.exception("failed to index EGRUL snapshot names")
+        return
+    logger.info("name index: %d companies indexed from the EGRUL snapshot", added)
+
+
+def restore_cache_snapshot(path: str) -> None:
+    if not path or not os.path.exists(path):
+        return
+    started = time.perf_counter()
+    try:
+        loaded = party_cache.load_snapshot(path)
+    except Exception:
+        logger.exception("failed to restore the cache snapshot from %s", path)
+        return
+    logger.info("cache: %d entries restored from %s in %.3fs", loaded, path, time.perf_counter() - started)
+
+
+def save_cache_snapshot(path: str, max_bytes: int) -> None:
+    if not path:
+        return
+    try:
+        saved = party_cache.save_snapshot(path, max_bytes=max_bytes)
+    except Exception:
+        logger.exception("failed to save the cache snapshot to %s", path)
+        return
+    logger.info("cache: %d entries saved to %s", saved, path)
+
+
+async def start_runtime(*, use_postgres: bool) -> asyncpg.Pool[Any] | None:
+    global _maintenance_task, _name_index_task, _job_worker_task, _lag_probe_task
+
+    # Before the first update is accepted, so a redeploy starts with a warm cache.
+    restore_cache_snapshot(config.CACHE_SNAPSHOT_PATH)
+    await open_http_client()
+    _lag_probe_task = asyncio.create_task(lag_probe.run(config.LOOP_LAG_INTERVAL))
+    if config.EGRUL_SNAPSHOT_DIR:
+        snapshot = get_snapshot(config.EGRUL_SNAPSHOT_DIR)
+        if snapshot is not None and config.NAME_INDEX_FROM_SNAPSHOT:
+            _name_index_task = asyncio.create_task(_load_name_index(snapshot))
+    if not use_postgres:
+        return None
+    db_pool = await open_db_pool()
+    if db_pool is not None:
+        _maintenance_task = asyncio.create_task(_maintenance_loop(db_pool, config.DB_MAINTENANCE_INTERVAL))
+        if config.JOB_WORKER:
+            _job_worker_task = asyncio.create_task(JobWorker.from_config(db_pool).run())
+    return db_pool
+
+
+async def stop_runtime(db_pool: asyncpg.Pool[Any] | None) -> None:
+    """Release shared resources; callers drain in-flight updates first so the snapshot is complete."""
+    global _maintenance_task, _name_index_task, _job_worker_task, _lag_probe_task
+
+    # A batch interrupted here is leased again by any worker once its lease expires.  The
+    # worker is stopped first so that it cannot write to the cache after the snapshot.
+    if _job_worker_task is not None:
+        _job_worker_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _job_worker_task
+        _job_worker_task = None
+
+    save_cache_snapshot(config.CACHE_SNAPSHOT_PATH, config.CACHE_SNAPSHOT_MAX_BYTES)
+
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        _maintenance_task = None
+    if _lag_probe_task is not None:
+        _lag_probe_task.cancel()
+        _lag_probe_task = None
+    # The indexing thread itself cannot be interrupted; only stop waiting for it.
+    if _name_index_task is not None:
+        _name_index_task.cancel()
+        _name_index_task = None
+    await close_http_client()
+    if db_pool is not None:
+        set_db_pool(None)
+        await db_pool.close()
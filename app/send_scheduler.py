@@ -0,0 +1,250 @@
+"""Outbound Telegram pacing: a request middleware for the aiogram `Bot` session.
+
+Requests addressed to a chat wait for a token from that chat's bucket and from the global
+bucket, `TelegramRetryAfter` is retried after the delay Telegram asks for, and an
+`editMessageText` still waiting for its turn is replaced by a newer edit of the same message.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from app.config import config
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+# Bot API requests made in the current context (set per lookup by the bot handlers).
+telegram_calls: ContextVar[int] = ContextVar("telegram_calls", default=0)
+
+# Idle (full) per-chat buckets are dropped once there are more than this many.
+_MAX_CHAT_BUCKETS = 10_000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, timer: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._timer = timer
+        self._updated = timer()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    @property
+    def idle(self) -> bool:
+        now = self._timer()
+        self._refill(now)
+        return self._tokens >= self.burst and self._blocked_until <= now
+
+    def block(self, seconds: float) -> None:
+        """Hand out no tokens for `seconds` (after a flood-control answer)."""
+        now = self._timer()
+        self._refill(now)
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        # Empty, and refilling only starts once the block is over.
+        self._tokens = min(self._tokens, 0.0)
+        self._updated = max(self._updated, self._blocked_until)
+
+    def reserve(self) -> float:
+        """Take one token, possibly in advance; return how long to wait before using it."""
+        now = self._timer()
+        self._refill(now)
+        start = max(now, self._blocked_until)
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return start - now
+        return start - now - self._tokens / self.rate
+
+    def refund(self) -> None:
+        """Give back a reserved token that was not used."""
+        self._refill(self._timer())
+        self._tokens = min(self.burst, self._tokens + 1)
+
+
+class _PendingEdit:
+    """An edit waiting for its turn, sent by a task that lives as long as someone awaits it."""
+
+    def __init__(self, method: EditMessageText) -> None:
+        self.method = method
+        self.task: asyncio.Task[Any] | None = None
+        self.waiters = 0
+
+    async def wait(self) -> Any:
+        assert self.task is not None
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        except asyncio.CancelledError:
+            # Only the last caller gives up the edit; the others still want the newest text sent.
+            if self.waiters == 1 and not self.task.done():
+                self.task.cancel()
+            raise
+        finally:
+            self.waiters -= 1
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(
+        self,
+        *,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        group_rate: float,
+        max_retries: int,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._global = TokenBucket(global_rate, global_rate, timer)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._group_rate = group_rate
+        self._max_retries = max_retries
+        self._timer = timer
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._pending_edits: dict[tuple[int | str, int], _PendingEdit] = {}
+        self.retries = 0
+        self.coalesced = 0
+        self.delayed = 0
+
+    @classmethod
+    def from_config(cls) -> SendScheduler:
+        return cls(
+            global_rate=config.TG_GLOBAL_RATE,
+            chat_rate=config.TG_CHAT_RATE,
+            chat_burst=config.TG_CHAT_BURST,
+            group_rate=config.TG_GROUP_RATE,
+            max_retries=config.TG_MAX_RETRIES,
+        )
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_CHAT_BUCKETS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            # Groups and channels (negative ids, @usernames) have a much lower per-chat limit.
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self._group_rate if is_group else self._chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, 1 if is_group else self._chat_burst, self._timer)
+        return bucket
+
+    async def _wait_turn(self, chat_id: int | str) -> None:
+        # Chat first, so a request stuck behind a slow chat does not hold a global token.
+        waited = False
+        reserved: list[TokenBucket] = []
+        turn = False
+        try:
+            for bucket in (self._chat_bucket(chat_id), self._global):
+                delay = bucket.reserve()
+                reserved.append(bucket)
+                if delay > 0:
+                    waited = True
+                    await asyncio.sleep(delay)
+            turn = True
+        finally:
+            if not turn:
+                # Cancelled while waiting: the request is not sent, so its slots go back.
+                for bucket in reserved:
+                    bucket.refund()
+        self.delayed += waited
+
+    async def _send(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        chat_id: int | str,
+    ) -> Response[TelegramType]:
+        attempt = 0
+        while True:
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                if attempt >= self._max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning("flood control in chat %s, retrying in %s s", chat_id, exc.retry_after)
+                self._chat_bucket(chat_id).block(exc.retry_after)
+                await self._wait_turn(chat_id)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        telegram_calls.set(telegram_calls.get() + 1)
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        if isinstance(method, EditMessageText) and method.message_id is not None:
+            key = (chat_id, method.message_id)
+            pending = self._pending_edits.get(key)
+            if pending is not None:
+                # An older edit of this message is still waiting: let it send our text instead.
+                pending.method = method
+                self.coalesced += 1
+                return await pending.wait()
+            pending = self._pending_edits[key] = _PendingEdit(method)
+            pending.task = asyncio.create_task(self._send_edit(make_request, bot, pending, key))
+            pending.task.add_done_callback(partial(self._edit_done, key, pending))
+            return await pending.wait()
+
+        await self._wait_turn(chat_id)
+        return await self._send(make_request, bot, method, chat_id)
+
+    async def _send_edit(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        pending: _PendingEdit,
+        key: tuple[int | str, int],
+    ) -> Response[TelegramType]:
+        try:
+            await self._wait_turn(key[0])
+        finally:
+            self._forget_edit(key, pending)
+        return await self._send(make_request, bot, pending.method, key[0])
+
+    def _forget_edit(self, key: tuple[int | str, int], pending: _PendingEdit) -> None:
+        """Newer edits of the message start a new send from now on."""
+        if self._pending_edits.get(key) is pending:
+            del self._pending_edits[key]
+
+    def _edit_done(self, key: tuple[int | str, int], pending: _PendingEdit, task: asyncio.Task[Any]) -> None:
+        # Also covers a task cancelled before it started.
+        self._forget_edit(key, pending)
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller was cancelled first
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "delayed": self.delayed,
+            "chats": len(self._chats),
+        }
+
+
+def install_send_scheduler(bot: Bot) -> SendScheduler:
+    scheduler = SendScheduler.from_config()
+    bot.session.middleware(scheduler)
+    return scheduler
@@ -0,0 +1,71 @@
+"""Bot construction: Bot API server (official or self-hosted) and aiohttp connector tuning."""
+
+from __future__ import annotations
+
+import asyncio
+import ssl
+
+import certifi
+from aiogram import Bot, __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from app.config import config
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """AiohttpSession whose connector also takes keep-alive and DNS cache settings.
+
+    AiohttpSession only exposes `limit`, so the connector is built here from the
+    public aiohttp API instead. Proxies are not supported.
+    """
+
+    def __init__(self, *, limit: int, keepalive_timeout: float, ttl_dns_cache: int, **kwargs) -> None:
+        super().__init__(limit=limit, **kwargs)
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self._client: ClientSession | None = None
+
+    async def create_session(self) -> ClientSession:
+        if self._client is None or self._client.closed:
+            connector = TCPConnector(
+                ssl=ssl.create_default_context(cafile=certifi.where()),
+                limit=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.ttl_dns_cache,
+            )
+            self._client = ClientSession(
+                connector=connector,
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}"},
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.closed:
+            await self._client.close()
+            # Same grace period as AiohttpSession for SSL connections to shut down.
+            await asyncio.sleep(0.25)
+
+
+def api_server() -> TelegramAPIServer:
+    base_url = config.TG_API_BASE_URL.rstrip("/")
+    if not base_url:
+        return PRODUCTION
+    return TelegramAPIServer.from_base(base_url, is_local=config.TG_API_LOCAL)
+
+
+def create_session() -> TunedAiohttpSession:
+    return TunedAiohttpSession(
+        api=api_server(),
+        limit=config.TG_CONNECTOR_LIMIT,
+        keepalive_timeout=config.TG_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=config.TG_DNS_CACHE_TTL,
+    )
+
+
+def create_bot(token: str) -> Bot:
+    return Bot(token=token, session=create_session())
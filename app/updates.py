@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from app.deadline import deadline_scope
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateProcessor:
+    """Feeds updates into the dispatcher with a shared concurrency limit.
+
+    Webhook requests call :meth:`process` inline, the polling runner calls
+    :meth:`submit` to run each update as a background task.  Both paths share
+    one semaphore so the two modes have the same throughput characteristics.
+    Each update gets `deadline` seconds from the moment it is handed over, time spent
+    waiting for the semaphore included.
+    """
+
+    def __init__(self, dp: Dispatcher, max_tasks: int, deadline: float = 0.0) -> None:
+        self._dp = dp
+        self._deadline = deadline
+        self._max_tasks = max(1, max_tasks)
+        self._semaphore = asyncio.Semaphore(self._max_tasks)
+        self._tasks: set[asyncio.Task[Any]] = set()
+        self._in_flight = 0
+        self._waiting = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def max_tasks(self) -> int:
+        return self._max_tasks
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    async def process(self, bot: Bot, update: Update) -> Any:
+        with deadline_scope(self._deadline):
+            return await self._process(bot, update)
+
+    async def _process(self, bot: Bot, update: Update) -> Any:
+        self._waiting += 1
+        self._idle.clear()
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self._waiting -= 1
+            self._mark_idle()
+            raise
+        self._waiting -= 1
+        self._in_flight += 1
+        try:
+            return await self._dp.feed_update(bot, update)
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+            self._mark_idle()
+
+    async def submit(self, bot: Bot, update: Update) -> None:
+        """Schedule an update, waiting while the concurrency limit is reached."""
+        while len(self._tasks) >= self._max_tasks:
+            await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.create_task(self._run(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, bot: Bot, update: Update) -> None:
+        try:
+            await self.process(bot, update)
+        except Exception:
+            logger.exception("failed to process update id=%s", update.update_id)
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until every in-flight update is handled; return False on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            if self._tasks:
+                await asyncio.wait(set(self._tasks), timeout=timeout)
+            await asyncio.wait_for(self._idle.wait(), timeout=max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            logger.warning(
+                "drain timed out with %d updates in flight, %d waiting", self._in_flight, self._waiting
+            )
+            for task in list(self._tasks):
+                task.cancel()
+            return False
+        return True
+
+    def _mark_idle(self) -> None:
+        if self._in_flight == 0 and self._waiting == 0:
+            self._idle.set()
@@ -0,0 +1,351 @@
+"""Time the per-update hot paths and compare them with stored baselines.
+
+Covers query normalization, cache keys, every `format_*` function, the rate limiter, the
+inline keyboard and a full webhook round-trip through FastAPI and the dispatcher, with
+DaData answered by an in-process stub and Bot API calls by a null session (no send
+pacing, so the webhook numbers are the instance's processing capacity).
+
+    python benchmarks/bench_hot_paths.py                    # compare with baselines.json
+    python benchmarks/bench_hot_paths.py --update           # record new baselines
+    python benchmarks/bench_hot_paths.py --filter format_ --threshold 0.5
+
+Exits with status 1 when a benchmark is slower than its baseline by more than
+`--threshold` (a fraction, 0.3 = 30%).  Baselines are machine- and interpreter-specific:
+record them on the machine and Python version that run the comparison (baselines.json
+names the interpreter it was recorded with; the committed one comes from CPython 3.12,
+as in CI).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import platform
+import sys
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import formatters  # noqa: E402
+from app.bot import _base_inline  # noqa: E402
+from app.dadata_client import _cache_key, normalize_query_input  # noqa: E402
+from app.graph import AffiliateGraph, GraphNode  # noqa: E402
+from app.metrics import metrics  # noqa: E402
+from app.rate_limit import check_rate_limit  # noqa: E402
+
+BASELINES = Path(__file__).with_name("baselines.json")
+_REPEAT = 5
+_MIN_RUN_SECONDS = 0.2
+
+SUGGESTION: dict[str, Any] = {
+    "value": "ПАО СБЕРБАНК",
+    "data": {
+        "inn": "7707083893",
+        "ogrn": "1027700132195",
+        "kpp": "773601001",
+        "type": "LEGAL",
+        "name": {
+            "short_with_opf": "ПАО Сбербанк",
+            "full_with_opf": "ПУБЛИЧНОЕ АКЦИОНЕРНОЕ ОБЩЕСТВО «СБЕРБАНК РОССИИ»",
+        },
+        "state": {"status": "ACTIVE", "registration_date": 677376000000},
+        "address": {
+            "value": "117997, г Москва, ул Вавилова, д 19",
+            "data": {"city": "Москва", "street_with_type": "ул Вавилова", "house_type_full": "д", "house": "19"},
+        },
+        "management": {"name": "Греф Герман Оскарович", "post": "Президент, председатель правления"},
+        "okved": "64.19",
+        "okveds": [{"main": True, "code": "64.19", "name": "Денежное посредничество прочее"}],
+        "phones": [{"value": "+7 495 500-55-50"}, {"value": "+7 800 555-55-50"}],
+        "emails": [{"value": "sberbank@sberbank.ru"}],
+        "founders": [
+            {"name": "ЦЕНТРАЛЬНЫЙ БАНК РОССИЙСКОЙ ФЕДЕРАЦИИ", "inn": "7702235133", "share": {"value": 50, "type": "%"}},
+        ],
+        "finance": {"year": 2023, "revenue": 3.1e12, "income": 1.5e12, "expense": 1.4e12, "debt": 0, "penalty": 0},
+        "branch_count": 86,
+    },
+}
+BRANCH: dict[str, Any] = {
+    "value": "Московский банк ПАО Сбербанк",
+    "data": {"kpp": "775003035", "address": {"value": "г Москва, ул Большая Андроньевская, д 6"}},
+}
+
+
+def _affiliate_graph() -> AffiliateGraph:
+    root = GraphNode("7707083893", "ПАО Сбербанк", "company")
+    person = GraphNode("500100732259", "Греф Герман Оскарович", "person", role="президент")
+    person.children = [GraphNode(f"77{n:08d}", f'ООО "Дочка {n}"', "company", status="ACTIVE") for n in range(12)]
+    root.children = [GraphNode("7702235133", "ЦБ РФ", "company", role="учредитель"), person]
+    return AffiliateGraph(root, nodes=15, elapsed=1.2)
+
+
+# Arguments for every public formatter; a new `format_*` without an entry fails the run.
+FORMATTER_ARGS: dict[str, Callable[[], tuple[Any, ...]]] = {
+    "format_card": lambda: (SUGGESTION,),
+    "format_requisites": lambda: (SUGGESTION,),
+    "format_contacts": lambda: (SUGGESTION,),
+    "format_founders": lambda: (SUGGESTION,),
+    "format_affiliates": lambda: (_affiliate_graph(),),
+    "format_turnover": lambda: (SUGGESTION,),
+    "format_debts": lambda: (SUGGESTION,),
+    "format_penalties": lambda: (SUGGESTION,),
+    "format_courts": lambda: (SUGGESTION,),
+    "format_address": lambda: (SUGGESTION,),
+    "format_management": lambda: (SUGGESTION,),
+    "format_okved": lambda: (SUGGESTION,),
+    "format_details": lambda: (SUGGESTION,),
+    "format_branch": lambda: (BRANCH,),
+    "format_batch_summary": lambda: (
+        [("7707083893", SUGGESTION, None), ("7736207543", None, None), ("1027700132195", None, "таймаут")] * 7,
+    ),
+    "format_job_status": lambda: ({"id": 12, "status": "running", "total": 50000, "done": 1234, "failed": 3},),
+    "format_daily_report": lambda: (
+        [
+            {
+                "day": date(2025, 1, day),
+                "total": 1000 + day,
+                "unique_users": 100,
+                "cache_hits": 600,
+                "top_inns": [{"inn": "7707083893", "count": 50}, {"inn": "7736207543", "count": 20}],
+            }
+            for day in range(1, 8)
+        ],
+    ),
+    "format_stats": lambda: (metrics.snapshot(),),
+}
+
+
+def _formatters() -> dict[str, Callable[..., str]]:
+    return {
+        name: function
+        for name, function in inspect.getmembers(formatters, inspect.isfunction)
+        if name.startswith("format_") and function.__module__ == formatters.__name__
+    }
+
+
+def _sync_benchmarks() -> dict[str, Callable[[], Any]]:
+    queries = itertools.cycle(["7707083893", "1027700132195", "7707-083-893", "Сбербанк", "1234567890"])
+    benchmarks: dict[str, Callable[[], Any]] = {
+        "normalize_query_input": lambda: normalize_query_input(next(queries)),
+        "cache_key": lambda: _cache_key("findById/party", query="7707083893", count=1),
+        "base_inline": lambda: _base_inline("7707083893:773601001"),
+    }
+    missing = sorted(set(_formatters()) - set(FORMATTER_ARGS))
+    if missing:
+        raise SystemExit(f"no benchmark arguments for: {', '.join(missing)}")
+    for name, function in _formatters().items():
+        args = FORMATTER_ARGS[name]()
+        benchmarks[name] = lambda function=function, args=args: function(*args)
+    return benchmarks
+
+
+async def _bench_rate_limit() -> Callable[[], Awaitable[Any]]:
+    users = itertools.count(10_000_000)
+    return lambda: check_rate_limit(next(users))
+
+
+class _Webhook:
+    """FastAPI app + dispatcher with DaData and the Bot API stubbed out in-process."""
+
+    async def __aenter__(self) -> _Webhook:
+        import httpx
+        from aiogram import Bot
+        from aiogram.client.session.base import BaseSession
+        from aiogram.methods import TelegramMethod
+        from aiogram.types import Chat, Message
+
+        from app import dadata_client, main
+
+        class NullSession(BaseSession):
+            async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None) -> Any:
+                if method.__returning__ is Message or getattr(method, "text", None) is not None:
+                    chat_id = getattr(method, "chat_id", 0)
+                    return Message(
+                        message_id=1,
+                        date=datetime.now(timezone.utc),
+                        chat=Chat(id=chat_id, type="private"),
+                        text=getattr(method, "text", "") or "",
+                    ).as_(bot)
+                return True
+
+            async def close(self) -> None:
+                pass
+
+            async def stream_content(self, *args: Any, **kwargs: Any) -> AsyncGenerator[bytes, None]:
+                for chunk in ():  # nothing to download in a benchmark
+                    yield chunk
+
+        def dadata(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"suggestions": [SUGGESTION]})
+
+        self._main = main
+        self._dadata_client = dadata_client
+        self._saved = (main.bot, main.config.DADATA_API_KEY, dadata_client._http_client)
+        main.bot = Bot(token="42:BENCH", session=NullSession())
+        main.config.DADATA_API_KEY = "bench"
+        dadata_client._http_client = httpx.AsyncClient(transport=httpx.MockTransport(dadata))
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+        self._update_ids = itertools.count(1)
+        return self
+
+    async def post(self, text: str, *, fresh_cache: bool) -> None:
+        if fresh_cache:
+            self._dadata_client._cache.clear()
+        update_id = next(self._update_ids)
+        user_id = 20_000_000 + update_id  # a new user each time, so the rate limiter never refuses
+        update = {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+                "text": text,
+            },
+        }
+        response = await self.client.post("/tg/webhook", json=update)
+        response.raise_for_status()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.client.aclose()
+        await self._dadata_client._http_client.aclose()
+        main = self._main
+        main.bot, main.config.DADATA_API_KEY, self._dadata_client._http_client = self._saved
+
+
+def _measure_sync(function: Callable[[], Any], min_seconds: float) -> float:
+    """Best-of-`_REPEAT` seconds per call, with enough calls per run to last `min_seconds`."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        if time.perf_counter() - started >= min_seconds / _REPEAT or number >= 1_000_000:
+            break
+        number *= 10
+    best = float("inf")
+    for _ in range(_REPEAT):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+async def _measure_async(function: Callable[[], Awaitable[Any]], min_seconds: float) -> float:
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            await function()
+        if time.perf_counter() - started >= min_seconds / _REPEAT or number >= 100_000:
+            break
+        number *= 10
+    best = float("inf")
+    for _ in range(_REPEAT):
+        started = time.perf_counter()
+        for _ in range(number):
+            await function()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+async def run_benchmarks(name_filter: str = "", min_seconds: float = _MIN_RUN_SECONDS) -> dict[str, float]:
+    """Return microseconds per operation for every benchmark whose name contains `name_filter`."""
+    results: dict[str, float] = {}
+    for name, function in _sync_benchmarks().items():
+        if name_filter in name:
+            results[name] = _measure_sync(function, min_seconds) * 1e6
+
+    if name_filter in "check_rate_limit":
+        results["check_rate_limit"] = await _measure_async(await _bench_rate_limit(), min_seconds) * 1e6
+
+    webhook_cases = {
+        "webhook_inn_cache_hit": dict(text="7707083893", fresh_cache=False),
+        "webhook_inn_cache_miss": dict(text="7707083893", fresh_cache=True),
+    }
+    selected = {name: case for name, case in webhook_cases.items() if name_filter in name}
+    if selected:
+        async with _Webhook() as webhook:
+            for name, case in selected.items():
+                results[name] = await _measure_async(lambda case=case: webhook.post(**case), min_seconds) * 1e6
+    return results
+
+
+def compare(results: dict[str, float], baselines: dict[str, float], threshold: float) -> list[str]:
+    """Names of benchmarks slower than their baseline by more than `threshold`."""
+    return [
+        name
+        for name, value in results.items()
+        if name in baselines and value > baselines[name] * (1 + threshold)
+    ]
+
+
+def _load_baselines() -> tuple[dict[str, float], str | None]:
+    """Baseline timings and the Python version they were recorded with."""
+    if not BASELINES.exists():
+        return {}, None
+    recorded = json.loads(BASELINES.read_text(encoding="utf-8"))
+    return recorded["benchmarks"], recorded.get("python")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--update", action="store_true", help="write the results as new baselines")
+    parser.add_argument("--threshold", type=float, default=0.3, help="allowed slowdown, 0.3 = 30%%")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--min-seconds", type=float, default=_MIN_RUN_SECONDS, help="time spent per benchmark")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_benchmarks(args.filter, args.min_seconds))
+    baselines, baseline_python = _load_baselines()
+    current_python = platform.python_version()
+    if baseline_python and baseline_python.split(".")[:2] != current_python.split(".")[:2]:
+        print(
+            f"note: baselines were recorded with Python {baseline_python}, this is {current_python}",
+            file=sys.stderr,
+        )
+    regressions = set(compare(results, baselines, args.threshold))
+
+    print(f"{'benchmark':<28}{'baseline µs':>14}{'current µs':>14}{'change':>10}")
+    for name, value in results.items():
+        baseline = baselines.get(name)
+        change = f"{(value / baseline - 1) * 100:+.0f}%" if baseline else "new"
+        flag = "  ← regression" if name in regressions else ""
+        baseline_text = f"{baseline:.2f}" if baseline else "—"
+        print(f"{name:<28}{baseline_text:>14}{value:>14.2f}{change:>10}{flag}")
+    for name in ("webhook_inn_cache_hit", "webhook_inn_cache_miss"):
+        if name in results:
+            print(f"{name}: ~{1e6 / results[name]:.0f} updates/s on one event loop")
+
+    if args.update:
+        merged = {**baselines, **results}
+        BASELINES.write_text(
+            json.dumps(
+                {
+                    "machine": f"{platform.machine()} {platform.processor() or platform.system()}",
+                    "python": current_python,
+                    "benchmarks": {name: round(value, 3) for name, value in sorted(merged.items())},
+                },
+                ensure_ascii=False,
+                indent=2,
+            )
+            + "\n",
+            encoding="utf-8",
+        )
+        print(f"baselines written to {BASELINES}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,102 @@
+"""Build the trigram name index over synthetic company names and time searches.
+
+"exact" queries are stored names; "typo" queries swap two adjacent letters of the name.
+
+    python benchmarks/bench_name_index.py            # 1 000 000 names
+    python benchmarks/bench_name_index.py --names 200000 --queries 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import random
+import statistics
+import resource
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.name_index import NameIndex, normalize_name  # noqa: E402
+
+_CONSONANTS = "бвгдзклмнпрстфхцчшщ"
+_VOWELS = "аеиоуыэюя"
+_FORMS = ("ООО", "АО", "ПАО", "ИП", "ЗАО")
+_VOCABULARY = 50_000
+
+
+def _vocabulary(rng: random.Random) -> list[str]:
+    words = set()
+    while len(words) < _VOCABULARY:
+        syllables = [rng.choice(_CONSONANTS) + rng.choice(_VOWELS) for _ in range(rng.randint(2, 4))]
+        if rng.random() < 0.5:
+            syllables.append(rng.choice(_CONSONANTS))
+        words.add("".join(syllables).capitalize())
+    vocabulary = sorted(words)
+    rng.shuffle(vocabulary)
+    return vocabulary
+
+
+def synthetic_names(count: int, seed: int = 1) -> list[str]:
+    """Names of 1-3 words drawn from a Zipf-like vocabulary, so some words are very common."""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    names = []
+    for _ in range(count):
+        words = dict.fromkeys(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(1, 3)))
+        names.append(f'{rng.choice(_FORMS)} "{" ".join(words)}"')
+    return names
+
+
+def _typo(name: str, rng: random.Random) -> str:
+    """Swap two adjacent letters inside the quoted part of the name."""
+    start = name.index('"') + 1
+    end = name.rindex('"') - 1
+    if end <= start:
+        return name
+    i = rng.randrange(start, end)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2 :]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--names", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    names = synthetic_names(args.names)
+    index = NameIndex()
+    started = time.perf_counter()
+    for number, name in enumerate(names):
+        index.add(str(number), name)
+    build_sec = time.perf_counter() - started
+    # ru_maxrss is KiB on Linux; includes the generated names themselves.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"names:        {len(index)}")
+    print(f"build:        {build_sec:.1f} s, peak RSS {peak_rss / 1024:.0f} MiB")
+    rng = random.Random(2)
+    samples = rng.sample(range(len(names)), min(args.queries, len(names)))
+    for label, make_query in (("exact", lambda name: name), ("typo", lambda name: _typo(name, rng))):
+        timings: list[float] = []
+        found = 0
+        for number in samples:
+            query = make_query(names[number])
+            started = time.perf_counter()
+            matches = index.search(query, limit=5)
+            timings.append(time.perf_counter() - started)
+            expected = normalize_name(names[number])
+            found += any(normalize_name(match.name) == expected for match in matches)
+        timings.sort()
+        print(
+            f"{label + ':':<14}p50 {statistics.median(timings) * 1000:.3f} ms, "
+            f"p99 {timings[int(len(timings) * 0.99) - 1] * 1000:.3f} ms, recall@5 {found / len(samples):.1%}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+_PATH = Path(__file__).resolve().parents[1] / "benchmarks" / "bench_hot_paths.py"
+
+
+@pytest.fixture(scope="module")
+def bench():
+    spec = importlib.util.spec_from_file_location("bench_hot_paths", _PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    yield module
+    sys.modules.pop(spec.name, None)
+
+
+def test_every_formatter_has_benchmark_arguments(bench) -> None:
+    assert set(bench._formatters()) == set(bench.FORMATTER_ARGS)
+
+
+def test_compare_flags_only_slowdowns_beyond_threshold(bench) -> None:
+    baselines = {"fast": 10.0, "slow": 10.0, "faster": 10.0}
+    results = {"fast": 12.9, "slow": 13.1, "faster": 5.0, "new": 100.0}
+
+    assert bench.compare(results, baselines, 0.3) == ["slow"]
+
+
+@pytest.mark.asyncio
+async def test_all_benchmarks_run(bench) -> None:
+    results = await bench.run_benchmarks(min_seconds=0.0)
+
+    assert "webhook_inn_cache_miss" in results
+    assert "check_rate_limit" in results
+    assert set(bench.FORMATTER_ARGS) <= set(results)
+    assert all(value > 0 for value in results.values())
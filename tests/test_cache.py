@@ -0,0 +1,136 @@
+"""Tests for app.cache.PartyCache."""
+from __future__ import annotations
+
+import pytest
+
+from app.cache import PartyCache, approx_sizeof
+
+
+class FakeTimer:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _suggestion(inn: str, kpp: str = "773601001") -> dict:
+    return {"value": f"ООО {inn}", "data": {"inn": inn, "kpp": kpp, "ogrn": "1027700132195"}}
+
+
+def test_response_and_context_share_one_party_copy() -> None:
+    cache = PartyCache(maxsize=100, ttl=60)
+    suggestion = _suggestion("7707083893")
+    cache.put_response("findById/party?count=1&query=7707083893", {"suggestions": [suggestion]})
+    cache.put_context("7707083893", suggestion)
+
+    # One party entry, one response reference and one context reference.
+    assert len(cache) == 3
+    response = cache.get_response("findById/party?count=1&query=7707083893")
+    assert response == {"suggestions": [suggestion]}
+    assert response["suggestions"][0] is cache.get_context("7707083893")
+
+
+def test_entries_expire_after_ttl() -> None:
+    timer = FakeTimer()
+    cache = PartyCache(maxsize=100, ttl=10, timer=timer)
+    cache.put_context("7707083893", _suggestion("7707083893"))
+
+    timer.now = 9.9
+    assert cache.get_context("7707083893") is not None
+    timer.now = 10.0
+    assert cache.get_context("7707083893") is None
+    assert cache.expire() == 1
+    assert len(cache) == 0
+
+
+def test_response_is_a_miss_when_party_was_evicted() -> None:
+    cache = PartyCache(maxsize=2, ttl=60)
+    cache.put_response("k", {"suggestions": [_suggestion("7707083893")]})
+    cache.put_context("other", _suggestion("7736050003"))
+
+    assert cache.get_response("k") is None
+
+
+def test_lfu_policy_keeps_frequently_read_entries() -> None:
+    cache = PartyCache(maxsize=2, ttl=60, policy="lfu")
+    cache.put_response("hot", {"suggestions": []})
+    cache.put_response("cold", {"suggestions": []})
+    for _ in range(3):
+        cache.get_response("hot")
+    cache.put_response("new", {"suggestions": []})
+
+    assert cache.get_response("hot") is not None
+    assert cache.get_response("cold") is None
+
+
+def test_byte_budget_bounds_cache_size() -> None:
+    budget = approx_sizeof(_suggestion("7707083893")) * 3
+    cache = PartyCache(maxsize=0, ttl=60, max_bytes=budget)
+    for i in range(20):
+        cache.put_context(str(7707083800 + i), _suggestion(str(7707083800 + i)))
+
+    assert 0 < cache.currsize <= budget
+
+
+def test_unknown_policy_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        PartyCache(maxsize=10, ttl=60, policy="fifo")
+
+
+def test_snapshot_round_trip_keeps_remaining_ttl(tmp_path) -> None:
+    timer = FakeTimer()
+    cache = PartyCache(maxsize=100, ttl=60, timer=timer)
+    suggestion = _suggestion("7707083893")
+    cache.put_response("findById/party?count=1&query=7707083893", {"suggestions": [suggestion]})
+    cache.put_context("7707083893", suggestion)
+    timer.now = 20.0
+    cache.put_context("7736050003", _suggestion("7736050003"))
+
+    path = tmp_path / "cache.snapshot"
+    assert cache.save_snapshot(path, clock=lambda: 1000.0) == 5
+
+    restored_timer = FakeTimer()
+    restored = PartyCache(maxsize=100, ttl=60, timer=restored_timer)
+    # 30 seconds offline: entries written at 0 have 10 s left, the one written at 20 has 30 s.
+    assert restored.load_snapshot(path, clock=lambda: 1030.0) == 5
+    assert restored.get_response("findById/party?count=1&query=7707083893") == {"suggestions": [suggestion]}
+    restored_timer.now = 10.0
+    assert restored.get_context("7707083893") is None
+    assert restored.get_context("7736050003") is not None
+
+
+def test_snapshot_drops_entries_that_expired_offline(tmp_path) -> None:
+    cache = PartyCache(maxsize=100, ttl=60)
+    cache.put_context("7707083893", _suggestion("7707083893"))
+    path = tmp_path / "cache.snapshot"
+    cache.save_snapshot(path, clock=lambda: 0.0)
+
+    assert PartyCache(maxsize=100, ttl=60).load_snapshot(path, clock=lambda: 61.0) == 0
+
+
+def test_snapshot_size_cap_keeps_most_recent_entries(tmp_path) -> None:
+    timer = FakeTimer()
+    cache = PartyCache(maxsize=100, ttl=60, timer=timer)
+    for i in range(10):
+        timer.now = float(i)
+        cache.put_context(str(7707083800 + i), _suggestion(str(7707083800 + i)))
+    path = tmp_path / "cache.snapshot"
+    full = path.with_name("full.snapshot")
+    cache.save_snapshot(full)
+
+    saved = cache.save_snapshot(path, max_bytes=full.stat().st_size // 3)
+
+    restored = PartyCache(maxsize=100, ttl=60)
+    assert 0 < saved < 20
+    assert restored.load_snapshot(path) == saved
+    assert restored.get_context("7707083809") is not None
+    assert restored.get_context("7707083800") is None
+
+
+def test_load_snapshot_rejects_foreign_files(tmp_path) -> None:
+    path = tmp_path / "cache.snapshot"
+    path.write_bytes(b"not a snapshot")
+
+    with pytest.raises(ValueError):
+        PartyCache(maxsize=10, ttl=60).load_snapshot(path)
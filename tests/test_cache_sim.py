@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from cachetools import LRUCache
+
+from app.cache_sim import (
+    cheapest,
+    fresh_accesses,
+    lru_curve,
+    main,
+    read_trace,
+    replay_lfu,
+    reuse_distances,
+    simulate,
+)
+from app.db import EXPORT_COLUMNS
+from app.export import export_chunks
+
+
+def _lru_replay(keys: list[str], size: int) -> float:
+    cache: LRUCache = LRUCache(maxsize=size)
+    hits = 0
+    for key in keys:
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            cache[key] = True
+    return hits / len(keys)
+
+
+def test_reuse_distances_count_distinct_keys_in_between() -> None:
+    assert reuse_distances(["a", "b", "a", "c", "b", "a", "a"]) == [-1, -1, 1, -1, 2, 2, 0]
+
+
+def test_single_pass_lru_curve_matches_replay() -> None:
+    rng = random.Random(7)
+    # Zipf-like popularity, like real INN lookups.
+    keys = [str(int(rng.paretovariate(1.2))) for _ in range(5000)]
+    sizes = [1, 4, 16, 64, 256]
+
+    curve = lru_curve(reuse_distances(keys), [True] * len(keys), sizes)
+
+    for size in sizes:
+        assert curve[size] == pytest.approx(_lru_replay(keys, size))
+
+
+def test_ttl_counts_from_the_write_not_the_last_read() -> None:
+    accesses = [(0.0, "a"), (50.0, "a"), (99.0, "a"), (100.0, "a"), (150.0, "a")]
+
+    assert fresh_accesses(accesses, ttl=100) == [False, True, True, False, True]
+    assert fresh_accesses(accesses, ttl=0) == [False, True, True, True, True]
+
+
+def test_lfu_keeps_the_frequent_key() -> None:
+    accesses = [(float(t), key) for t, key in enumerate(["hot", "hot", "a", "hot", "b", "hot", "c", "hot"])]
+
+    assert replay_lfu(accesses, size=2, ttl=0) == pytest.approx(4 / 8)
+
+
+def test_cheapest_configuration_reaching_target() -> None:
+    accesses = [(float(t), key) for t, key in enumerate(["a", "b", "c"] * 10)]
+
+    results = simulate(accesses, sizes=[1, 2, 3, 4], ttls=[0, 60])
+    best = cheapest(results, target=0.85)
+
+    # An unbounded TTL is reported but never recommended: PartyCache needs a finite one.
+    assert best is not None and best.size == 3 and best.ttl == 60 and best.hit_ratio == pytest.approx(0.9)
+    assert next(r for r in results if r.policy == "ttl").hit_ratio == pytest.approx(0.9)
+    assert cheapest(results, target=0.95) is None
+
+
+async def _rows():
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i, (query, inn) in enumerate([("7707083893", "7707083893"), ("Сбербанк", "7707083893"), ("нет такой", None)]):
+        yield {
+            "id": i,
+            "created_at": start + timedelta(seconds=i),
+            "user_id": 1,
+            "query": query,
+            "query_kind": "inn",
+            "inn": inn,
+            "cache_hit": False,
+        }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+async def test_reads_admin_export_files(tmp_path, fmt: str) -> None:
+    path = tmp_path / f"trace.{fmt}"
+    path.write_text("".join([chunk async for chunk in export_chunks(_rows(), EXPORT_COLUMNS, fmt)]), encoding="utf-8")
+
+    accesses = list(read_trace(path))
+
+    assert [key for _, key in accesses] == ["7707083893", "7707083893", "нет такой"]
+    assert accesses[1][0] - accesses[0][0] == 1.0
+
+
+def test_cli_prints_curves_and_recommendation(tmp_path, capsys: pytest.CaptureFixture[str]) -> None:
+    path = tmp_path / "trace.ndjson"
+    lines = [
+        f'{{"created_at": "2025-01-01T00:00:{t:02d}+00:00", "query": "{key}", "inn": "{key}"}}'
+        for t, key in enumerate(["1", "2", "1", "2", "1", "3"])
+    ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    assert main(["--trace", str(path), "--sizes", "1,2", "--ttls", "0,60", "--target", "0.5"]) == 0
+
+    out = capsys.readouterr().out
+    assert "6 requests, 3 distinct companies" in out
+    assert "cheapest for 50%: CACHE_POLICY=lru CACHE_MAX_ENTRIES=6 CACHE_TTL=60 (50.0%)" in out
+
+    assert main(["--trace", str(path), "--sizes", "1,2", "--ttls", "0", "--target", "0.5"]) == 0
+    assert "no simulated configuration with a finite TTL reaches 50%" in capsys.readouterr().out
@@ -8,11 +8,14 @@ import pytest
 
 from app.dadata_client import (
     _cache,
+    extract_identifiers,
     find_by_id_party,
     find_party_universal,
+    lookup_parties,
     suggest_party,
     validate_inn,
 )
+from app.name_index import name_index
 
 SAMPLE_RESPONSE = {
     "suggestions": [
@@ -31,8 +34,10 @@ SAMPLE_RESPONSE = {
 @pytest.fixture(autouse=True)
 def clear_dadata_cache():
     _cache.clear()
+    name_index.clear()
     yield
     _cache.clear()
+    name_index.clear()
 
 
 def _make_mock_client(json_data=None, status_code=200, raise_on_status=None):
@@ -144,3 +149,61 @@ async def test_find_party_universal_falls_back_to_find_by_id_for_numeric_without
     assert result == SAMPLE_RESPONSE
     sp.assert_awaited_once()
     fb.assert_awaited_once_with("key", query="7707083893", count=1)
+
+
+@pytest.mark.asyncio
+async def test_find_party_universal_skips_suggest_on_local_name_match():
+    name_index.add("7707083893", "ПАО Сбербанк")
+    with patch("app.dadata_client.suggest_party", new_callable=AsyncMock) as sp, patch(
+        "app.dadata_client.find_by_id_party", new_callable=AsyncMock
+    ) as fb:
+        fb.return_value = SAMPLE_RESPONSE
+        result = await find_party_universal("key", "сбербанк")
+    assert result == SAMPLE_RESPONSE
+    sp.assert_not_awaited()
+    fb.assert_awaited_once_with("key", query="7707083893", count=1)
+
+
+@pytest.mark.asyncio
+async def test_post_dadata_indexes_returned_names():
+    mock_cm, _, _ = _make_mock_client(json_data=SAMPLE_RESPONSE)
+    with patch("app.dadata_client.httpx.AsyncClient", return_value=mock_cm):
+        await find_by_id_party("test_key", "7707083893")
+    assert name_index.search("Сбербанк")[0].key == "7707083893"
+
+
+def test_extract_identifiers_finds_each_number_once():
+    text = "Счёт: ИНН 7707083893, КПП 773601001; поставщик 7736050003, ОГРН 1027700132195. Повтор 7707083893"
+    assert extract_identifiers(text) == [
+        ("7707083893", "inn"),
+        ("7736050003", "inn"),
+        ("1027700132195", "ogrn"),
+    ]
+    assert extract_identifiers(text, limit=2) == [("7707083893", "inn"), ("7736050003", "inn")]
+
+
+@pytest.mark.asyncio
+async def test_lookup_parties_bounds_concurrency_and_collects_errors():
+    import asyncio
+
+    in_flight = 0
+    peak = 0
+
+    async def fake_find(api_key, query, count=1):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if query == "bad":
+            raise ValueError("boom")
+        return {"suggestions": [{"value": query}]}
+
+    queries = ["a", "b", "bad", "c", "d"]
+    with patch("app.dadata_client.find_by_id_party", side_effect=fake_find):
+        results = dict([item async for item in lookup_parties("key", queries, concurrency=2)])
+
+    assert peak == 2
+    assert set(results) == set(queries)
+    assert isinstance(results["bad"], ValueError)
+    assert results["a"] == {"suggestions": [{"value": "a"}]}
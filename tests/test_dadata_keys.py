@@ -0,0 +1,162 @@
+"""Tests for app.dadata_keys: weighted key selection, ejection and pooled requests."""
+from __future__ import annotations
+
+from collections import Counter
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+
+from app import dadata_client
+from app.dadata_keys import KeyPool, NoAvailableKeyError
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_acquire_spreads_requests_by_remaining_quota() -> None:
+    pool = KeyPool(["key-a-123456", "key-b-123456"], daily_quota=100, cooldown=60, timer=FakeClock())
+    pool.available()  # starts the quota day
+    pool._states["key-b-123456"].used_today = 50  # 100 vs 50 remaining
+
+    picks = Counter(pool.acquire() for _ in range(30))
+
+    assert picks["key-a-123456"] == 20
+    assert picks["key-b-123456"] == 10
+
+
+def test_rate_limited_key_is_ejected_for_cooldown() -> None:
+    clock = FakeClock()
+    pool = KeyPool(["key-a-123456", "key-b-123456"], daily_quota=100, cooldown=60, timer=clock)
+
+    pool.record("key-a-123456", 429)
+    assert {pool.acquire() for _ in range(5)} == {"key-b-123456"}
+    assert pool.available() == 1
+
+    clock.now += 61
+    assert pool.available() == 2
+
+
+def test_exhausted_key_returns_after_moscow_midnight() -> None:
+    clock = FakeClock()
+    pool = KeyPool(["key-a-123456", "key-b-123456"], daily_quota=100, cooldown=60, timer=clock)
+
+    pool.record("key-a-123456", 403, daily_limit=True)
+    clock.now += 3600
+    assert {pool.acquire() for _ in range(5)} == {"key-b-123456"}
+
+    clock.now += 24 * 3600
+    assert pool.available() == 2
+    assert pool._states["key-a-123456"].rejected == {403: 1}
+
+
+def test_plain_403_ejects_for_cooldown_only() -> None:
+    clock = FakeClock()
+    pool = KeyPool(["key-a-123456", "key-b-123456"], daily_quota=0, cooldown=60, timer=clock)
+
+    pool.record("key-a-123456", 403)
+    assert pool.available() == 1
+
+    clock.now += 61
+    assert pool.available() == 2
+
+
+def test_last_usable_key_is_never_ejected() -> None:
+    clock = FakeClock()
+    pool = KeyPool(["key-a-123456"], daily_quota=0, cooldown=60, timer=clock)
+
+    for status in (401, 403, 429):
+        pool.record("key-a-123456", status, daily_limit=True)
+        assert pool.acquire() == "key-a-123456"
+    assert next(iter(pool.as_dict().values()))["ejected_for"] == 0.0
+
+
+def test_quota_is_counted_per_day() -> None:
+    clock = FakeClock()
+    pool = KeyPool(["key-a-123456"], daily_quota=2, cooldown=60, timer=clock)
+    pool.acquire()
+    pool.acquire()
+    with pytest.raises(NoAvailableKeyError):
+        pool.acquire()
+    clock.now += 24 * 3600
+    assert pool.acquire() == "key-a-123456"
+
+
+def test_zero_quota_means_no_local_cap() -> None:
+    pool = KeyPool(["key-a-123456", "key-b-123456"], daily_quota=0, cooldown=60, timer=FakeClock())
+
+    picks = Counter(pool.acquire() for _ in range(20_001))
+
+    assert abs(picks["key-a-123456"] - picks["key-b-123456"]) == 1
+    assert pool.available() == 2
+    assert {stats["remaining"] for stats in pool.as_dict().values()} == {None}
+
+    pool.record("key-a-123456", 403)
+    assert pool.available() == 1
+
+
+@pytest.mark.asyncio
+async def test_post_dadata_uses_pool_keys_and_ejects_on_403(monkeypatch: pytest.MonkeyPatch) -> None:
+    pool = KeyPool(["key-a-123456", "key-b-123456"], daily_quota=100, cooldown=60, timer=FakeClock())
+    monkeypatch.setattr(dadata_client, "key_pool", pool)
+    dadata_client._cache.clear()
+
+    used = []
+
+    async def post(url, json, headers, timeout=None):
+        key = headers["Authorization"].removeprefix("Token ")
+        used.append(key)
+        response = MagicMock()
+        if key == "key-a-123456":
+            request = httpx.Request("POST", url)
+            response.raise_for_status.side_effect = httpx.HTTPStatusError(
+                "forbidden", request=request, response=httpx.Response(403, request=request)
+            )
+        else:
+            response.raise_for_status.return_value = None
+            response.json.return_value = {"suggestions": []}
+        return response
+
+    client = AsyncMock()
+    client.post = post
+    monkeypatch.setattr(dadata_client, "_http_client", client)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await dadata_client.find_by_id_party("key-a-123456", "7707083893")
+    await dadata_client.find_by_id_party("key-a-123456", "7736050003")
+    await dadata_client.find_by_id_party("key-a-123456", "1027700132195")
+
+    assert used == ["key-a-123456", "key-b-123456", "key-b-123456"]
+    dadata_client._cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_single_key_survives_a_403(monkeypatch: pytest.MonkeyPatch) -> None:
+    pool = KeyPool(["key-a-123456"], daily_quota=0, cooldown=60, timer=FakeClock())
+    monkeypatch.setattr(dadata_client, "key_pool", pool)
+    dadata_client._cache.clear()
+    statuses = [403, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status = statuses.pop(0)
+        if status == 403:
+            return httpx.Response(403, json={"message": "Daily request limit exceeded"})
+        return httpx.Response(200, json={"suggestions": []})
+
+    monkeypatch.setattr(dadata_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await dadata_client.find_by_id_party("key-a-123456", "7707083893")
+    assert await dadata_client.find_by_id_party("key-a-123456", "7736050003") == {"suggestions": []}
+    dadata_client._cache.clear()
+
+
+def test_daily_limit_is_read_from_the_403_body() -> None:
+    assert dadata_client._is_daily_limit(httpx.Response(403, json={"message": "Daily request limit exceeded"}))
+    assert not dadata_client._is_daily_limit(httpx.Response(403, json={"message": "Forbidden"}))
+    assert not dadata_client._is_daily_limit(httpx.Response(429, text="limit"))
@@ -1,17 +1,62 @@
 from __future__ import annotations
 
+from datetime import date, datetime, timezone
+
 import pytest
 
 from app import db
 
 
+class DummyTransaction:
+    async def __aenter__(self) -> None:
+        return None
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
 class DummyConn:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        applied: list[int] | None = None,
+        partitions: list[str] | None = None,
+        rows: list[dict[str, object]] | None = None,
+    ) -> None:
         self.executed: list[tuple[str, tuple[object, ...]]] = []
+        self.applied = applied or []
+        self.partitions = partitions or []
+        self.rows = rows or []
+        self.fetched: list[tuple[str, tuple[object, ...]]] = []
+        self.transactions: list[dict[str, object]] = []
 
     async def execute(self, query: str, *params: object) -> None:
         self.executed.append((query, params))
 
+    async def fetch(self, query: str, *params: object) -> list[dict[str, object]]:
+        self.fetched.append((query, params))
+        if "schema_migrations" in query:
+            return [{"version": version} for version in self.applied]
+        if "pg_inherits" in query:
+            return [{"name": name} for name in self.partitions]
+        return []
+
+    async def fetchval(self, query: str, *params: object) -> object:
+        if "INSERT INTO check_jobs" in query:
+            return 41
+        return None
+
+    async def copy_records_to_table(self, table: str, *, records: list[tuple], columns: tuple[str, ...]) -> None:
+        self.copied = (table, list(records), columns)
+
+    def transaction(self, **options: object) -> DummyTransaction:
+        self.transactions.append(options)
+        return DummyTransaction()
+
+    async def cursor(self, query: str, *params: object, prefetch: int | None = None):
+        self.executed.append((query, params))
+        for row in self.rows:
+            yield row
+
 
 class DummyAcquire:
     def __init__(self, conn: DummyConn) -> None:
@@ -32,6 +77,10 @@ class DummyPool:
         return DummyAcquire(self.conn)
 
 
+def _sql(conn: DummyConn) -> list[str]:
+    return [query for query, _ in conn.executed]
+
+
 @pytest.mark.asyncio
 async def test_init_db_executes_create_table() -> None:
     conn = DummyConn()
@@ -40,7 +89,48 @@ async def test_init_db_executes_create_table() -> None:
     await db.init_db(pool)
 
     assert conn.executed
-    assert "CREATE TABLE IF NOT EXISTS check_requests" in conn.executed[0][0]
+    assert any("CREATE TABLE IF NOT EXISTS check_requests" in query for query in _sql(conn))
+    assert any("PARTITION BY RANGE (created_at)" in query for query in _sql(conn))
+    assert any("check_requests_inn_created_idx" in query for query in _sql(conn))
+
+
+@pytest.mark.asyncio
+async def test_migrate_skips_applied_versions() -> None:
+    conn = DummyConn(applied=[version for version, _ in db.MIGRATIONS])
+
+    assert await db.migrate(conn) == []
+    assert not any("check_requests_legacy" in query for query in _sql(conn))
+
+
+@pytest.mark.asyncio
+async def test_migrate_applies_pending_versions_in_order() -> None:
+    conn = DummyConn(applied=[1])
+
+    assert await db.migrate(conn) == [2, 3]
+    assert ("INSERT INTO schema_migrations (version) VALUES ($1)", (2,)) in conn.executed
+
+
+@pytest.mark.asyncio
+async def test_ensure_partitions_creates_current_and_next_months() -> None:
+    conn = DummyConn()
+
+    await db.ensure_partitions(conn, date(2025, 12, 17), months_ahead=2)
+
+    created = _sql(conn)
+    assert "check_requests_p202512" in created[0]
+    assert "FROM ('2025-12-01') TO ('2026-01-01')" in created[0]
+    assert "check_requests_p202601" in created[1]
+    assert "check_requests_p202602" in created[2]
+
+
+@pytest.mark.asyncio
+async def test_drop_expired_partitions_keeps_recent_and_default() -> None:
+    conn = DummyConn(partitions=["check_requests_p202501", "check_requests_p202506", "check_requests_default"])
+
+    dropped = await db.drop_expired_partitions(conn, date(2025, 7, 15), retention_days=90)
+
+    assert dropped == ["check_requests_p202501"]
+    assert _sql(conn) == ["DROP TABLE IF EXISTS check_requests_p202501"]
 
 
 @pytest.mark.asyncio
@@ -48,13 +138,68 @@ async def test_log_request_executes_insert() -> None:
     conn = DummyConn()
     pool = DummyPool(conn)
 
-    await db.log_request(pool, "7707083893")
+    await db.log_request(pool, "7707083893", query_kind="inn", inn="7707083893", user_id=5, cache_hit=True)
 
     assert conn.executed == [
-        ("INSERT INTO check_requests (query) VALUES ($1)", ("7707083893",)),
+        (
+            "INSERT INTO check_requests (query, query_kind, inn, user_id, cache_hit) VALUES ($1, $2, $3, $4, $5)",
+            ("7707083893", "inn", "7707083893", 5, True),
+        ),
     ]
 
 
+@pytest.mark.asyncio
+async def test_iter_requests_streams_filtered_rows_through_cursor() -> None:
+    conn = DummyConn(rows=[{"id": 1}, {"id": 2}])
+    since = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    rows = [row async for row in db.iter_requests(DummyPool(conn), since=since, inn="7707083893")]
+
+    assert rows == [{"id": 1}, {"id": 2}]
+    assert conn.transactions == [{"readonly": True}]
+    [(query, params)] = conn.executed
+    assert "FROM check_requests WHERE created_at >= $1 AND inn = $2 ORDER BY created_at, id" in query
+    assert params == (since, "7707083893")
+
+
+@pytest.mark.asyncio
+async def test_iter_requests_without_filters_has_no_where() -> None:
+    conn = DummyConn()
+
+    assert [row async for row in db.iter_requests(DummyPool(conn))] == []
+    assert "WHERE" not in conn.executed[0][0]
+
+
+@pytest.mark.asyncio
+async def test_create_job_copies_items_in_order() -> None:
+    conn = DummyConn()
+
+    job_id = await db.create_job(DummyPool(conn), ["7707083893", "1027700132195"], user_id=5, chat_id=5)
+
+    assert job_id == 41
+    assert conn.copied == (
+        "check_job_items",
+        [(41, 0, "7707083893"), (41, 1, "1027700132195")],
+        ("job_id", "position", "query"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_complete_job_items_sends_columns_as_arrays() -> None:
+    conn = DummyConn()
+
+    await db.complete_job_items(
+        DummyPool(conn),
+        [(1, 0, 1, "found", "{}", None, None), (1, 1, 2, "pending", None, "timeout", 60.0)],
+    )
+
+    [(query, params)] = conn.fetched
+    assert "$1::bigint[]" in query
+    assert params == (
+        (1, 1), (0, 1), (1, 2), ("found", "pending"), ("{}", None), (None, "timeout"), (None, 60.0)
+    )
+
+
 def test_postgres_enabled_uses_required_fields(monkeypatch: pytest.MonkeyPatch) -> None:
     monkeypatch.setattr(db.config, "POSTGRES_HOST", "db")
     monkeypatch.setattr(db.config, "POSTGRES_DB", "bearing")
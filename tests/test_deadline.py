@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app import dadata_client
+from app.deadline import DeadlineExceeded, deadline_scope, remaining
+from app.metrics import metrics
+from app.updates import UpdateProcessor
+
+SUGGESTION = {"value": "ПАО Сбербанк", "data": {"inn": "7707083893", "kpp": "773601001"}}
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch: pytest.MonkeyPatch):
+    dadata_client._cache.clear()
+    dadata_client.stats.reset()
+    metrics.reset()
+    monkeypatch.setattr(dadata_client.config, "DADATA_TIMEOUT", 10.0)
+    monkeypatch.setattr(dadata_client.config, "DADATA_HEDGE", False)
+    yield
+    dadata_client._cache.clear()
+    dadata_client.stats.reset()
+    metrics.reset()
+
+
+def _client(monkeypatch: pytest.MonkeyPatch, handler) -> list[httpx.Request]:
+    requests: list[httpx.Request] = []
+
+    async def record(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return await handler(request)
+
+    monkeypatch.setattr(dadata_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(record)))
+    return requests
+
+
+def test_nested_scope_cannot_extend_the_outer_deadline() -> None:
+    assert remaining() is None
+    with deadline_scope(1.0):
+        with deadline_scope(60.0):
+            assert remaining() <= 1.0
+        with deadline_scope(0.5):
+            assert remaining() <= 0.5
+        with deadline_scope(0):
+            assert 0.5 < remaining() <= 1.0
+    assert remaining() is None
+
+
+@pytest.mark.asyncio
+async def test_budget_timeout_is_a_deadline_not_a_dadata_failure(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={"suggestions": [SUGGESTION]})
+
+    requests = _client(monkeypatch, handler)
+
+    started = time.monotonic()
+    with deadline_scope(0.05):
+        with pytest.raises(DeadlineExceeded):
+            await dadata_client.find_by_id_party("key", "7707083893", count=1)
+    assert time.monotonic() - started < 1.0
+    with deadline_scope(0.001):
+        await asyncio.sleep(0.01)
+        with pytest.raises(DeadlineExceeded):
+            await dadata_client.find_by_id_party("key", "7736050003", count=1)
+    await asyncio.sleep(0)
+
+    assert len(requests) == 1  # the second call had no time left and was not sent
+    assert requests[0].extensions["timeout"]["read"] == 10.0
+    assert dadata_client.stats.failures == 0
+    assert metrics.dadata_cancelled == 1  # nobody else was waiting for the first request
+    assert not dadata_client._in_flight
+
+
+@pytest.mark.asyncio
+async def test_coalesced_callers_keep_their_own_budgets(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.3)
+        return httpx.Response(200, json={"suggestions": [SUGGESTION]})
+
+    requests = _client(monkeypatch, handler)
+
+    async def lookup(budget: float | None) -> dict:
+        with deadline_scope(budget):
+            return await dadata_client.find_by_id_party("key", "7707083893", count=1)
+
+    hurried = asyncio.create_task(lookup(0.1))
+    patient = asyncio.create_task(lookup(None))
+    generous = asyncio.create_task(lookup(5.0))
+
+    with pytest.raises(DeadlineExceeded):
+        await hurried
+    assert await patient == {"suggestions": [SUGGESTION]}
+    assert await generous == {"suggestions": [SUGGESTION]}
+    assert len(requests) == 1
+    assert metrics.dadata_cancelled == 0
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_takes_the_faster_answer(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(dadata_client.config, "DADATA_HEDGE", True)
+    monkeypatch.setattr(dadata_client.config, "DADATA_HEDGE_MIN_DELAY", 0.02)
+    for _ in range(20):
+        metrics.dadata_latency.observe(0.001)
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.sleep(5)  # a stuck request: the tail we want to cut
+        return httpx.Response(200, json={"suggestions": [SUGGESTION]})
+
+    requests = _client(monkeypatch, handler)
+
+    started = time.monotonic()
+    response = await dadata_client.find_by_id_party("key", "7707083893", count=1)
+
+    assert time.monotonic() - started < 1.0
+    assert response["suggestions"] == [SUGGESTION]
+    assert len(requests) == 2
+    assert metrics.snapshot()["dadata_hedges"] == {"fired": 1, "won": 1}
+    assert dadata_client.stats.successes == 1 and dadata_client.stats.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelling_a_hedged_call_before_the_hedge_cancels_the_request(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(dadata_client.config, "DADATA_HEDGE", True)
+    monkeypatch.setattr(dadata_client.config, "DADATA_HEDGE_MIN_DELAY", 0.2)
+    metrics.dadata_latency.observe(0.001)
+    finished: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.3)
+        finished.append(request)
+        return httpx.Response(200, json={"suggestions": [SUGGESTION]})
+
+    requests = _client(monkeypatch, handler)
+
+    lookup = asyncio.create_task(dadata_client.find_by_id_party("key", "7707083893", count=1))
+    await asyncio.sleep(0.05)
+    lookup.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await lookup
+    await asyncio.sleep(0.4)
+
+    assert len(requests) == 1
+    assert finished == []
+    assert metrics.dadata_hedges == 0
+    assert not dadata_client._in_flight
+
+
+@pytest.mark.asyncio
+async def test_fast_answer_is_not_hedged(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(dadata_client.config, "DADATA_HEDGE", True)
+    monkeypatch.setattr(dadata_client.config, "DADATA_HEDGE_MIN_DELAY", 0.5)
+    metrics.dadata_latency.observe(0.001)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"suggestions": []})
+
+    requests = _client(monkeypatch, handler)
+    await dadata_client.find_by_id_party("key", "7707083893", count=1)
+
+    assert len(requests) == 1
+    assert metrics.dadata_hedges == 0
+
+
+@pytest.mark.asyncio
+async def test_update_processor_gives_each_update_a_deadline() -> None:
+    seen: list[float | None] = []
+
+    class Dispatcher:
+        async def feed_update(self, bot, update):
+            seen.append(remaining())
+
+    await UpdateProcessor(Dispatcher(), max_tasks=1, deadline=3.0).process(object(), object())
+    await UpdateProcessor(Dispatcher(), max_tasks=1).process(object(), object())
+
+    assert 2.9 < seen[0] <= 3.0
+    assert seen[1] is None
@@ -0,0 +1,116 @@
+"""Tests for app.egrul snapshot importer and reader."""
+from __future__ import annotations
+
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app import bot as bot_module
+from app import egrul
+from app.formatters import format_card
+
+EGRUL_XML = """<?xml version="1.0" encoding="utf-8"?>
+<Файл ИдФайл="1" ВерсФорм="4.06">
+  <Документ ИдДок="1">
+    <СвЮЛ ОГРН="1027700132195" ДатаОГРН="2002-08-16" ИНН="7707083893" КПП="773601001">
+      <СвНаимЮЛ НаимЮЛПолн="ПУБЛИЧНОЕ АКЦИОНЕРНОЕ ОБЩЕСТВО &quot;СБЕРБАНК РОССИИ&quot;">
+        <СвНаимЮЛСокр НаимСокр="ПАО СБЕРБАНК"/>
+      </СвНаимЮЛ>
+      <СвАдресЮЛ>
+        <АдресРФ Индекс="117312" Дом="19">
+          <Город ТипГород="ГОРОД" НаимГород="МОСКВА"/>
+          <Улица ТипУлица="УЛИЦА" НаимУлица="ВАВИЛОВА"/>
+        </АдресРФ>
+      </СвАдресЮЛ>
+      <СведДолжнФЛ>
+        <СвФЛ Фамилия="ГРЕФ" Имя="ГЕРМАН" Отчество="ОСКАРОВИЧ"/>
+        <СвДолжн НаимДолжн="ПРЕЗИДЕНТ"/>
+      </СведДолжнФЛ>
+      <СвОКВЭД><СвОКВЭДОсн КодОКВЭД="64.19"/></СвОКВЭД>
+    </СвЮЛ>
+  </Документ>
+  <Документ ИдДок="2">
+    <СвИП ОГРНИП="304500116000157" ДатаОГРНИП="2004-01-01" ИННФЛ="500100732259">
+      <СвФЛ><ФИОРус Фамилия="ИВАНОВ" Имя="ИВАН" Отчество="ИВАНОВИЧ"/></СвФЛ>
+      <СвПрекрИП ДатаПрекрИП="2020-01-01"/>
+    </СвИП>
+  </Документ>
+</Файл>
+"""
+
+EGRUL_CSV = """inn;ogrn;name_short;status;registration_date;okved
+7736050003;1027700070518;ПАО ГАЗПРОМ;ACTIVE;1993-02-25;49.50.21
+"""
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path):
+    xml_path = tmp_path / "egrul.xml"
+    xml_path.write_text(EGRUL_XML, encoding="utf-8")
+    csv_path = tmp_path / "extra.csv"
+    csv_path.write_text(EGRUL_CSV, encoding="utf-8")
+    out = tmp_path / "snapshot"
+    assert egrul.build_snapshot(egrul.iter_dump_records([xml_path, csv_path]), out) == 6
+    return out
+
+
+def test_lookup_by_inn_and_ogrn(snapshot_dir) -> None:
+    snapshot = egrul.EgrulSnapshot(snapshot_dir)
+    try:
+        by_inn = snapshot.lookup("7707083893")
+        by_ogrn = snapshot.lookup("1027700132195")
+        assert by_inn == by_ogrn
+        assert by_inn["name_short"] == "ПАО СБЕРБАНК"
+        assert by_inn["address"] == "117312, ГОРОД МОСКВА, УЛИЦА ВАВИЛОВА, 19"
+        assert by_inn["management_name"] == "ГРЕФ ГЕРМАН ОСКАРОВИЧ"
+        assert snapshot.lookup("500100732259")["status"] == "LIQUIDATED"
+        assert snapshot.lookup("7736050003")["okved"] == "49.50.21"
+        assert snapshot.lookup("7707083894") is None
+        assert snapshot.lookup("not-an-inn") is None
+        assert len(list(snapshot.iter_records())) == 3
+    finally:
+        snapshot.close()
+
+
+def test_iter_records_reads_records_split_across_chunks(snapshot_dir, monkeypatch: pytest.MonkeyPatch) -> None:
+    snapshot = egrul.EgrulSnapshot(snapshot_dir)
+    try:
+        whole = list(snapshot.iter_records())
+        monkeypatch.setattr(egrul, "_READ_CHUNK", 7)  # splits records and multi-byte letters
+        assert list(snapshot.iter_records()) == whole
+        assert len({record["inn"] for record in whole}) == len(whole) == 3
+    finally:
+        snapshot.close()
+
+
+def test_snapshot_suggestion_renders_card(snapshot_dir) -> None:
+    snapshot = egrul.EgrulSnapshot(snapshot_dir)
+    try:
+        suggestion = snapshot.suggestion("7707083893")
+    finally:
+        snapshot.close()
+    assert suggestion["source"] == egrul.SNAPSHOT_SOURCE
+    text = format_card(suggestion)
+    assert "ПАО СБЕРБАНК" in text
+    assert "16.08.2002" in text
+    assert "64.19" in text
+
+
+def test_get_snapshot_handles_missing_directory(tmp_path) -> None:
+    assert egrul.get_snapshot(str(tmp_path / "missing")) is None
+
+
+@pytest.mark.asyncio
+async def test_lookup_served_from_snapshot_without_dadata(snapshot_dir, monkeypatch: pytest.MonkeyPatch) -> None:
+    message = AsyncMock()
+    find = AsyncMock()
+    monkeypatch.setattr(bot_module.config, "DADATA_API_KEY", "key")
+    monkeypatch.setattr(bot_module.config, "EGRUL_SNAPSHOT_DIR", str(snapshot_dir))
+    monkeypatch.setattr(bot_module, "db_pool", None)
+    monkeypatch.setattr(bot_module, "find_by_id_party", find)
+
+    await bot_module._lookup_and_reply(message, "7707083893")
+
+    find.assert_not_awaited()
+    message.answer.assert_awaited_once()
+    assert "ПАО СБЕРБАНК" in message.answer.call_args.args[0]
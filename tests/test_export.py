@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app.export import export_chunks
+
+COLUMNS = ("id", "created_at", "inn", "cache_hit")
+
+
+async def _rows(count: int):
+    for number in range(count):
+        yield {
+            "id": number,
+            "created_at": datetime(2025, 1, 1, 12, number, tzinfo=timezone.utc),
+            "inn": None if number % 2 else "7707083893",
+            "cache_hit": bool(number % 2),
+        }
+
+
+@pytest.mark.asyncio
+async def test_csv_export_has_header_and_one_line_per_row() -> None:
+    chunks = [chunk async for chunk in export_chunks(_rows(3), COLUMNS, "csv")]
+
+    lines = "".join(chunks).splitlines()
+    assert lines[0] == "id,created_at,inn,cache_hit"
+    assert lines[1] == "0,2025-01-01T12:00:00+00:00,7707083893,False"
+    assert lines[2] == "1,2025-01-01T12:01:00+00:00,,True"
+    assert len(lines) == 4
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export_is_chunked() -> None:
+    chunks = [chunk async for chunk in export_chunks(_rows(5), COLUMNS, "ndjson", chunk_rows=2)]
+
+    assert [chunk.count("\n") for chunk in chunks] == [2, 2, 1]
+    records = [json.loads(line) for line in "".join(chunks).splitlines()]
+    assert records[1] == {"id": 1, "created_at": "2025-01-01T12:01:00+00:00", "inn": None, "cache_hit": True}
+
+
+@pytest.mark.asyncio
+async def test_unknown_format_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        async for _ in export_chunks(_rows(1), COLUMNS, "xlsx"):
+            pass
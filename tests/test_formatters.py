@@ -62,6 +62,15 @@ def test_format_requisites_contains_ids():
     assert "1027700132195" in text
 
 
+def test_sole_proprietor_number_is_labelled_ogrnip():
+    suggestion = copy.deepcopy(FIXTURE_SUGGESTION)
+    suggestion["data"].update(inn="500100732259", ogrn="304500116000157", kpp=None)
+
+    assert "ОГРНИП: `304500116000157`" in format_card(suggestion)
+    assert "ОГРНИП: 304500116000157" in format_requisites(suggestion)
+    assert "ОГРН: `1027700132195`" in format_card(FIXTURE_SUGGESTION)
+
+
 def test_format_contacts_contains_phone_email():
     text = format_contacts(FIXTURE_SUGGESTION)
     assert "495" in text
@@ -94,3 +103,41 @@ def test_format_penalties_contains_penalty():
     text = format_penalties(FIXTURE_SUGGESTION)
     assert "Штрафы" in text
     assert "3" in text
+
+
+def test_format_daily_report_aggregates_top_inns():
+    from datetime import date
+
+    from app.formatters import format_daily_report
+
+    rows = [
+        {"day": date(2025, 1, 2), "total": 10, "unique_users": 3, "cache_hits": 4,
+         "top_inns": '[{"inn": "7707083893", "count": 6}]'},
+        {"day": date(2025, 1, 1), "total": 0, "unique_users": 0, "cache_hits": 0, "top_inns": []},
+    ]
+    text = format_daily_report(rows)
+    assert "02.01.2025: 10 запр., 3 польз., кэш 40%" in text
+    assert "`7707083893` — 6" in text
+
+
+def test_format_batch_summary_lists_found_and_missing():
+    from app.formatters import format_batch_summary
+
+    text = format_batch_summary(
+        [
+            ("7707083893", FIXTURE_SUGGESTION, None),
+            ("7736050003", None, None),
+            ("1027700132195", None, "DaData не отвечает, попробуйте позже."),
+        ]
+    )
+    assert "1. `7707083893` — *" in text
+    assert "2. `7736050003` — не найдено" in text
+    assert "3. `1027700132195` — DaData не отвечает" in text
+
+
+def test_format_job_status_shows_progress_and_failures():
+    from app.formatters import format_job_status
+
+    job = {"id": 5, "status": "running", "total": 200, "done": 50, "failed": 2}
+
+    assert format_job_status(job) == "📦 Задание #5: выполняется, проверено 50 из 200 (25%), ошибок: 2"
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import pytest
+
+from app import dadata_client, graph
+from app.dadata_keys import KeyPool
+from app.formatters import format_affiliates
+
+
+def _party(inn: str, name: str, *, founders=(), managers=(), status: str = "ACTIVE") -> dict:
+    return {
+        "value": name,
+        "data": {
+            "inn": inn,
+            "name": {"short_with_opf": name},
+            "state": {"status": status},
+            "founders": list(founders),
+            "managers": list(managers),
+        },
+    }
+
+
+def _person(inn: str, surname: str, post: str | None = None) -> dict:
+    item = {"inn": inn, "type": "PHYSICAL", "fio": {"surname": surname, "name": "Иван"}}
+    if post:
+        item["post"] = post
+    return item
+
+
+ROOT = _party(
+    "7707083893",
+    'ООО "Корень"',
+    founders=[{"inn": "7736207543", "type": "LEGAL", "name": 'АО "Учредитель"'}, _person("500100732259", "Петров")],
+    managers=[_person("500100732259", "Петров", "ГЕНЕРАЛЬНЫЙ ДИРЕКТОР"), _person("770100000001", "Сидоров", "ДИРЕКТОР")],
+)
+FOUNDER = _party("7736207543", 'АО "Учредитель"', managers=[_person("770100000001", "Сидоров", "ДИРЕКТОР")])
+AFFILIATED = {
+    "500100732259": [ROOT, _party("7728168971", 'ООО "Сестра"', status="LIQUIDATED")],
+    "770100000001": [_party("7728168971", 'ООО "Сестра"'), _party("7702070139", 'ООО "Брат"')],
+}
+
+
+@pytest.fixture
+def dadata(monkeypatch: pytest.MonkeyPatch):
+    calls: list[tuple[str, str]] = []
+
+    async def fake_affiliated(api_key, inn, count=20):
+        calls.append(("affiliated", inn))
+        return {"suggestions": AFFILIATED.get(inn, [])}
+
+    async def fake_find_by_id(api_key, inn, count=10):
+        calls.append(("findById", inn))
+        return {"suggestions": [FOUNDER] if inn == FOUNDER["data"]["inn"] else []}
+
+    monkeypatch.setattr(graph, "find_affiliated_party", fake_affiliated)
+    monkeypatch.setattr(graph, "find_by_id_party", fake_find_by_id)
+    return calls
+
+
+def _keys(node: graph.GraphNode) -> list[str]:
+    return [child.key for child in node.children]
+
+
+@pytest.mark.asyncio
+async def test_walk_visits_every_inn_once(dadata) -> None:
+    result = await graph.explore_affiliates("key", ROOT, max_depth=2, max_nodes=50, concurrency=2, time_budget=5)
+
+    root = result.root
+    # The person listed as founder and as manager appears once; the root is not its own relative.
+    assert _keys(root) == ["7736207543", "500100732259", "770100000001"]
+    petrov = root.children[1]
+    assert _keys(petrov) == ["7728168971"]
+    assert petrov.children[0].status == "LIQUIDATED"
+    sidorov = root.children[2]
+    assert _keys(sidorov) == ["7702070139"]
+    assert result.nodes == 6
+    assert not result.truncated
+    # Each person is looked up once, and the founder company's own card is fetched to go deeper.
+    assert sorted(dadata) == [
+        ("affiliated", "500100732259"),
+        ("affiliated", "770100000001"),
+        ("findById", "7736207543"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_depth_one_does_not_expand_founder_companies(dadata) -> None:
+    await graph.explore_affiliates("key", ROOT, max_depth=1, max_nodes=50, concurrency=2, time_budget=5)
+
+    assert ("findById", "7736207543") not in dadata
+
+
+@pytest.mark.asyncio
+async def test_node_budget_truncates(dadata) -> None:
+    result = await graph.explore_affiliates("key", ROOT, max_depth=2, max_nodes=3, concurrency=2, time_budget=5)
+
+    assert result.nodes == 3
+    assert result.truncated
+
+
+@pytest.mark.asyncio
+async def test_time_budget_returns_partial_graph(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def slow_affiliated(api_key, inn, count=20):
+        await asyncio.sleep(10)
+        return {"suggestions": []}
+
+    async def fake_find_by_id(api_key, inn, count=10):
+        return {"suggestions": []}
+
+    monkeypatch.setattr(graph, "find_affiliated_party", slow_affiliated)
+    monkeypatch.setattr(graph, "find_by_id_party", fake_find_by_id)
+
+    result = await graph.explore_affiliates("key", ROOT, max_depth=2, max_nodes=50, concurrency=2, time_budget=0.05)
+
+    assert result.truncated
+    assert _keys(result.root) == ["7736207543", "500100732259", "770100000001"]
+
+
+@pytest.mark.asyncio
+async def test_failed_lookups_are_counted(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def forbidden(api_key, inn, count=20):
+        raise RuntimeError("403")
+
+    monkeypatch.setattr(graph, "find_affiliated_party", forbidden)
+
+    result = await graph.explore_affiliates("key", ROOT, max_depth=1, max_nodes=50, concurrency=2, time_budget=5)
+
+    assert result.failed == 2
+
+
+@pytest.mark.asyncio
+async def test_affiliated_403_means_feature_unavailable(monkeypatch: pytest.MonkeyPatch) -> None:
+    pool = KeyPool(["key-a-123456"], daily_quota=0, cooldown=60)
+    monkeypatch.setattr(dadata_client, "key_pool", pool)
+    monkeypatch.setattr(dadata_client.config, "DADATA_HEDGE", False)
+    dadata_client._cache.clear()
+    dadata_client.stats.reset()
+    requests: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path.rsplit("/", 2)[-2])
+        if "findAffiliated" in request.url.path:
+            return httpx.Response(403, json={"message": "Forbidden"})
+        return httpx.Response(200, json={"suggestions": [FOUNDER]})
+
+    monkeypatch.setattr(dadata_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    try:
+        result = await graph.explore_affiliates(
+            "key-a-123456", ROOT, max_depth=2, max_nodes=50, concurrency=2, time_budget=5
+        )
+    finally:
+        dadata_client._cache.clear()
+
+    assert result.affiliated_unavailable
+    assert result.failed == 0
+    assert _keys(result.root) == ["7736207543", "500100732259", "770100000001"]
+    # Only the first hop asks findAffiliated; the 403 is charged neither to the key nor to DaData.
+    assert requests.count("findAffiliated") == 2
+    assert dadata_client.stats.last_status == 200
+    assert dadata_client.stats.failures == 0
+    assert pool.available() == 1
+    assert "недоступны на текущем тарифе" in format_affiliates(result)
+    dadata_client.stats.reset()
+
+
+@pytest.mark.asyncio
+async def test_format_affiliates_renders_tree(dadata) -> None:
+    result = await graph.explore_affiliates("key", ROOT, max_depth=2, max_nodes=50, concurrency=2, time_budget=5)
+
+    text = format_affiliates(result)
+
+    assert text.startswith("🔗 *Связи*")
+    assert "├ 🏢 АО \"Учредитель\" `7736207543` — учредитель" in text
+    assert "│  └ 🏢 ООО \"Сестра\" `7728168971` — ликвидирована" in text
+    assert "└ 👤 Сидоров Иван — директор" in text
+    assert "Узлов: 6" in text
+
+
+def test_format_affiliates_drops_whole_lines_to_fit() -> None:
+    root = graph.GraphNode(key="7707083893", name='ООО "Корень"', kind="company")
+    for number in range(40):
+        person = graph.GraphNode(key=f"5001007322{number:02d}", name="Константинопольский " * 3, kind="person")
+        person.children.append(
+            graph.GraphNode(key=f"77281689{number:02d}", name='ООО "Очень длинное название"' * 2, kind="company")
+        )
+        root.children.append(person)
+    result = graph.AffiliateGraph(root, nodes=81)
+
+    text = format_affiliates(result)
+
+    assert len(text) <= 3500
+    assert text.count("`") % 2 == 0
+    assert text.endswith("_")
+    assert "показана часть связей" in text
+    assert all(line.startswith(("🔗", "├", "└", "│", " ", "_")) for line in text.splitlines())
@@ -4,7 +4,7 @@ import importlib
 
 import pytest
 from httpx import ASGITransport, AsyncClient
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from app import bot as bot_module
 from app.dadata_client import find_by_id_party
@@ -16,6 +16,9 @@ def reset_main_bot_state() -> None:
     from app import main
 
     main.bot = None
+    # Cached parties and observed DaData latency change which reply path a lookup takes.
+    bot_module._context_cache.clear()
+    bot_module.metrics.reset()
 
 
 @pytest.mark.asyncio
@@ -119,10 +122,11 @@ async def test_lifespan_strips_trailing_slash_from_webhook(monkeypatch: pytest.M
     bot_stub = AsyncMock()
     bot_stub.set_webhook = AsyncMock()
     bot_stub.session.close = AsyncMock()
+    bot_stub.session.middleware = MagicMock()
 
     monkeypatch.setattr(main.config, "TELEGRAM_BOT_TOKEN", "token")
     monkeypatch.setattr(main.config, "WEBHOOK_URL", "https://example.com/")
-    monkeypatch.setattr(main, "Bot", lambda token: bot_stub)
+    monkeypatch.setattr(main, "create_bot", lambda token: bot_stub)
     monkeypatch.setattr(main, "postgres_enabled", lambda: False)
 
     async with main.lifespan(main.app):
@@ -187,3 +191,216 @@ async def test_lookup_and_reply_uses_find_by_id(monkeypatch: pytest.MonkeyPatch)
 
     mock_find.assert_awaited_once_with("key", "7707083893", count=1)
     waiting.edit_text.assert_awaited()
+
+
+@pytest.mark.asyncio
+async def test_cmd_report_is_admin_only(monkeypatch: pytest.MonkeyPatch) -> None:
+    from types import SimpleNamespace
+
+    message = AsyncMock()
+    message.from_user = SimpleNamespace(id=1)
+    monkeypatch.setattr(bot_module.config, "ADMIN_IDS", frozenset({2}))
+    fetch = AsyncMock()
+    monkeypatch.setattr(bot_module, "fetch_daily_rollups", fetch)
+    monkeypatch.setattr(bot_module, "db_pool", object())
+
+    await bot_module.cmd_report(message, SimpleNamespace(args=None))
+
+    fetch.assert_not_awaited()
+    assert message.answer.call_args.args[0] == bot_module.WELCOME_TEXT
+
+
+@pytest.mark.asyncio
+async def test_lookup_and_reply_rejects_bad_checksum_and_offers_known_candidates(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from app.name_index import NameIndex
+
+    message = AsyncMock()
+    monkeypatch.setattr(bot_module.config, "DADATA_API_KEY", "key")
+    index = NameIndex()
+    index.add("7707083893", "ПАО Сбербанк")
+    monkeypatch.setattr(bot_module, "name_index", index)
+    mock_find = AsyncMock()
+    monkeypatch.setattr(bot_module, "find_by_id_party", mock_find)
+
+    await bot_module._lookup_and_reply(message, "7707083839")
+
+    mock_find.assert_not_awaited()
+    markup = message.answer.call_args.kwargs["reply_markup"]
+    first = markup.inline_keyboard[0][0]
+    assert first.callback_data == "check:7707083893"
+    assert first.text.startswith("✅")
+
+
+@pytest.mark.asyncio
+async def test_lookup_and_reply_checks_several_numbers_in_one_summary(monkeypatch: pytest.MonkeyPatch) -> None:
+    waiting = AsyncMock()
+    message = AsyncMock()
+    message.answer = AsyncMock(return_value=waiting)
+    monkeypatch.setattr(bot_module.config, "DADATA_API_KEY", "key")
+    monkeypatch.setattr(bot_module, "db_pool", None)
+
+    async def fake_find(api_key, query, count=1):
+        if query == "7736050003":
+            return {"suggestions": []}
+        return {"suggestions": [{"value": "ПАО Сбербанк", "data": {"inn": query}}]}
+
+    monkeypatch.setattr("app.dadata_client.find_by_id_party", fake_find)
+
+    await bot_module._lookup_and_reply(message, "7707083893\n7736050003")
+
+    message.answer.assert_awaited_once()
+    text = waiting.edit_text.call_args.args[0]
+    assert "1. `7707083893` — *ПАО Сбербанк*" in text
+    assert "2. `7736050003` — не найдено" in text
+    markup = waiting.edit_text.call_args.kwargs["reply_markup"]
+    assert [row[0].callback_data for row in markup.inline_keyboard] == ["show:7707083893"]
+
+
+@pytest.mark.asyncio
+async def test_lookup_and_reply_answers_cache_hit_with_one_message(monkeypatch: pytest.MonkeyPatch) -> None:
+    message = AsyncMock()
+    monkeypatch.setattr(bot_module.config, "DADATA_API_KEY", "key")
+    monkeypatch.setattr(bot_module, "db_pool", None)
+    mock_find = AsyncMock()
+    monkeypatch.setattr(bot_module, "find_by_id_party", mock_find)
+    bot_module._cache_set("7707083893", {"value": "ПАО Сбербанк", "data": {"inn": "7707083893"}})
+
+    await bot_module._lookup_and_reply(message, "7707083893")
+
+    mock_find.assert_not_awaited()
+    message.answer.assert_awaited_once()
+    assert "Сбербанк" in message.answer.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_lookup_and_reply_uses_chat_action_when_dadata_is_fast(monkeypatch: pytest.MonkeyPatch) -> None:
+    message = AsyncMock()
+    monkeypatch.setattr(bot_module.config, "DADATA_API_KEY", "key")
+    monkeypatch.setattr(bot_module, "db_pool", None)
+    for _ in range(10):
+        bot_module.metrics.dadata_latency.observe(0.05)
+    monkeypatch.setattr(
+        bot_module,
+        "find_by_id_party",
+        AsyncMock(return_value={"suggestions": [{"value": "ПАО Сбербанк", "data": {"inn": "7707083893"}}]}),
+    )
+
+    await bot_module._lookup_and_reply(message, "7707083893")
+
+    message.bot.send_chat_action.assert_awaited_once()
+    message.answer.assert_awaited_once()
+    assert "Сбербанк" in message.answer.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_lifespan_snapshots_cache_after_draining_updates(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    import asyncio
+
+    from app import main
+
+    bot_stub = AsyncMock()
+    bot_stub.session.close = AsyncMock()
+    bot_stub.session.middleware = MagicMock()
+    suggestion = {"value": "ПАО Сбербанк", "data": {"inn": "7707083893", "kpp": "773601001"}}
+
+    async def slow_update(bot, update):
+        await asyncio.sleep(0.05)
+        bot_module._context_cache.put_context("7707083893", suggestion)
+
+    monkeypatch.setattr(main.config, "TELEGRAM_BOT_TOKEN", "token")
+    monkeypatch.setattr(main.config, "WEBHOOK_URL", "")
+    monkeypatch.setattr(main.config, "CACHE_SNAPSHOT_PATH", str(tmp_path / "cache.snapshot"))
+    monkeypatch.setattr(main, "create_bot", lambda token: bot_stub)
+    monkeypatch.setattr(main, "postgres_enabled", lambda: False)
+    monkeypatch.setattr(main.dp, "feed_update", slow_update)
+
+    async with main.lifespan(main.app):
+        in_flight = asyncio.create_task(main.updates.process(bot_stub, MagicMock()))
+        await asyncio.sleep(0)
+    await in_flight
+
+    bot_module._context_cache.clear()
+    async with main.lifespan(main.app):
+        assert bot_module._context_cache.get_context("7707083893") == suggestion
+
+
+@pytest.mark.asyncio
+async def test_stop_runtime_stops_the_job_worker_before_the_cache_snapshot(monkeypatch: pytest.MonkeyPatch) -> None:
+    import asyncio
+
+    from app import runtime
+
+    events: list[str] = []
+
+    async def worker() -> None:
+        try:
+            await asyncio.sleep(10)
+        finally:
+            events.append("worker stopped")
+
+    monkeypatch.setattr(runtime, "_job_worker_task", asyncio.create_task(worker()))
+    monkeypatch.setattr(runtime, "save_cache_snapshot", lambda path, max_bytes: events.append("snapshot"))
+    await asyncio.sleep(0)
+
+    await runtime.stop_runtime(None)
+
+    assert events == ["worker stopped", "snapshot"]
+
+
+@pytest.mark.asyncio
+async def test_failed_document_download_is_reported(monkeypatch: pytest.MonkeyPatch) -> None:
+    from types import SimpleNamespace
+
+    message = AsyncMock()
+    message.document = SimpleNamespace(file_name="ids.txt", file_size=100)
+    message.from_user = SimpleNamespace(id=1)
+    message.bot.download = AsyncMock(side_effect=RuntimeError("Telegram is down"))
+    monkeypatch.setattr(bot_module, "check_rate_limit", AsyncMock(return_value=True))
+
+    await bot_module.process_document(message)
+
+    message.answer.assert_awaited_once()
+    assert "Не удалось скачать файл" in message.answer.await_args.args[0]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(("local", "accepted"), [(False, False), (True, True)])
+async def test_document_size_cap_follows_local_bot_api(
+    monkeypatch: pytest.MonkeyPatch, local: bool, accepted: bool
+) -> None:
+    from types import SimpleNamespace
+
+    message = AsyncMock()
+    message.document = SimpleNamespace(file_name="ids.txt", file_size=100 * 1024 * 1024)
+    message.from_user = SimpleNamespace(id=1)
+    message.bot.download = AsyncMock(side_effect=RuntimeError("Telegram is down"))
+    monkeypatch.setattr(bot_module.config, "TG_API_LOCAL", local)
+    monkeypatch.setattr(bot_module, "check_rate_limit", AsyncMock(return_value=True))
+
+    await bot_module.process_document(message)
+
+    assert (message.bot.download.await_count == 1) is accepted
+    if not accepted:
+        assert "не больше 20 МБ" in message.answer.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_background_log_writes_are_drained_on_shutdown() -> None:
+    import asyncio
+
+    written: list[str] = []
+
+    async def log_write(name: str, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+        written.append(name)
+
+    bot_module._track_background(log_write("quick", 0.01))
+    assert await bot_module.drain_background_tasks(1.0) is True
+    assert written == ["quick"]
+
+    bot_module._track_background(log_write("stuck", 10))
+    assert await bot_module.drain_background_tasks(0.01) is False
+    await asyncio.sleep(0)  # done callbacks
+    assert written == ["quick"] and not bot_module._background_tasks
@@ -0,0 +1,138 @@
+"""Tests for app.health.HealthMonitor and the /ready endpoint."""
+from __future__ import annotations
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import bot as bot_module
+from app import dadata_client
+from app.health import HealthMonitor
+from app.loop_monitor import LagProbe
+from app.updates import UpdateProcessor
+
+
+class DummyConn:
+    async def fetchval(self, query: str, timeout: float | None = None) -> int:
+        return 1
+
+
+class DummyAcquire:
+    def __init__(self, fail: bool) -> None:
+        self.fail = fail
+
+    async def __aenter__(self) -> DummyConn:
+        if self.fail:
+            raise ConnectionRefusedError
+        return DummyConn()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+class DummyPool:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+
+    def get_size(self) -> int:
+        return 5
+
+    def get_idle_size(self) -> int:
+        return 1
+
+    def get_max_size(self) -> int:
+        return 5
+
+    def acquire(self, timeout: float | None = None) -> DummyAcquire:
+        return DummyAcquire(self.fail)
+
+
+@pytest.fixture(autouse=True)
+def configured(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr("app.health.config.DADATA_API_KEY", "key")
+    monkeypatch.setattr("app.health.postgres_enabled", lambda: False)
+    monkeypatch.setattr("app.health.lag_probe", LagProbe())
+    dadata_client.stats.reset()
+    yield
+    dadata_client.stats.reset()
+
+
+def _monitor(bot_configured: bool = True) -> HealthMonitor:
+    return HealthMonitor(UpdateProcessor(object(), max_tasks=4), bot_configured=lambda: bot_configured)
+
+
+@pytest.mark.asyncio
+async def test_ready_when_all_checks_pass() -> None:
+    snapshot = await _monitor().refresh()
+    assert snapshot["ready"] is True
+    assert snapshot["checks"]["db"] == {"ok": True, "enabled": False}
+
+
+@pytest.mark.asyncio
+async def test_not_ready_without_bot() -> None:
+    snapshot = await _monitor(bot_configured=False).refresh()
+    assert snapshot["ready"] is False
+    assert snapshot["checks"]["bot"]["ok"] is False
+
+
+@pytest.mark.asyncio
+async def test_dadata_key_rejection_marks_not_ready() -> None:
+    dadata_client.stats.record_failure(403)
+    snapshot = await _monitor().refresh()
+    assert snapshot["checks"]["dadata"]["ok"] is False
+    assert snapshot["ready"] is False
+
+    dadata_client.stats.record_success()
+    snapshot = await _monitor().refresh()
+    assert snapshot["checks"]["dadata"]["ok"] is True
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stall_marks_not_ready_until_next_refresh(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import health
+
+    monkeypatch.setattr(health.config, "LOOP_LAG_UNHEALTHY", 1.0)
+    monitor = _monitor()
+    health.lag_probe.record(1.5)
+    health.lag_probe.record(0.01)
+
+    snapshot = await monitor.refresh()
+    assert snapshot["checks"]["loop"] == {"ok": False, "lag": 0.01, "max_lag": 1.5}
+    assert snapshot["ready"] is False
+
+    snapshot = await monitor.refresh()
+    assert snapshot["checks"]["loop"]["ok"] is True
+
+
+@pytest.mark.asyncio
+async def test_db_probe_reports_saturation_and_failure(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("app.health.postgres_enabled", lambda: True)
+    monkeypatch.setattr(bot_module, "db_pool", DummyPool())
+    snapshot = await _monitor().refresh()
+    assert snapshot["checks"]["db"]["ok"] is True
+    assert snapshot["checks"]["db"]["saturation"] == 0.8
+
+    monkeypatch.setattr(bot_module, "db_pool", DummyPool(fail=True))
+    snapshot = await _monitor().refresh()
+    assert snapshot["checks"]["db"]["ok"] is False
+    assert snapshot["ready"] is False
+
+
+@pytest.mark.asyncio
+async def test_ready_endpoint_serves_cached_snapshot(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import main
+
+    monitor = _monitor(bot_configured=False)
+    await monitor.refresh()
+    cached = monitor.snapshot
+
+    async def fail_refresh():
+        raise AssertionError("probe must not recompute the snapshot")
+
+    monkeypatch.setattr(monitor, "refresh", fail_refresh)
+    monkeypatch.setattr(main, "health_monitor", monitor)
+
+    async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://test") as client:
+        response = await client.get("/ready")
+
+    assert response.status_code == 503
+    assert response.json() == cached
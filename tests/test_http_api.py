@@ -98,3 +98,173 @@ async def test_health_endpoint_json_content_type(app):
     async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         response = await client.get("/health")
     assert "application/json" in response.headers.get("content-type", "")
+
+
+@pytest.mark.asyncio
+async def test_export_is_disabled_without_admin_token(app, monkeypatch):
+    from app import main
+
+    monkeypatch.setattr(main.config, "ADMIN_API_TOKEN", "")
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/admin/export", headers={"Authorization": "Bearer anything"})
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_export_rejects_wrong_token(app, monkeypatch):
+    from app import main
+
+    monkeypatch.setattr(main.config, "ADMIN_API_TOKEN", "secret")
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/admin/export", headers={"Authorization": "Bearer wrong"})
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_export_streams_filtered_history(app, monkeypatch):
+    from app import main
+
+    calls = {}
+
+    async def fake_iter_requests(pool, **filters):
+        calls.update(filters)
+        for number in range(3):
+            yield {column: None for column in main.EXPORT_COLUMNS} | {"id": number, "inn": "7707083893"}
+
+    monkeypatch.setattr(main.config, "ADMIN_API_TOKEN", "secret")
+    monkeypatch.setattr(main.bot_module, "db_pool", object())
+    monkeypatch.setattr(main, "iter_requests", fake_iter_requests)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get(
+            "/admin/export",
+            params={"format": "ndjson", "inn": "7707083893", "since": "2025-01-01"},
+            headers={"Authorization": "Bearer secret"},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert len(response.text.splitlines()) == 3
+    assert calls["inn"] == "7707083893"
+    assert calls["since"].tzinfo is not None
+
+
+@pytest.mark.asyncio
+async def test_parties_check_requires_api_token(app, monkeypatch):
+    from app import main
+
+    monkeypatch.setattr(main.config, "API_TOKENS", ("erp-token",))
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/v1/parties/check", json={"queries": ["7707083893"]})
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_parties_check_authenticates_before_reading_the_body(app, monkeypatch):
+    from app import main
+
+    monkeypatch.setattr(main.config, "API_TOKENS", ("erp-token",))
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        anonymous = await client.post("/api/v1/parties/check", content=b"{not json")
+        invalid = await client.post(
+            "/api/v1/parties/check", json={"queries": []}, headers={"Authorization": "Bearer erp-token"}
+        )
+
+    assert anonymous.status_code == 401
+    assert anonymous.json() == {"detail": "Invalid token"}
+    assert invalid.status_code == 422
+    assert invalid.json()["detail"][0]["loc"] == ["body", "queries"]
+
+
+@pytest.mark.asyncio
+async def test_parties_check_limits_batch_size(app, monkeypatch):
+    from app import main
+
+    monkeypatch.setattr(main.config, "API_TOKENS", ("erp-token",))
+    monkeypatch.setattr(main.config, "API_MAX_IDS", 2)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/parties/check",
+            json={"queries": ["7707083893", "7736207543", "1027700132195"]},
+            headers={"Authorization": "Bearer erp-token"},
+        )
+
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_parties_check_streams_ndjson_results(app, monkeypatch):
+    import json
+
+    from app import main
+
+    looked_up = []
+
+    async def fake_lookup_parties(api_key, queries, *, concurrency):
+        for query in queries:
+            looked_up.append(query)
+            if query == "7707083893":
+                yield query, {"suggestions": [{"value": "ПАО СБЕРБАНК", "data": {"inn": query}}]}
+            elif query == "7736207543":
+                yield query, {"suggestions": []}
+            else:
+                yield query, RuntimeError("DaData timeout")
+
+    monkeypatch.setattr(main.config, "API_TOKENS", ("erp-token",))
+    monkeypatch.setattr(main.config, "DADATA_API_KEY", "key")
+    monkeypatch.setattr(main, "lookup_parties", fake_lookup_parties)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/parties/check",
+            json={"queries": ["7707083893", "7707083893", "7736207543", "1027700132195", "1234567890", "7707 083 893"]},
+            headers={"Authorization": "Bearer erp-token"},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [(line["query"], line["status"]) for line in lines] == [
+        ("1234567890", "invalid"),
+        ("7707083893", "found"),
+        ("7707 083 893", "found"),
+        ("7736207543", "not_found"),
+        ("1027700132195", "error"),
+    ]
+    assert lines[1]["value"] == "ПАО СБЕРБАНК"
+    assert lines[2]["number"] == "7707083893"
+    assert looked_up == ["7707083893", "7736207543", "1027700132195"]
+
+
+@pytest.mark.asyncio
+async def test_create_job_queues_valid_numbers(app, monkeypatch):
+    from app import main
+
+    created = {}
+
+    async def fake_create_job(pool, queries, **kwargs):
+        created["queries"] = queries
+        return 12
+
+    monkeypatch.setattr(main.config, "API_TOKENS", ("erp-token",))
+    monkeypatch.setattr(main.bot_module, "db_pool", object())
+    monkeypatch.setattr(main, "create_job", fake_create_job)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/jobs",
+            json={"queries": ["7707083893", "7707-083-893", "1234567890", "1027700132195"]},
+            headers={"Authorization": "Bearer erp-token"},
+        )
+
+    assert response.status_code == 202
+    assert response.json() == {"job_id": 12, "total": 2, "invalid": ["1234567890"]}
+    assert created["queries"] == ["7707083893", "1027700132195"]
@@ -0,0 +1,63 @@
+"""Cold-import budget for `app.main`, measured in a fresh interpreter with `-X importtime`."""
+
+from __future__ import annotations
+
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Set a little above the current numbers; raise them deliberately, not to make a test pass.
+# 1121 modules are loaded today (+3%). A cold import takes 3.1-4.7 s on the dev container;
+# the time budget leaves about 20% above the slowest run, IMPORT_TIME_BUDGET relaxes it on
+# slower runners.
+MAX_MODULES = 1150
+MAX_IMPORT_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET", "5.5"))
+# Only loaded when the feature is used: Postgres driver, XML parser of the EGRUL importer.
+LAZY_MODULES = ("asyncpg", "xml.etree.ElementTree")
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)$")
+
+_PROBE = """
+import sys
+import app.main
+print(len(sys.modules))
+print(",".join(name for name in {lazy!r} if name in sys.modules))
+"""
+
+
+def _import_app_main() -> tuple[int, list[str], float, list[tuple[str, int]]]:
+    env = {key: value for key, value in os.environ.items() if not key.startswith("POSTGRES_")}
+    env["PYTHONPATH"] = str(ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(lazy=LAZY_MODULES)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+        check=True,
+    )
+    module_count, loaded = result.stdout.splitlines()[-2:]
+    total_us = 0
+    self_us = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us.append((match.group(3), int(match.group(1))))
+        if match.group(3) == "app.main":
+            total_us = int(match.group(2))
+    slowest = sorted(self_us, key=lambda item: -item[1])[:5]
+    return int(module_count), [name for name in loaded.split(",") if name], total_us / 1_000_000, slowest
+
+
+def test_app_main_cold_import_stays_within_budget() -> None:
+    module_count, loaded, seconds, slowest = _import_app_main()
+
+    assert loaded == [], f"imported eagerly: {loaded}"
+    assert module_count <= MAX_MODULES, f"app.main pulls in {module_count} modules (budget {MAX_MODULES})"
+    assert seconds <= MAX_IMPORT_SECONDS, f"import app.main took {seconds:.2f}s, slowest: {slowest}"
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from app import jobs
+from app.dadata_keys import NoAvailableKeyError
+
+
+def _item(position: int, query: str, attempts: int = 1, job_id: int = 7) -> dict:
+    return {"job_id": job_id, "position": position, "query": query, "attempts": attempts}
+
+
+@pytest.fixture
+def queue(monkeypatch: pytest.MonkeyPatch):
+    state: dict = {"claimed": [], "completed": [], "released": [], "finished": [], "looked_up": []}
+
+    async def claim(pool, limit, lease):
+        claimed, state["claimed"] = state["claimed"][:limit], state["claimed"][limit:]
+        return claimed
+
+    async def complete(pool, results):
+        state["completed"].extend(results)
+        return state["finished"]
+
+    async def release(pool, items):
+        state["released"].extend(items)
+
+    async def lookup(api_key, queries, *, concurrency):
+        for query in queries:
+            state["looked_up"].append(query)
+            yield query, state["outcomes"][query]
+
+    monkeypatch.setattr(jobs, "claim_job_items", claim)
+    monkeypatch.setattr(jobs, "complete_job_items", complete)
+    monkeypatch.setattr(jobs, "release_job_items", release)
+    monkeypatch.setattr(jobs, "lookup_parties", lookup)
+    jobs.set_job_notifier(None)
+    yield state
+    jobs.set_job_notifier(None)
+
+
+def _worker() -> jobs.JobWorker:
+    return jobs.JobWorker(object(), batch_size=10, concurrency=2, lease=60, max_attempts=3, idle_delay=0)
+
+
+@pytest.mark.asyncio
+async def test_run_once_checkpoints_every_outcome(queue) -> None:
+    suggestion = {"value": "ПАО СБЕРБАНК", "data": {"inn": "7707083893"}}
+    queue["claimed"] = [
+        _item(0, "7707083893"),
+        _item(1, "7736207543"),
+        _item(2, "1027700132195", attempts=1),
+        _item(3, "7728168971", attempts=3),
+        _item(4, "7707083893", job_id=8),
+    ]
+    queue["outcomes"] = {
+        "7707083893": {"suggestions": [suggestion]},
+        "7736207543": {"suggestions": []},
+        "1027700132195": RuntimeError("timeout"),
+        "7728168971": RuntimeError("timeout"),
+    }
+
+    assert await _worker().run_once() == (5, False)
+
+    # The same number in two jobs costs one lookup.
+    assert queue["looked_up"] == ["7707083893", "7736207543", "1027700132195", "7728168971"]
+    completed = {(job_id, position): rest for job_id, position, *rest in queue["completed"]}
+    assert completed[(7, 0)][:2] == [1, "found"]
+    assert json.loads(completed[(7, 0)][2]) == suggestion
+    assert completed[(8, 4)][1] == "found"
+    assert completed[(7, 1)] == [1, "not_found", None, None, None]
+    # Failed items are retried after a backoff until the last attempt, then recorded as errors.
+    assert completed[(7, 2)] == [1, "pending", None, "timeout", 30.0]
+    assert completed[(7, 3)] == [3, "error", None, "timeout", None]
+
+
+@pytest.mark.asyncio
+async def test_retry_backoff_doubles_with_every_attempt(queue) -> None:
+    queue["claimed"] = [_item(0, "0", attempts=1), _item(1, "1", attempts=2), _item(2, "2", attempts=9)]
+    queue["outcomes"] = {query: RuntimeError("timeout") for query in ("0", "1", "2")}
+    worker = jobs.JobWorker(
+        object(), batch_size=10, concurrency=2, lease=60, max_attempts=10, idle_delay=0, retry_delay=30
+    )
+
+    await worker.run_once()
+
+    assert [row[-1] for row in sorted(queue["completed"])] == [30.0, 60.0, jobs.MAX_RETRY_DELAY]
+
+
+@pytest.mark.asyncio
+async def test_exhausted_keys_release_items_without_spending_attempts(queue) -> None:
+    queue["claimed"] = [_item(0, "7707083893")]
+    queue["outcomes"] = {"7707083893": NoAvailableKeyError("no keys")}
+
+    assert await _worker().run_once() == (1, True)
+    assert queue["completed"] == []
+    assert queue["released"] == [(7, 0)]
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_are_announced(queue) -> None:
+    announced = []
+
+    async def notifier(job):
+        announced.append(job["id"])
+
+    jobs.set_job_notifier(notifier)
+    queue["claimed"] = [_item(0, "7707083893")]
+    queue["outcomes"] = {"7707083893": {"suggestions": []}}
+    queue["finished"] = [
+        {"id": 7, "status": "done", "total": 1, "failed": 0},
+        {"id": 9, "status": "running", "total": 5, "failed": 0},
+    ]
+
+    await _worker().run_once()
+
+    assert announced == [7]
+
+
+@pytest.mark.asyncio
+async def test_empty_queue_claims_nothing(queue) -> None:
+    assert await _worker().run_once() == (0, False)
+
+
+def test_flatten_job_item_uses_stored_suggestion() -> None:
+    record = {
+        "position": 0,
+        "query": "7707083893",
+        "status": "found",
+        "result": json.dumps({"value": "ПАО СБЕРБАНК", "data": {"inn": "7707083893", "state": {"status": "ACTIVE"}}}),
+        "error": None,
+    }
+
+    row = jobs.flatten_job_item(record)
+
+    assert row["position"] == 1
+    assert row["name"] == "ПАО СБЕРБАНК"
+    assert row["state"] == "ACTIVE"
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Chat, Message, Update, User
+
+from app import bot as bot_module
+from app import loop_monitor
+from app.loop_monitor import LagProbe, SlowHandlerMiddleware, _TimedAwait
+from app.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.mark.asyncio
+async def test_lag_probe_measures_a_blocked_loop() -> None:
+    probe = LagProbe()
+    task = asyncio.create_task(probe.run(0.01))
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)  # a synchronous stall every update would wait for
+    await asyncio.sleep(0.03)
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
+
+    # Sleeping only ever wakes up late, so lower bounds are safe on a busy machine.
+    assert probe.take_max() >= 0.08
+    assert probe.take_max() == probe.last  # the maximum was reset
+    assert metrics.loop_lag.quantile(1.0) >= 0.08
+
+
+@pytest.mark.asyncio
+async def test_timed_await_reports_the_longest_synchronous_segment(monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(loop_monitor, "time", SimpleNamespace(perf_counter=lambda: clock.now))
+
+    def work(seconds: float) -> None:
+        clock.now += seconds
+
+    async def handler() -> str:
+        work(0.01)
+        await asyncio.sleep(0)
+        work(0.05)
+        await asyncio.sleep(0.01)  # waiting is not blocking
+        work(0.02)
+        return "done"
+
+    async def failing() -> None:
+        await asyncio.sleep(0)
+        work(0.03)
+        raise ValueError("boom")
+
+    segments: list[float] = []
+
+    assert await _TimedAwait(handler(), segments.append) == "done"
+    with pytest.raises(ValueError, match="boom"):
+        await _TimedAwait(failing(), segments.append)
+
+    assert segments == [pytest.approx(0.05), pytest.approx(0.03)]
+
+
+def _message_update(text: str) -> Update:
+    return Update(
+        update_id=1,
+        message=Message(
+            message_id=1,
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=7, type="private"),
+            from_user=User(id=7, is_bot=False, first_name="Test"),
+            text=text,
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_slow_handler_is_logged_with_update_type_and_key(caplog: pytest.LogCaptureFixture) -> None:
+    router = Router()
+
+    @router.message()
+    async def render_huge_card(message: Message) -> str:
+        await asyncio.sleep(0)
+        time.sleep(0.06)
+        return "ok"
+
+    dp = Dispatcher()
+    dp.message.middleware(SlowHandlerMiddleware(threshold=0.05))
+    dp.include_router(router)
+
+    with caplog.at_level(logging.WARNING, logger="app.loop_monitor"):
+        result = await dp.feed_update(Bot("42:TEST"), _message_update("7707083893"))
+
+    assert result == "ok"
+    assert "slow handler render_huge_card" in caplog.text
+    assert "update message, key '7707083893'" in caplog.text
+    snapshot = metrics.snapshot()
+    assert snapshot["slow_handlers_15m"] == 1
+    assert snapshot["slow_handlers"] == [("render_huge_card", 1)]
+
+
+@pytest.mark.asyncio
+async def test_fast_handler_is_not_reported(caplog: pytest.LogCaptureFixture) -> None:
+    router = Router()
+
+    @router.message()
+    async def quick(message: Message) -> None:
+        await asyncio.sleep(0.01)
+
+    dp = Dispatcher()
+    dp.message.middleware(SlowHandlerMiddleware(threshold=0.5))
+    dp.include_router(router)
+
+    with caplog.at_level(logging.WARNING, logger="app.loop_monitor"):
+        await dp.feed_update(Bot("42:TEST"), _message_update("hello"))
+
+    assert "slow handler" not in caplog.text
+    assert metrics.snapshot()["slow_handlers_15m"] == 0
+
+
+@pytest.mark.asyncio
+async def test_lookup_task_of_process_query_is_timed(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    async def allow(user_id: int) -> bool:
+        return True
+
+    async def blocking_lookup(message: Message, query_text: str, user_id: int | None = None) -> None:
+        await asyncio.sleep(0)
+        time.sleep(0.2)
+
+    monkeypatch.setattr(bot_module, "check_rate_limit", allow)
+    monkeypatch.setattr(bot_module, "_lookup_and_reply", blocking_lookup)
+    router = Router()
+    router.message()(bot_module.process_query)
+    dp = Dispatcher()
+    dp.message.middleware(SlowHandlerMiddleware(threshold=0.05))
+    dp.include_router(router)
+
+    with caplog.at_level(logging.WARNING, logger="app.loop_monitor"):
+        await dp.feed_update(Bot("42:TEST"), _message_update("7707083893"))
+
+    assert "slow handler process_query" in caplog.text
+    assert metrics.snapshot()["slow_handlers"] == [("process_query", 1)]
@@ -0,0 +1,107 @@
+"""Tests for app.metrics rolling aggregates and the /stats command."""
+from __future__ import annotations
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app import bot as bot_module
+from app.formatters import format_stats
+from app.metrics import LatencySketch, Metrics, RollingCounter, TopK
+
+
+def test_rolling_counter_rates_over_windows() -> None:
+    counter = RollingCounter(window=900)
+    for second in range(1000, 1060):
+        counter.add(now=second)
+    counter.add(5, now=1059)
+
+    assert counter.count(60, now=1059) == 65
+    assert counter.count(10, now=1059) == 15
+    assert counter.rate(60, now=1059) == pytest.approx(65 / 60)
+    # Slots older than the window are ignored, not double counted.
+    assert counter.count(60, now=1059 + 900) == 0
+    assert counter.total == 65
+
+
+def test_latency_sketch_quantiles_within_bucket_error() -> None:
+    sketch = LatencySketch(minutes=15)
+    for i in range(1, 1001):
+        sketch.observe(i / 1000, now=0)
+
+    p50 = sketch.quantile(0.5, now=0)
+    p99 = sketch.quantile(0.99, now=0)
+    assert 0.5 <= p50 <= 0.55
+    assert 0.99 <= p99 <= 1.09
+    assert sketch.quantile(0.5, now=60 * 20) is None
+
+
+def test_topk_keeps_heavy_hitters() -> None:
+    top = TopK(capacity=3)
+    for key in ["a"] * 10 + ["b"] * 5 + list("cdefg"):
+        top.add(key)
+
+    assert [key for key, _ in top.top(2)] == ["a", "b"]
+
+
+def test_format_stats_renders_snapshot() -> None:
+    metrics = Metrics()
+    metrics.requests.add()
+    metrics.cache_lookup("dadata", hit=True)
+    metrics.cache_lookup("dadata", hit=False)
+    metrics.dadata_latency.observe(0.2)
+    metrics.top_inns.add("7707083893")
+
+    text = format_stats(metrics.snapshot())
+    assert "Кэш dadata: 50% (1/2)" in text
+    assert "`7707083893` — 1" in text
+
+
+@pytest.mark.asyncio
+async def test_cmd_stats_is_admin_only(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(bot_module.config, "ADMIN_IDS", frozenset({7}))
+
+    message = AsyncMock()
+    message.from_user = SimpleNamespace(id=7)
+    await bot_module.cmd_stats(message)
+    assert message.answer.call_args.args[0].startswith("📈")
+
+    message = AsyncMock()
+    message.from_user = SimpleNamespace(id=8)
+    await bot_module.cmd_stats(message)
+    assert message.answer.call_args.args[0] == bot_module.WELCOME_TEXT
+
+
+def test_telegram_calls_per_lookup_histogram() -> None:
+    metrics = Metrics()
+    for calls in (1, 1, 1, 2, 7):
+        metrics.lookup_telegram_calls(calls)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["telegram_calls"] == {1: 3, 2: 1, 5: 1}
+    assert "Вызовов Telegram на поиск: 2.00 (1: 60%, 2: 20%, 5: 20%)" in format_stats(snapshot)
+
+
+def test_format_stats_shows_loop_lag_and_slow_handlers() -> None:
+    metrics = Metrics()
+    metrics.loop_lag.observe(0.0005)
+    metrics.loop_lag.observe(0.25)
+    metrics.slow_handler("cb_sections")
+
+    text = format_stats(metrics.snapshot())
+    assert "Задержка event loop p50/p99/max: 1 мс / 252 мс / 252 мс" in text
+    assert "Медленных обработчиков за 15 мин: 1 — cb\\_sections (1)" in text
+
+
+
+def test_topk_evicts_a_minimum_count_key() -> None:
+    top = TopK(capacity=8)
+    stream = [str(i % 3) for i in range(300)] + [f"rare-{i}" for i in range(200)]
+    for key in stream:
+        top.add(key)
+        assert top._min == min(top._counts.values())
+
+    # Space-Saving keeps the total count and never loses a real heavy hitter.
+    assert sum(top._counts.values()) == len(stream)
+    assert {"0", "1", "2"} <= {key for key, _ in top.top(3)}
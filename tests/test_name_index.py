@@ -0,0 +1,64 @@
+"""Tests for app.name_index: normalization, trigram search and confident matches."""
+from __future__ import annotations
+
+from app.name_index import NameIndex, normalize_name, trigrams
+
+
+def test_normalize_name_drops_legal_form_and_punctuation():
+    assert normalize_name('ООО "Ромашка-Ёлка"') == "ромашка елка"
+    assert normalize_name("Общество с ограниченной ответственностью «Вектор»") == "вектор"
+
+
+def test_trigrams_pad_each_word():
+    assert trigrams("ab") == {"  a", " ab", "ab "}
+
+
+def test_search_ranks_closest_name_first():
+    index = NameIndex()
+    index.add("1", 'ООО "Ромашка"')
+    index.add("2", 'ООО "Ромашка Плюс"')
+    index.add("3", 'АО "Василек"')
+
+    matches = index.search("ромашка")
+    assert [match.key for match in matches] == ["1", "2"]
+    assert matches[0].score == 1.0
+
+
+def test_search_tolerates_typos():
+    index = NameIndex()
+    index.add("1", "ПАО Сбербанк")
+    assert index.search("сбербнак", min_score=0.2)[0].key == "1"
+
+
+def test_add_reindexes_renamed_company_without_duplicates():
+    index = NameIndex()
+    assert index.add("1", "Старое имя") is True
+    assert index.add("1", "Старое имя") is False
+    index.add("1", "Новое название")
+
+    assert len(index) == 1
+    assert index.search("старое имя") == []
+    assert index.search("новое название")[0].name == "Новое название"
+
+
+def test_best_match_requires_margin_over_runner_up():
+    index = NameIndex()
+    index.add("1", "Ромашка Ру")
+    index.add("2", "Ромашка Юг")
+    assert index.best_match("ромашка", min_score=0.3) is None
+
+    index.add("3", "Гранит")
+    assert index.best_match("гранит", min_score=0.75).key == "3"
+
+
+def test_add_suggestions_prefers_inn_and_short_name():
+    index = NameIndex()
+    index.add_suggestions(
+        [
+            {"value": "ПАО Сбербанк", "data": {"inn": "7707083893", "name": {"short_with_opf": "ПАО Сбербанк"}}},
+            {"value": "ИП Иванов", "data": {"ogrn": "304500116000157"}},
+            {"value": "без ключа", "data": {}},
+        ]
+    )
+    assert len(index) == 2
+    assert index.search("иванов")[0].key == "304500116000157"
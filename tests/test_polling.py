@@ -0,0 +1,102 @@
+"""Tests for app.updates.UpdateProcessor and the polling runner."""
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app import polling
+from app.updates import UpdateProcessor
+
+
+class SlowDispatcher:
+    def __init__(self, delay: float = 0.05) -> None:
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.handled: list[int] = []
+
+    async def feed_update(self, bot, update):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            self.handled.append(update.update_id)
+        finally:
+            self.active -= 1
+
+
+def _update(update_id: int) -> SimpleNamespace:
+    return SimpleNamespace(update_id=update_id)
+
+
+@pytest.mark.asyncio
+async def test_submit_respects_concurrency_limit() -> None:
+    dp = SlowDispatcher()
+    processor = UpdateProcessor(dp, max_tasks=3)
+
+    for i in range(10):
+        await processor.submit(object(), _update(i))
+    assert await processor.drain(timeout=2.0) is True
+
+    assert dp.peak == 3
+    assert sorted(dp.handled) == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_process_counts_in_flight_updates() -> None:
+    dp = SlowDispatcher()
+    processor = UpdateProcessor(dp, max_tasks=1)
+
+    first = asyncio.create_task(processor.process(object(), _update(1)))
+    second = asyncio.create_task(processor.process(object(), _update(2)))
+    await asyncio.sleep(0.01)
+    assert processor.in_flight == 1
+    assert processor.waiting == 1
+
+    await asyncio.gather(first, second)
+    assert processor.in_flight == 0
+    assert processor.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_drain_times_out_and_cancels_stuck_updates() -> None:
+    dp = SlowDispatcher(delay=10)
+    processor = UpdateProcessor(dp, max_tasks=2)
+    await processor.submit(object(), _update(1))
+    await asyncio.sleep(0)
+
+    assert await processor.drain(timeout=0.05) is False
+    await asyncio.sleep(0)
+    assert processor.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_poll_updates_advances_offset_and_stops() -> None:
+    stop = asyncio.Event()
+    batches = [[_update(5), _update(6)], [_update(7)]]
+    offsets: list[int | None] = []
+
+    async def get_updates(offset=None, **_kwargs):
+        offsets.append(offset)
+        if batches:
+            return batches.pop(0)
+        stop.set()
+        await asyncio.sleep(10)
+
+    bot = SimpleNamespace(get_updates=get_updates)
+    processor = SimpleNamespace(submit=AsyncMock())
+
+    await asyncio.wait_for(polling.poll_updates(bot, processor, stop), timeout=2)
+
+    assert offsets == [None, 7, 8]
+    assert processor.submit.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_run_polling_requires_token(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(polling.config, "TELEGRAM_BOT_TOKEN", "")
+    with pytest.raises(RuntimeError):
+        await polling.run_polling(asyncio.Event())
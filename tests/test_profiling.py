@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.profiling import UpdateProfiler, collapse_stack, format_collapsed, sample_stacks
+
+
+def _spin_in_known_function(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sample_stacks_sees_the_busy_function() -> None:
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin_in_known_function, args=(stop,))
+    worker.start()
+    try:
+        stacks, samples = sample_stacks(worker.ident, seconds=0.1, interval=0.002)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert samples > 5
+    top_stack, _ = stacks.most_common(1)[0]
+    assert top_stack.split(";")[-1].startswith("_spin_in_known_function (tests/test_profiling.py:")
+    assert format_collapsed(stacks).splitlines()[0].endswith(f" {stacks[top_stack]}")
+
+
+def test_collapse_stack_lists_callers_outermost_first() -> None:
+    def inner():
+        import sys
+
+        return collapse_stack(sys._getframe())
+
+    def outer():
+        return inner()
+
+    names = [frame.split(" (")[0] for frame in outer().split(";")]
+    assert names[-3:] == ["test_collapse_stack_lists_callers_outermost_first", "outer", "inner"]
+
+
+async def _handler() -> str:
+    await asyncio.sleep(0)
+    time.sleep(0.001)
+    return "done"
+
+
+@pytest.mark.asyncio
+async def test_update_profiler_aggregates_sampled_updates() -> None:
+    profiler = UpdateProfiler(rate=0.5, rng=iter([0.1, 0.9, 0.2]).__next__)
+
+    results = [await profiler.run(_handler) for _ in range(3)]
+
+    assert results == ["done"] * 3
+    assert profiler.profiled == 2
+    report = profiler.report("tottime", 10)
+    assert report.startswith("2 updates profiled")
+    assert "_handler" in report
+
+
+@pytest.mark.asyncio
+async def test_update_profiler_is_off_by_default() -> None:
+    profiler = UpdateProfiler()
+
+    await profiler.run(_handler)
+
+    assert profiler.profiled == 0
+    assert profiler.report() == "no updates profiled yet\n"
+
+
+@pytest.mark.asyncio
+async def test_profile_endpoint_requires_admin_token(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import main
+
+    monkeypatch.setattr(main.config, "ADMIN_API_TOKEN", "")
+    async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://test") as client:
+        response = await client.get("/admin/profile", params={"seconds": 0.01})
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_profile_endpoint_returns_collapsed_stacks(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import main
+
+    monkeypatch.setattr(main.config, "ADMIN_API_TOKEN", "secret")
+    headers = {"Authorization": "Bearer secret"}
+    async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://test") as client:
+        response = await client.get("/admin/profile", params={"seconds": 0.05, "interval": 0.001}, headers=headers)
+
+    assert response.status_code == 200
+    assert int(response.headers["x-profile-samples"]) > 0
+    stack, count = response.text.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+
+
+@pytest.mark.asyncio
+async def test_update_profile_rate_can_be_changed_at_runtime(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import main
+
+    monkeypatch.setattr(main.config, "ADMIN_API_TOKEN", "secret")
+    monkeypatch.setattr(main, "update_profiler", UpdateProfiler())
+    headers = {"Authorization": "Bearer secret"}
+    async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://test") as client:
+        configured = await client.post("/admin/profile/updates", params={"rate": 0.25}, headers=headers)
+        report = await client.get("/admin/profile/updates", headers=headers)
+        bad_sort = await client.get("/admin/profile/updates", params={"sort": "name"}, headers=headers)
+
+    assert configured.json() == {"rate": 0.25, "profiled": 0}
+    assert main.update_profiler.rate == 0.25
+    assert report.text == "no updates profiled yet\n"
+    assert bad_sort.status_code == 400
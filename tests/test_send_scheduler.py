@@ -0,0 +1,168 @@
+"""Tests for app.send_scheduler: token buckets, RetryAfter retries and edit coalescing."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, GetMe, SendMessage
+
+from app.send_scheduler import SendScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _scheduler(**overrides: float) -> SendScheduler:
+    params = {"global_rate": 1000.0, "chat_rate": 1000.0, "chat_burst": 1.0, "group_rate": 1000.0, "max_retries": 2}
+    params.update(overrides)
+    return SendScheduler(**params)
+
+
+def test_token_bucket_reserves_in_advance() -> None:
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=2.0, timer=clock)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+    clock.now += 10
+    bucket.block(3)
+    assert bucket.reserve() == pytest.approx(3.5)
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_retried_with_server_delay() -> None:
+    scheduler = _scheduler()
+    method = SendMessage(chat_id=1, text="hi")
+    calls = 0
+
+    async def make_request(bot, method):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+        return "ok"
+
+    assert await scheduler(make_request, None, method) == "ok"
+    assert calls == 2
+    assert scheduler.retries == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_after_gives_up_after_max_retries() -> None:
+    scheduler = _scheduler(max_retries=1)
+    method = SendMessage(chat_id=1, text="hi")
+
+    async def make_request(bot, method):
+        raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+
+    with pytest.raises(TelegramRetryAfter):
+        await scheduler(make_request, None, method)
+
+
+@pytest.mark.asyncio
+async def test_waiting_edits_of_one_message_are_coalesced() -> None:
+    scheduler = _scheduler(chat_rate=50.0)
+    sent: list[str] = []
+
+    async def make_request(bot, method):
+        sent.append(method.text)
+        await asyncio.sleep(0)
+        return method.text
+
+    def edit(text: str) -> EditMessageText:
+        return EditMessageText(chat_id=1, message_id=7, text=text)
+
+    first = asyncio.create_task(scheduler(make_request, None, edit("1")))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(scheduler(make_request, None, edit("2")))
+    await asyncio.sleep(0)
+    third = asyncio.create_task(scheduler(make_request, None, edit("3")))
+
+    assert await asyncio.gather(first, second, third) == ["1", "3", "3"]
+    assert sent == ["1", "3"]
+    assert scheduler.coalesced == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_first_edit_still_sends_the_coalesced_one() -> None:
+    scheduler = _scheduler(chat_rate=20.0)
+    sent: list[str] = []
+
+    async def make_request(bot, method):
+        sent.append(method.text)
+        return method.text
+
+    def edit(text: str) -> EditMessageText:
+        return EditMessageText(chat_id=1, message_id=7, text=text)
+
+    await scheduler(make_request, None, edit("0"))  # uses the chat's only token
+    first = asyncio.create_task(scheduler(make_request, None, edit("1")))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(scheduler(make_request, None, edit("2")))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "2"
+    assert first.cancelled()
+    assert sent == ["0", "2"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_returns_its_tokens() -> None:
+    clock = FakeClock()
+    scheduler = SendScheduler(
+        global_rate=1000.0, chat_rate=1.0, chat_burst=1.0, group_rate=1.0, max_retries=0, timer=clock
+    )
+
+    async def make_request(bot, method):
+        return True
+
+    await scheduler(make_request, None, SendMessage(chat_id=1, text="a"))
+    waiting = asyncio.create_task(scheduler(make_request, None, SendMessage(chat_id=1, text="b")))
+    await asyncio.sleep(0.01)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    # The next request waits for one token, not for the cancelled one's as well.
+    assert scheduler._chat_bucket(1).reserve() == pytest.approx(1.0)
+
+
+@pytest.mark.asyncio
+async def test_methods_without_chat_are_not_paced() -> None:
+    scheduler = _scheduler(global_rate=0.001)
+
+    async def make_request(bot, method):
+        return "me"
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(scheduler(make_request, None, GetMe()) for _ in range(5))), timeout=1
+    )
+    assert results == ["me"] * 5
+
+
+@pytest.mark.asyncio
+async def test_requests_are_counted_in_current_context() -> None:
+    from app.send_scheduler import telegram_calls
+
+    scheduler = _scheduler()
+
+    async def make_request(bot, method):
+        return True
+
+    token = telegram_calls.set(0)
+    try:
+        await scheduler(make_request, None, SendMessage(chat_id=1, text="a"))
+        await scheduler(make_request, None, GetMe())
+        assert telegram_calls.get() == 2
+    finally:
+        telegram_calls.reset(token)
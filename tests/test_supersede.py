@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from app import bot as bot_module
+from app import dadata_client
+from app.metrics import metrics
+
+SUGGESTION = {"value": "ПАО Сбербанк", "data": {"inn": "7707083893", "kpp": "773601001"}}
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch: pytest.MonkeyPatch):
+    dadata_client._cache.clear()
+    metrics.reset()
+    monkeypatch.setattr(dadata_client.config, "DADATA_HEDGE", False)
+    yield
+    dadata_client._cache.clear()
+    dadata_client._in_flight.clear()
+    bot_module._chat_lookups.clear()
+    metrics.reset()
+
+
+def _slow_client(monkeypatch: pytest.MonkeyPatch, release: asyncio.Event) -> list[httpx.Request]:
+    requests: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        await release.wait()
+        return httpx.Response(200, json={"suggestions": [SUGGESTION]})
+
+    monkeypatch.setattr(dadata_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return requests
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_lookups_share_one_request(monkeypatch: pytest.MonkeyPatch) -> None:
+    release = asyncio.Event()
+    requests = _slow_client(monkeypatch, release)
+
+    first = asyncio.create_task(dadata_client.find_by_id_party("key", "7707083893", count=1))
+    second = asyncio.create_task(dadata_client.find_by_id_party("key", "7707083893", count=1))
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert await first == await second == {"suggestions": [SUGGESTION]}
+    assert len(requests) == 1
+    assert metrics.dadata_coalesced == 1
+    assert not dadata_client._in_flight
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_shared_request_running(monkeypatch: pytest.MonkeyPatch) -> None:
+    release = asyncio.Event()
+    requests = _slow_client(monkeypatch, release)
+
+    first = asyncio.create_task(dadata_client.find_by_id_party("key", "7707083893", count=1))
+    second = asyncio.create_task(dadata_client.find_by_id_party("key", "7707083893", count=1))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == {"suggestions": [SUGGESTION]}
+    assert first.cancelled()
+    assert len(requests) == 1
+    assert metrics.dadata_cancelled == 0
+
+
+@pytest.mark.asyncio
+async def test_last_waiter_cancels_the_request(monkeypatch: pytest.MonkeyPatch) -> None:
+    release = asyncio.Event()
+    _slow_client(monkeypatch, release)
+
+    lookup = asyncio.create_task(dadata_client.find_by_id_party("key", "7707083893", count=1))
+    await asyncio.sleep(0.01)
+    (flight,) = dadata_client._in_flight.values()
+    lookup.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await lookup
+    await asyncio.sleep(0)
+
+    assert flight.task.cancelled()
+    assert metrics.dadata_cancelled == 1
+    assert not dadata_client._in_flight
+
+
+def _message(chat_id: int, user_id: int) -> tuple[AsyncMock, AsyncMock]:
+    waiting = AsyncMock()
+    message = AsyncMock()
+    message.chat = SimpleNamespace(id=chat_id)
+    message.from_user = SimpleNamespace(id=user_id)
+    message.answer = AsyncMock(return_value=waiting)
+    return message, waiting
+
+
+@pytest.mark.asyncio
+async def test_new_query_supersedes_the_users_running_lookup(monkeypatch: pytest.MonkeyPatch) -> None:
+    release = asyncio.Event()
+
+    async def find(api_key: str, query: str, count: int = 1) -> dict:
+        if query == "7707083893":
+            await release.wait()
+        return {"suggestions": [SUGGESTION]}
+
+    monkeypatch.setattr(bot_module.config, "DADATA_API_KEY", "key")
+    monkeypatch.setattr(bot_module, "db_pool", None)
+    monkeypatch.setattr(bot_module, "find_by_id_party", find)
+
+    old_message, old_waiting = _message(1, 10)
+    new_message, new_waiting = _message(1, 10)
+    old = asyncio.create_task(bot_module._lookup_latest(old_message, "7707083893"))
+    await asyncio.sleep(0.01)
+    await bot_module._lookup_latest(new_message, "7736050003")
+    await old
+
+    assert metrics.lookups_superseded == 1
+    old_waiting.delete.assert_awaited_once()
+    old_waiting.edit_text.assert_not_awaited()
+    new_waiting.edit_text.assert_awaited()
+    assert not bot_module._chat_lookups
+
+
+@pytest.mark.asyncio
+async def test_other_users_in_the_chat_are_not_superseded(monkeypatch: pytest.MonkeyPatch) -> None:
+    release = asyncio.Event()
+
+    async def find(api_key: str, query: str, count: int = 1) -> dict:
+        await release.wait()
+        return {"suggestions": [SUGGESTION]}
+
+    monkeypatch.setattr(bot_module.config, "DADATA_API_KEY", "key")
+    monkeypatch.setattr(bot_module, "db_pool", None)
+    monkeypatch.setattr(bot_module, "find_by_id_party", find)
+
+    first_message, first_waiting = _message(1, 10)
+    second_message, second_waiting = _message(1, 20)
+    lookups = [
+        asyncio.create_task(bot_module._lookup_latest(first_message, "7707083893")),
+        asyncio.create_task(bot_module._lookup_latest(second_message, "7707083893")),
+    ]
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.gather(*lookups)
+
+    assert metrics.lookups_superseded == 0
+    first_waiting.edit_text.assert_awaited()
+    second_waiting.edit_text.assert_awaited()
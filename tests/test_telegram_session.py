@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app import telegram_session
+from app.send_scheduler import install_send_scheduler
+
+TOKEN = "42:TEST"
+
+
+class FakeBotApi:
+    """Minimal stand-in for a local telegram-bot-api server: records calls, answers ok."""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, dict]] = []
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self.server = TestServer(app)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        payload = dict(await request.post())
+        self.calls.append((method, payload))
+        if request.match_info["token"] != TOKEN:
+            return web.json_response({"ok": False, "error_code": 401, "description": "Unauthorized"}, status=401)
+        if method.lower() == "getme":
+            result = {"id": 42, "is_bot": True, "first_name": "Test", "username": "test_bot"}
+        elif method.lower() == "sendmessage":
+            result = {
+                "message_id": len(self.calls),
+                "date": 0,
+                "chat": {"id": int(payload["chat_id"]), "type": "private"},
+                "text": payload["text"],
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    @property
+    def base_url(self) -> str:
+        return str(self.server.make_url("")).rstrip("/")
+
+
+@pytest.fixture
+async def fake_api():
+    api = FakeBotApi()
+    await api.server.start_server()
+    try:
+        yield api
+    finally:
+        await api.server.close()
+
+
+def test_default_server_is_official_api(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(telegram_session.config, "TG_API_BASE_URL", "")
+
+    server = telegram_session.api_server()
+
+    assert server.api_url(TOKEN, "getMe") == f"https://api.telegram.org/bot{TOKEN}/getMe"
+    assert not server.is_local
+
+
+@pytest.mark.asyncio
+async def test_session_uses_configured_server_and_connector(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(telegram_session.config, "TG_API_BASE_URL", "http://bot-api:8081/")
+    monkeypatch.setattr(telegram_session.config, "TG_API_LOCAL", True)
+    monkeypatch.setattr(telegram_session.config, "TG_CONNECTOR_LIMIT", 7)
+    monkeypatch.setattr(telegram_session.config, "TG_KEEPALIVE_TIMEOUT", 75.0)
+    monkeypatch.setattr(telegram_session.config, "TG_DNS_CACHE_TTL", 60)
+
+    session = telegram_session.create_session()
+
+    assert session.api.api_url(TOKEN, "getMe") == f"http://bot-api:8081/bot{TOKEN}/getMe"
+    assert session.api.is_local
+    assert (session.limit, session.keepalive_timeout, session.ttl_dns_cache) == (7, 75.0, 60)
+    try:
+        client = await session.create_session()
+        assert client.connector.limit == 7
+        assert await session.create_session() is client
+    finally:
+        await session.close()
+    assert client.closed
+
+
+@pytest.mark.asyncio
+async def test_bot_talks_to_local_server(monkeypatch: pytest.MonkeyPatch, fake_api: FakeBotApi) -> None:
+    monkeypatch.setattr(telegram_session.config, "TG_API_BASE_URL", fake_api.base_url)
+    bot = telegram_session.create_bot(TOKEN)
+    install_send_scheduler(bot)
+    try:
+        me = await bot.get_me()
+        timings = []
+        for number in range(5):
+            started = time.perf_counter()
+            message = await bot.send_message(chat_id=100 + number, text=f"ping {number}")
+            timings.append(time.perf_counter() - started)
+    finally:
+        await bot.session.close()
+
+    assert me.username == "test_bot"
+    assert message.text == "ping 4"
+    assert [method for method, _ in fake_api.calls] == ["getMe"] + ["sendMessage"] * 5
+    # Loopback round-trips over a kept-alive connection; a generous bound keeps CI stable.
+    assert max(timings) < 1.0
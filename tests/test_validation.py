@@ -1,4 +1,4 @@
-from app.dadata_client import normalize_query_input, validate_inn, validate_ogrn
+from app.dadata_client import normalize_query_input, typo_candidates, validate_inn, validate_ogrn
 
 
 def test_valid_inn_10():
@@ -41,3 +41,22 @@ def test_normalize_name():
     query, kind = normalize_query_input('ООО "Ромашка"')
     assert query == 'ООО "Ромашка"'
     assert kind == "name"
+
+
+def test_checksum_rejects_single_digit_typos():
+    assert validate_inn("7707083894") is False
+    assert validate_inn("784806113664") is False
+    assert validate_ogrn("1027700132196") is False
+    assert validate_ogrn("304500116000158") is False
+
+
+def test_normalize_marks_bad_checksum_as_invalid():
+    assert normalize_query_input("ИНН 7707083894") == ("7707083894", "invalid")
+    assert normalize_query_input("123") == ("123", "name")
+
+
+def test_typo_candidates_are_valid_and_include_swap():
+    candidates = list(typo_candidates("7707083839"))
+    assert "7707083893" in candidates
+    assert all(validate_inn(candidate) for candidate in candidates)
+    assert len(candidates) == len(set(candidates))